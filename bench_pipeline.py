@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Benchmarks of the PDF build pipeline stages: game states exploration, views reduction,
+# page IDs assignment, pages rendering & bitfont rendering.
+# Every benchmark measures a time per item (explored view, rendered page...),
+# that is compared to a JSON baseline previously saved with --save-baseline:
+# this script exits with an error code if any stage got slower than the baseline by more than --threshold.
+# Baselines are only comparable when produced on the same machine, with the same --checkpoints.
+
+import argparse, json, logging, os, sys
+from argparse import Namespace
+from contextlib import redirect_stdout
+from random import Random
+from time import perf_counter
+
+from gen_pdf import new_pdf
+from pdf_game.bitfont import bitfont_render
+from pdf_game.entities import GameMilestone, GameMode, GameView
+from pdf_game.logs import quiet_logging
+from pdf_game.perfs import perf_stats
+from pdf_game.reducer import reduce_views
+from pdf_game.render import render_page
+from pdf_game.render_utils import LinksRecorder
+from pdf_game.visit import build_initial_state, visit_game_views
+
+from pdf_game.mod import campaign
+
+
+BASELINE_VERSION = 1  # to increment when benchmarks change in a way that makes previous baselines irrelevant
+FACINGS = ('north', 'south', 'east', 'west')
+LONG_TEXT = '\n'.join(['The whispering wind advises you to look behind the ivy before returning'] * 10)
+
+
+def main():
+    args = parse_args()
+    logging.getLogger('PIL').setLevel(logging.INFO)
+    quiet_logging()
+    campaign.script_it()
+    results = run_benchmarks(args)
+    print(f'{"Benchmark":<20} | {"#items":>8} | {"Time/item (µs)":>14} | Baseline (µs) | Change')
+    print('---------------------|----------|----------------|---------------|--------')
+    baseline = load_baseline(args)
+    regressions = []
+    for name, result in results.items():
+        time_per_item = result['seconds'] / result['items']
+        line = f'{name:<20} | {result["items"]:>8} | {time_per_item * 1e6:>14.2f}'
+        if baseline and name in baseline['results']:
+            baseline_time_per_item = baseline['results'][name]['seconds'] / baseline['results'][name]['items']
+            change = time_per_item / baseline_time_per_item - 1
+            line += f' | {baseline_time_per_item * 1e6:>13.2f} | {change:+.1%}'
+            if change > args.threshold:
+                regressions.append(name)
+        print(line)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf8') as baseline_file:
+            json.dump({'version': BASELINE_VERSION, 'checkpoints': args.checkpoints, 'results': results}, baseline_file, indent=2)
+        print(f'Baseline saved in {args.baseline}')
+    if regressions:
+        print(f'Slower than the baseline by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--checkpoints", default="1-2", help="Range of checkpoints explored, with the same format as gen_pdf.py --inbetween-checkpoints")
+    parser.add_argument("--views-per-mode", type=int, default=50, help="Number of views rendered per game mode")
+    parser.add_argument("--synthetic-views", type=int, default=20000, help="Number of views in the synthetic graph reduced")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions of every benchmark, except exploration: the fastest one is kept")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="JSON file storing the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results of this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=.2, help="Maximum slowdown ratio tolerated, compared to the baseline")
+    return parser.parse_args()
+
+
+def load_baseline(args):
+    if not os.path.exists(args.baseline):
+        return None
+    with open(args.baseline, encoding='utf8') as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['version'] != BASELINE_VERSION or baseline['checkpoints'] != args.checkpoints:
+        print(f'Ignoring {args.baseline}: it was produced by different benchmarks')
+        return None
+    return baseline
+
+
+def run_benchmarks(args):
+    'Return {benchmark name: {"seconds": ..., "items": ...}}'
+    results = {}
+    # Exploration mutates the campaign checkpoints, hence it is only performed once:
+    visit_args = Namespace(only_print_map=None, inbetween_checkpoints=args.checkpoints, no_script=False, no_cache=True, jobs=1,
+                           detect_deadends=False, no_reducer=True, print_reduced_views=False, seed=0)
+    with open(os.devnull, 'w', encoding='utf8') as devnull, redirect_stdout(devnull):
+        _, game_views = visit_game_views(visit_args)
+    stats = perf_stats()
+    results['explore'] = {'seconds': stats['explore']['total_ms'] / 1000, 'items': len(game_views)}
+    results['assign'] = {'seconds': stats['assign']['total_ms'] / 1000, 'items': len(game_views)}
+    results['reduce'] = _best_of(args.repeat, lambda: _synthetic_views(args.synthetic_views),
+                                 lambda views: _silently(reduce_views, views), args.synthetic_views)
+    pdf_args = Namespace(no_marked_content=False)
+    for mode in (GameMode.EXPLORE, GameMode.COMBAT, GameMode.DIALOG):
+        views = [game_view for game_view in game_views
+                 if not game_view.renderer and game_view.state.mode == mode and game_view.state.milestone != GameMilestone.VICTORY]
+        views = views[:args.views_per_mode]
+        if views:
+            results[f'render_{mode.name.lower()}'] = _best_of(args.repeat, lambda: LinksRecorder(new_pdf(pdf_args)),
+                                                              lambda pdf, views=views: [render_page(pdf, view, None) for view in views], len(views))
+    results['bitfont'] = _best_of(args.repeat, lambda: _new_page(new_pdf(pdf_args)),
+                                  lambda pdf: [bitfont_render(pdf, LONG_TEXT, 2, 2) for _ in range(100)], 100)
+    return results
+
+
+def _best_of(repeat, setup, func, items):
+    'setup() is not timed, and its result is passed to func'
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        start = perf_counter()
+        func(arg)
+        duration = perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return {'seconds': best, 'items': items}
+
+
+def _synthetic_views(count, seed=0):
+    '''
+    Random graph of explore views at the start position, that only differ by their facing, their links,
+    and by state fields that are not rendered: the reducer has many views to merge.
+    '''
+    rand = Random(seed)
+    state = build_initial_state()._replace(mode=GameMode.EXPLORE)
+    views = [GameView(state._replace(facing=rand.choice(FACINGS), gold=rand.randrange(3),
+                                     hidden_triggers=('X',) if rand.random() < .5 else ()))
+             for _ in range(count)]
+    for view in views:
+        for action_name in ('MOVE-FORWARD', 'TURN-LEFT', 'TURN-RIGHT'):
+            view.actions[action_name] = rand.choice(views)
+    return views
+
+
+def _new_page(pdf):
+    pdf.add_page()
+    return pdf
+
+
+def _silently(func, *args):
+    with open(os.devnull, 'w', encoding='utf8') as devnull, redirect_stdout(devnull):
+        return func(*args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# Micro-benchmark of GameState dict lookups, as performed by visit._GameView,
+# comparing plain NamedTuples hashing with the memoized hashes of entities._HashMemoized
+
+import sys
+from timeit import timeit
+
+# pylint: disable=protected-access
+from pdf_game.entities import CombatRound, CombatState, Enemy, GameState, _CombatStateFields, _EnemyFields, _GameStateFields
+
+
+def build_states(state_cls, combat_cls, enemy_cls, count):
+    rounds = tuple(CombatRound(attack_name=f'ATTACK_{i}', atk=i) for i in range(8))
+    enemy = enemy_cls(name='Death Speaker', category=1, hp=84, max_hp=84, rounds=rounds, intro_msg='...')
+    state = state_cls(map_id=1, x=2, y=3, facing='north', items=('BOOK', 'SCROLL'),
+                      tile_overrides=tuple(((1, x, 4), 26) for x in range(10)))
+    return [state._replace(hp=i % 100, gold=i // 100, combat=combat_cls(enemy=enemy, round=i % 5)) for i in range(count)]
+
+
+def lookups_per_second(states, lookups=200000):
+    game_view_per_state = dict.fromkeys(states)
+    probes = [state._replace(mp=0) for state in states]  # equal, but distinct objects, as new states are
+    duration = timeit(lambda: [state in game_view_per_state for state in probes], number=lookups // len(probes))
+    return lookups // len(probes) * len(probes) / duration
+
+
+def main(count=10000):
+    before = lookups_per_second(build_states(_GameStateFields, _CombatStateFields, _EnemyFields, count))
+    after = lookups_per_second(build_states(GameState, CombatState, Enemy, count))
+    print(f'Plain NamedTuples: {before:>12,.0f} lookups/s')
+    print(f'Memoized hashes:   {after:>12,.0f} lookups/s (x{after / before:.1f})')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -6,12 +6,18 @@ from contextlib import contextmanager
 import fpdf
 
 from pdf_game.visit import visit_game_views
+from pdf_game.content_stream import compact_pages
+from pdf_game.form_xobjects import enable_form_xobjects
+from pdf_game.incremental_pdf import load_manifest, page_digest, render_digest, save_manifest, IncrementalPdfWriter
 from pdf_game.js import config
-from pdf_game.logs import quiet_logging
+from pdf_game.logs import enable_log_file, quiet_logging
 from pdf_game.mapscript import mapscript_remove_all
+from pdf_game.memory_report import enable_memory_report, memory_checkpoint, with_memory_checkpoints
 from pdf_game.optional_deps import tqdm
-from pdf_game.perfs import print_perf_stats, trace_time, PerfsMonitorWrapper
-from pdf_game.render import render_page
+from pdf_game.parallel_render import render_pages_in_parallel
+from pdf_game.perfs import export_perf_stats, print_perf_stats, trace_time, PerfsMonitorWrapper
+from pdf_game.render import enable_composite_maze_views, render_page
+from pdf_game.streaming_pdf import StreamingPdfWriter
 
 from pdf_game.mod import campaign
 from pdf_game.mod.metadata import METADATA, XMP_METADATA
@@ -19,6 +25,9 @@ from pdf_game.mod.pages import render_credit_pages, render_intro_pages, render_v
 # Note that there are other changes made from the "mod" package that are applied through patch* functions
 
 
+OUTPUT_FILEPATH = 'undying-dusk.pdf'
+
+
 def main():
     warnings.simplefilter('default', DeprecationWarning)
     args = parse_args()
@@ -29,36 +38,78 @@ def main():
     logging.basicConfig(format="%(asctime)s %(filename)s [%(levelname)s] %(message)s",
                         datefmt="%H:%M:%S", level=logging.DEBUG)  # displays fpdf internal logs
     logging.getLogger('PIL').setLevel(logging.INFO)
-    if not args.iter_logs:
+    if args.logs_file:
+        enable_log_file(args.logs_file, json_lines=args.json_logs)
+    elif not args.iter_logs:
         quiet_logging()
+    if args.memory_report:
+        enable_memory_report(args.memory_report, trace_allocations=args.tracemalloc)
     if args.no_script:
         mapscript_remove_all()
     else:
         campaign.script_it()
-    with trace_time() as trace:
+    with trace_time('visit') as trace:
         start_view, game_views = visit_game_views(args)
     print(f'States exploration took: {trace.time:.2f}s')
     if args.json:
-        with trace_time() as trace, open('game_states.json', 'w', encoding='utf8') as json_file:
+        with trace_time('json_export') as trace, open('game_states.json', 'w', encoding='utf8') as json_file:
             json.dump({gv.page_id: gv.as_dict() for gv in game_views},
                       json_file, indent=4, sort_keys=True)
         print(f'JSON export took: {trace.time:.2f}s')
     if args.no_pdf:
         return
     print('Starting PDF pages rendering')
-    pdf, links_to_credits = init_pdf(args, start_view.page_id)
-    with trace_time() as trace:
-        for game_view in tqdm(game_views, disable='NO_TQDM' in os.environ):
-            render_page(pdf, game_view, lambda pdf, gs: render_victory(pdf, gs, links_to_credits))
+    if args.composite_maze_views:
+        enable_composite_maze_views()
+    if args.streaming_output:
+        enable_form_xobjects()
+    manifest = digest = page_digests = None
+    if args.incremental:
+        with trace_time('digests') as trace:
+            digest = render_digest(args, len(game_views), start_view.page_id)
+            page_digests = {str(gv.page_id): page_digest(gv) for gv in tqdm(game_views, disable='NO_TQDM' in os.environ)}
+        print(f'Pages digests computation took: {trace.time:.2f}s')
+        manifest = load_manifest(OUTPUT_FILEPATH, digest)
+    pdf, links_to_credits = init_pdf(args, start_view.page_id, manifest)
+    def render_view(pdf, game_view):
+        render_page(pdf, game_view, lambda pdf, gs: render_victory(pdf, gs, links_to_credits))
+    with trace_time('render') as trace:
+        if manifest:
+            changed_page_ids = {page_id for page_id, digest in page_digests.items()
+                                if not digest or digest != manifest['page_digests'].get(page_id)}
+            print(f'{len(changed_page_ids)} pages changed since the last build')
+            for game_view in with_memory_checkpoints(game_views, len(game_views), 'render', pdf):
+                if str(game_view.page_id) in changed_page_ids:
+                    render_view(pdf, game_view)
+                else:
+                    pdf.skip_page()
+        elif args.jobs > 1:
+            rendered_pages = render_pages_in_parallel(pdf, game_views, lambda: new_pdf(args), render_view, args.jobs)
+            for _ in tqdm(with_memory_checkpoints(rendered_pages, len(game_views), 'render', pdf),
+                          total=len(game_views), disable='NO_TQDM' in os.environ):
+                pass
+        else:
+            for game_view in tqdm(with_memory_checkpoints(game_views, len(game_views), 'render', pdf),
+                                  total=len(game_views), disable='NO_TQDM' in os.environ):
+                render_view(pdf, game_view)
     render_credit_pages(pdf, links_to_credits)
-    print(f'Rendering of {len(pdf.pages)} pages took: {trace.time:.2f}s')
+    print(f'Rendering of {pdf.page} pages took: {trace.time:.2f}s')
+    memory_checkpoint('render', pdf)
     assert not pdf._drawing_graphics_state_registry, "No /ExtGState are needed in Undying Dusk"  # pylint: disable=protected-access
-    with trace_time() as trace:
-        pdf.pdf_version = "1.3"  # Optimization: avoids 55bytes/page due to the transparency group
-        pdf.output('undying-dusk.pdf', 'F')
+    with trace_time('output') as trace:
+        if args.streaming_output:
+            pdf.close()
+            if args.incremental:
+                save_manifest(OUTPUT_FILEPATH, digest, page_digests, pdf)
+        else:
+            pdf.pdf_version = "1.3"  # Optimization: avoids 55bytes/page due to the transparency group
+            compact_pages(pdf)
+            pdf.output(OUTPUT_FILEPATH, 'F')
     print(f'Output generation took: {trace.time:.2f}s')
+    memory_checkpoint('output', pdf)
     print_perf_stats()
     pdf.print_perf_stats()
+    export_perf_stats(args.perfs_summary, args.chrome_trace)
 
 
 def parse_args():
@@ -66,18 +117,56 @@ def parse_args():
     parser.add_argument("--only-print-map", type=int, metavar="MAP_ID", help="Print a given map as ASCII and exit")
     parser.add_argument("--list-checkpoints", action="store_true", help="List checkpoints and exit")
     parser.add_argument("--inbetween-checkpoints", type=str, help="Only render the game inbetween the specified range of checkpoints. Example of valid values: 1-2 or 17-")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used to explore game states, speculatively starting from the checkpoints states found during the previous run, and to render pages")
+    parser.add_argument("--no-cache", action="store_true", help="Always explore game states, instead of loading them from a previous run cache")
     parser.add_argument("--json", action="store_true", help="Dump all generated game states in a JSON file")
     parser.add_argument("--iter-logs", action="store_true", help=" ")
+    parser.add_argument("--logs-file", metavar="FILEPATH", help="Write the exploration logs in this file, instead of the standard output. Implies --iter-logs")
+    parser.add_argument("--json-logs", action="store_true", help="Write the --logs-file as JSON lines, including the map, coordinates, mode & last checkpoint of every logged state")
     parser.add_argument("--no-script", action="store_true", help=" ")
+    parser.add_argument("--streaming-output", action="store_true", help="Write every page to disk as soon as it has been rendered, to keep memory usage bounded, and define the UI elements repeated on many pages only once, as Form XObjects")
+    parser.add_argument("--incremental", action="store_true", help="Only render the pages that changed since the previous --incremental build, and append them to the existing PDF as an incremental update. Implies --streaming-output")
+    parser.add_argument("--object-streams", action="store_true", help="Produce a PDF 1.5, with pages dictionaries packed in compressed object streams, and a cross-reference stream. Implies --streaming-output")
     parser.add_argument("--no-marked-content", action="store_true", help="Reduce PDF size by omiting links alternate descriptions")
+    parser.add_argument("--composite-maze-views", action="store_true", help="Render each distinct 3D maze view as a single pre-composited image, cached in .cache/maze_views/")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the pseudo-random pages order: identical inputs & seed always produce identical page IDs")
+    parser.add_argument("--perfs-sampling", type=int, default=1, metavar="N", help="Only time 1 in N calls made to the FPDF instance, to reduce the monitoring overhead")
+    parser.add_argument("--perfs-summary", metavar="JSON_FILEPATH", help="Export the count, total, p50, p99 & max durations of every profiled span, to compare build times between commits")
+    parser.add_argument("--chrome-trace", metavar="JSON_FILEPATH", help="Export the profiled spans as a Chrome trace, that can be loaded in chrome://tracing or https://ui.perfetto.dev")
+    parser.add_argument("--memory-report", metavar="JSON_FILEPATH", help="Record the RSS, and the counts of GameViews, GameStates, CombatStates & FPDF buffered pages, after every build stage and during rendering")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also record the memory traced by tracemalloc in the --memory-report, at the cost of a slower build")
     parser.add_argument("--no-reducer", action="store_true", help=" ")
     parser.add_argument("--no-pdf", action="store_true", help=" ")
     parser.add_argument("--detect-deadends", action="store_true", help="Sanity check")
     parser.add_argument("--print-reduced-views", action="store_true", help=" ")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.perfs_sampling < 1:
+        parser.error('--perfs-sampling must be at least 1')
+    if args.incremental or args.object_streams:
+        args.streaming_output = True
+    return args
 
 
-def init_pdf(args, start_page_id):
+def init_pdf(args, start_page_id, manifest=None):
+    pdf = new_pdf(args)
+    if manifest:
+        pdf = IncrementalPdfWriter(pdf, OUTPUT_FILEPATH, manifest, link_alt_texts=not args.no_marked_content, object_streams=args.object_streams)
+    elif args.streaming_output:
+        pdf = StreamingPdfWriter(pdf, OUTPUT_FILEPATH, link_alt_texts=not args.no_marked_content, object_streams=args.object_streams)
+    pdf.set_title(METADATA['dc:title'])
+    pdf.set_subject(METADATA['dc:description'])
+    pdf.set_author(METADATA['dc:creator'])
+    pdf.set_keywords(METADATA['pdf:Keywords'])
+    pdf.set_creator(METADATA['xmp:CreatorTool'])
+    pdf.set_producer(METADATA['pdf:Producer'])
+    pdf.set_xmp_metadata(XMP_METADATA)
+    pdf = PerfsMonitorWrapper(pdf, sample_every=args.perfs_sampling)
+    links_to_credits = render_intro_pages(pdf, start_page_id)
+    return pdf, links_to_credits
+
+
+def new_pdf(args):
+    'Also used by parallel rendering worker processes, that must render pages exactly like the main process'
     if args.no_marked_content:  # currently adds ~66MB
         class PdfClass(fpdf.FPDF):
             @contextmanager
@@ -91,16 +180,7 @@ def init_pdf(args, start_page_id):
     pdf = PdfClass(format=dimensions, unit='pt')
     pdf.alias_nb_pages(None)  # disabling this feature for performance reasons
     pdf.set_auto_page_break(False)
-    pdf.set_title(METADATA['dc:title'])
-    pdf.set_subject(METADATA['dc:description'])
-    pdf.set_author(METADATA['dc:creator'])
-    pdf.set_keywords(METADATA['pdf:Keywords'])
-    pdf.set_creator(METADATA['xmp:CreatorTool'])
-    pdf.set_producer(METADATA['pdf:Producer'])
-    pdf.set_xmp_metadata(XMP_METADATA)
-    pdf = PerfsMonitorWrapper(pdf)
-    links_to_credits = render_intro_pages(pdf, start_page_id)
-    return pdf, links_to_credits
+    return pdf
 
 
 if __name__ == '__main__':
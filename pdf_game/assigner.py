@@ -2,7 +2,7 @@
 This module role is to assign page IDs to GameViews,
 including reversed & fixed page IDs, and to insert easter-egg pages.
 '''
-from random import shuffle
+from random import Random
 
 from .entities import GameMode, GameView
 from .optional_deps import ansi_wrap
@@ -16,109 +16,120 @@ START_PAGE_ID = 8  # skipping title & 6 pages of disclaimer/tutorial
 MAX_FILLER_PAGE = 5
 
 
-def assign_page_ids(game_views, assign_special_pages=True):
+def assign_page_ids(game_views, assign_special_pages=True, seed=0):
+    '''
+    Assign page IDs in a single pass over a seeded permutation of game_views:
+    identical inputs always get identical page IDs.
+    '''
     is_first_assignment = not any(gv.page_id for gv in game_views)
     gv_per_fixed_id = {gv.state.fixed_id: gv for gv in game_views if gv.state and gv.state.fixed_id}
     if any(fixed_id > len(game_views) for fixed_id in gv_per_fixed_id.keys()):
         print(ansi_wrap(f'Not enough GameViews ({len(game_views)}) to assign some of them with fixed IDs: {list(gv_per_fixed_id.keys())}', color='red'))
-    attempt = 0
-    while True:
-        attempt += 1
-        if assign_special_pages:
-            print(f'Attempt at assigning reversed page ID: {attempt}')
-        shuffle(game_views)  # needed to render pages in a random order
-        assigner = Assigner(assign_special_pages, gv_per_fixed_id)
-        if assigner.attempt(game_views):
-            # reverse ID assignation is valid ! => exiting "while" loop
-            if is_first_assignment:
-                check_all_reachable_views_have_a_page_id(assigner.out_game_views)
-            if assign_special_pages and assigner.reversed_id_gv:  # Double-check reverse-ID assignement is OK:
-                page_id1 = assigner.reversed_id_gv.src_view.page_id
-                page_id2 = assigner.reversed_id_gv.page_id
-                assert _reverse_number(page_id2) in range(page_id1 - MAX_FILLER_PAGE, page_id1 + MAX_FILLER_PAGE), f'Wrong reverse IDs: {page_id1} / {page_id2}'
-            return assigner.out_game_views
+    rand = Random(seed)
+    rand.shuffle(game_views)  # needed to render pages in a random order
+    assigner = Assigner(assign_special_pages, gv_per_fixed_id)
+    assigner.assign(game_views, rand)
+    if is_first_assignment:
+        check_all_reachable_views_have_a_page_id(assigner.out_game_views)
+    if assign_special_pages and assigner.reversed_id_gv:  # Double-check reverse-ID assignement is OK:
+        page_id1 = assigner.reversed_id_gv.src_view.page_id
+        page_id2 = assigner.reversed_id_gv.page_id
+        assert _reverse_number(page_id2) in range(page_id1 - MAX_FILLER_PAGE, page_id1 + MAX_FILLER_PAGE), f'Wrong reverse IDs: {page_id1} / {page_id2}'
+    return assigner.out_game_views
+
 
 class Assigner:
     def __init__(self, assign_special_pages, gv_per_fixed_id):
         self.assign_special_pages = assign_special_pages
         self.gv_per_fixed_id = dict(gv_per_fixed_id)  # copy so that we can safely reassign values to None
         self.next_page_id, self.out_game_views, self.reversed_id_gv = START_PAGE_ID, [], None
-
-    def attempt(self, game_views):
-        for gv in game_views:
-            if gv.state and gv.state.reverse_id:
-                assert not self.reversed_id_gv, f'Current algorithm cannot handle several GameView asking for a .reverse_id:\n{self.reversed_id_gv}\n{gv}'
-                self.reversed_id_gv = gv
-                # We need to reset the page ID of the "mirror" GameViews,
-                # as some page IDs may have been assign in a previous attempt:
-                self.reversed_id_gv.set_page_id(None)
-                self.reversed_id_gv.src_view.set_page_id(None)
-                break
-        try:
-            for game_view in game_views:
-                if game_view.state and game_view.state.fixed_id:
-                    continue
-
-                # Dead-end useful sanity check:
-                if game_view.state:
-                    action_names = list(game_view.actions.keys())
-                    dead_end_ok = game_view.state.last_checkpoint == len(CHECKPOINTS)
-                    assert_error_msg = f'Non game-ending dead-end reached: {action_names} - {game_view}'
-                    if game_view.state.mode == GameMode.INFO:
-                        assert 'SHOW-INFO' in action_names or dead_end_ok, assert_error_msg
-                    else:
-                        assert action_names not in ([], ['SHOW-INFO']) or dead_end_ok or game_view.state.milestone >= 2, assert_error_msg
-
-                if game_view.prev_page_trick_game_view:
-                    trick = game_view.prev_page_trick_game_view.state.trick
-                    assert trick
-                    trick_game_view = GameView(renderer=_render_trick(game_view.prev_page_trick_game_view))
-                    trick_game_view.set_page_id(self.next_page_id)
-                    self.out_game_views.append(trick_game_view)
-                    self._increment_next_page_id()
-                    assert trick.filler_pages < MAX_FILLER_PAGE
-                    for _ in range(trick.filler_pages):
-                        filler_game_view = GameView(renderer=_render_filler_page(trick, i))
-                        filler_game_view.set_page_id(self.next_page_id)
-                        self.out_game_views.append(filler_game_view)
-                        self._increment_next_page_id()
-                if game_view.state and game_view.state.reverse_id and self.assign_special_pages:
-                    src_page_id = game_view.src_view.page_id
-                    if not src_page_id or src_page_id >= self.next_page_id or src_page_id < 100:
-                        print(f'Reverse ID assignation ABORT - src_page_id={src_page_id} (next_page_id={self.next_page_id})')
-                        raise StopIteration  # attempting another reverse ID assignation
-                    if game_view.src_view.next_page_trick_game_view:
-                        src_page_id += 1 + game_view.src_view.next_page_trick_game_view.state.trick.filler_pages
-                    reversed_id = _reverse_number(src_page_id)
-                    if reversed_id == src_page_id or reversed_id >= len(game_views) or src_page_id % 10 == 0 or reversed_id < self.next_page_id:
-                        print(f'Reverse ID assignation ABORT - reversed_id={reversed_id} (next_page_id={self.next_page_id})')
-                        raise StopIteration  # attempting another reverse ID assignation
-                    print(f'ID reversal: {src_page_id} -> {reversed_id} (next_page_id={self.next_page_id})')
-                    assert game_view.set_page_id(reversed_id)
-                else:
-                    if game_view.set_page_id(self.next_page_id):
-                        self.out_game_views.append(game_view)
-                        self._increment_next_page_id()
-                    else:  # can happen with the reducer, when trying to assign a page ID,
-                           # to a view that already takes its ID from another one
-                        assert not self.reversed_id_gv, game_view
-                        self.out_game_views.append(game_view)
-                if game_view.next_page_trick_game_view:
-                    trick = game_view.next_page_trick_game_view.state.trick
-                    assert trick
-                    assert trick.filler_pages < MAX_FILLER_PAGE
-                    for i in range(trick.filler_pages):
-                        filler_game_view = GameView(renderer=_render_filler_page(trick, i))
-                        filler_game_view.set_page_id(self.next_page_id)
-                        self.out_game_views.append(filler_game_view)
-                        self._increment_next_page_id()
-                    trick_game_view = GameView(renderer=_render_trick(game_view.next_page_trick_game_view))
-                    trick_game_view.set_page_id(self.next_page_id)
-                    self.out_game_views.append(trick_game_view)
-                    self._increment_next_page_id()
-        except StopIteration:
-            return False
-        return True
+        self.pages_count = 0
+
+    def assign(self, game_views, rand):
+        '''
+        The GameView asking for a .reverse_id is not assigned in order:
+        a valid page ID is picked upfront for its source view, that is assigned as soon as this ID is reached,
+        and the reversed page ID is then reserved.
+        '''
+        self.pages_count = len(game_views)
+        reversed_id_gvs = [gv for gv in game_views if gv.state and gv.state.reverse_id] if self.assign_special_pages else []
+        assert len(reversed_id_gvs) <= 1, f'Current algorithm cannot handle several GameView asking for a .reverse_id:\n{reversed_id_gvs}'
+        pending_src_view, min_src_page_id = None, None
+        if reversed_id_gvs:
+            reversed_id_gv = reversed_id_gvs[0]
+            pending_src_view = reversed_id_gv.src_view
+            assert not pending_src_view.prev_page_trick_game_view, pending_src_view
+            game_views = [gv for gv in game_views if gv is not reversed_id_gv and gv is not pending_src_view]
+            assert len(game_views) == self.pages_count - 2, f'The source view of the reversed ID view is missing: {pending_src_view}'
+            # Only considering the 1st half of page IDs leaves room to find a valid one if a page ID is skipped:
+            src_page_ids = [page_id for page_id in range(100, self.pages_count // 2) if self._reversed_id(pending_src_view, page_id)]
+            if not src_page_ids:
+                raise RuntimeError(f'Not enough GameViews ({self.pages_count}) to assign a reversed page ID')
+            min_src_page_id = rand.choice(src_page_ids)
+        for game_view in game_views:
+            if pending_src_view and self.next_page_id >= min_src_page_id:
+                reversed_id = self._reversed_id(pending_src_view, self.next_page_id)
+                if reversed_id:
+                    self._assign_with_reversed_id(pending_src_view, reversed_id_gv, reversed_id)
+                    pending_src_view = None
+            if game_view.state and game_view.state.fixed_id:
+                continue
+            self._assign(game_view)
+        if pending_src_view:
+            raise RuntimeError(f'No valid page ID found for the source of the reversed ID view, from page ID {min_src_page_id}')
+
+    def _reversed_id(self, src_view, src_page_id):
+        'Return the page ID that the reversed ID view would get, if src_view was assigned src_page_id, or None if invalid'
+        if src_view.next_page_trick_game_view:
+            src_page_id += 1 + src_view.next_page_trick_game_view.state.trick.filler_pages
+        reversed_id = _reverse_number(src_page_id)
+        if (reversed_id <= src_page_id + MAX_FILLER_PAGE or reversed_id >= self.pages_count or src_page_id % 10 == 0
+                or reversed_id in self.gv_per_fixed_id):
+            return None
+        return reversed_id
+
+    def _assign_with_reversed_id(self, src_view, reversed_id_gv, reversed_id):
+        _check_not_dead_end(reversed_id_gv)
+        self.reversed_id_gv = reversed_id_gv
+        print(f'ID reversal: {self.next_page_id} -> {reversed_id}')
+        assert reversed_id_gv.set_page_id(reversed_id)
+        self._assign(src_view)
+        assert reversed_id_gv.page_id == reversed_id
+
+    def _assign(self, game_view):
+        _check_not_dead_end(game_view)
+        if game_view.prev_page_trick_game_view:
+            trick = game_view.prev_page_trick_game_view.state.trick
+            assert trick
+            trick_game_view = GameView(renderer=_render_trick(game_view.prev_page_trick_game_view))
+            trick_game_view.set_page_id(self.next_page_id)
+            self.out_game_views.append(trick_game_view)
+            self._increment_next_page_id()
+            assert trick.filler_pages < MAX_FILLER_PAGE
+            for i in range(trick.filler_pages):
+                filler_game_view = GameView(renderer=_render_filler_page(trick, i))
+                filler_game_view.set_page_id(self.next_page_id)
+                self.out_game_views.append(filler_game_view)
+                self._increment_next_page_id()
+        if game_view.set_page_id(self.next_page_id):
+            self.out_game_views.append(game_view)
+            self._increment_next_page_id()
+        else:  # can happen with the reducer, when trying to assign a page ID,
+               # to a view that already takes its ID from another one
+            self.out_game_views.append(game_view)
+        if game_view.next_page_trick_game_view:
+            trick = game_view.next_page_trick_game_view.state.trick
+            assert trick
+            assert trick.filler_pages < MAX_FILLER_PAGE
+            for i in range(trick.filler_pages):
+                filler_game_view = GameView(renderer=_render_filler_page(trick, i))
+                filler_game_view.set_page_id(self.next_page_id)
+                self.out_game_views.append(filler_game_view)
+                self._increment_next_page_id()
+            trick_game_view = GameView(renderer=_render_trick(game_view.next_page_trick_game_view))
+            trick_game_view.set_page_id(self.next_page_id)
+            self.out_game_views.append(trick_game_view)
+            self._increment_next_page_id()
 
     def _increment_next_page_id(self):
         self.next_page_id += 1
@@ -141,6 +152,18 @@ class Assigner:
                 self._increment_next_page_id()
 
 
+def _check_not_dead_end(game_view):
+    'Dead-end useful sanity check'
+    if game_view.state:
+        action_names = list(game_view.actions.keys())
+        dead_end_ok = game_view.state.last_checkpoint == len(CHECKPOINTS)
+        assert_error_msg = f'Non game-ending dead-end reached: {action_names} - {game_view}'
+        if game_view.state.mode == GameMode.INFO:
+            assert 'SHOW-INFO' in action_names or dead_end_ok, assert_error_msg
+        else:
+            assert action_names not in ([], ['SHOW-INFO']) or dead_end_ok or game_view.state.milestone >= 2, assert_error_msg
+
+
 def check_all_reachable_views_have_a_page_id(game_views):
     # Sanity check that revealed to be useful, e.g. when a mapscript trigger
     # sets tile overrides on new actions GameViews *AFTER* creating them
@@ -0,0 +1,54 @@
+from .assigner import assign_page_ids, START_PAGE_ID
+from .entities import GameState, GameView
+
+
+A_STATE = GameState(map_id=1, x=0, y=0, facing='north')
+VIEWS_COUNT = 400  # leaves room for the source of the reversed ID view, that must get a page ID in range(100, VIEWS_COUNT // 2)
+EASTER_EGGS_PAGE_IDS = [13, 26, 39, 52, 65, 78]
+
+
+def test_reversed_page_id():
+    game_views = _game_views(A_STATE._replace(reverse_id=True))
+    reversed_id_view = game_views[-1]
+    reversed_id_view.src_view = game_views[0]
+    out_game_views = assign_page_ids(game_views)
+    src_page_id = reversed_id_view.src_view.page_id
+    assert 100 <= src_page_id < VIEWS_COUNT // 2
+    assert str(reversed_id_view.page_id) == str(src_page_id)[::-1]
+    _check_page_ids_are_contiguous(out_game_views)
+
+
+def test_fixed_page_ids_are_kept():
+    game_views = _game_views(A_STATE._replace(fixed_id=50), A_STATE._replace(fixed_id=120))
+    out_game_views = assign_page_ids(game_views)
+    assert [gv.page_id for gv in out_game_views if gv.state and gv.state.fixed_id] == [50, 120]
+    _check_page_ids_are_contiguous(out_game_views)
+
+
+def test_easter_eggs_insertion():
+    out_game_views = assign_page_ids(_game_views())
+    assert [gv.page_id for gv in out_game_views if not gv.state] == EASTER_EGGS_PAGE_IDS
+    assert all(gv.renderer for gv in out_game_views if not gv.state)
+    _check_page_ids_are_contiguous(out_game_views)
+    assert len(assign_page_ids(_game_views(), assign_special_pages=False)) == VIEWS_COUNT
+
+
+def test_page_ids_only_depend_on_the_seed():
+    def page_id_per_x(seed):
+        return {gv.state.x: gv.page_id for gv in assign_page_ids(_game_views(), seed=seed) if gv.state}
+    assert page_id_per_x(seed=0) == page_id_per_x(seed=0)
+    assert page_id_per_x(seed=0) != page_id_per_x(seed=1)
+
+
+def _game_views(*special_states):
+    'Return VIEWS_COUNT GameViews, ending with the special_states ones, each one leading to the next one so that none is a dead-end'
+    states = [A_STATE._replace(x=x) for x in range(VIEWS_COUNT - len(special_states))]
+    states += [state._replace(x=VIEWS_COUNT - len(special_states) + i) for i, state in enumerate(special_states)]
+    game_views = [GameView(state) for state in states]
+    for game_view, next_game_view in zip(game_views, game_views[1:] + game_views[:1]):
+        game_view.actions['MOVE-FORWARD'] = next_game_view
+    return game_views
+
+
+def _check_page_ids_are_contiguous(game_views):
+    assert sorted(gv.page_id for gv in game_views) == list(range(START_PAGE_ID, START_PAGE_ID + len(game_views)))
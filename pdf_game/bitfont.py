@@ -1,11 +1,16 @@
 'Replicates heroine-dusk/release/js/bitfont.js'
 
+import hashlib
 from contextlib import contextmanager
+from os import getpid, makedirs, replace
+from os.path import exists
+
+from PIL import Image
 
 from .entities import Justify
 from .js import bitfont, config, REL_RELEASE_DIR
 from .perfs import trace_time
-from .render_utils import add_link
+from .render_utils import add_link, file_digest
 
 
 RED_RGB = (208, 70, 72)
@@ -15,8 +20,12 @@ _RENDER_AS_TEXT = False # Use .otf/.ttf font files. Otherwise use original image
                         # Note: enabling it reduced by ~7% the size of an output file that originally was ~160Mb.
                         # It would be required to make the PDF accessible.
                         # However the fonts are slightly less prettiers, and there is currently a bug with parens
+_RENDER_LINES_AS_IMAGES = True  # Rasterize each distinct line of text once, instead of rendering it glyph by glyph
 _FONTS_LOADED = False
 _ACTIVE_COLOR = WHITE_RGB
+LINES_DIR_PATH = '.cache/bitfont_lines'
+_LINE_IMG_FILEPATHS = {}  # (text, glyphs img filepath) -> rasterized line image filepath
+_LINES_ALREADY_GENERATED = set()
 
 
 def bitfont_set_color_red(enable):
@@ -32,7 +41,7 @@ def bitfont_color_red():
 
 
 def bitfont_render(pdf, text, x, y, justify=Justify.LEFT, size=8, page_id=None, url=None, link=None):
-    with trace_time('render:bitfont'):
+    with trace_time('bitfont'):
         min_x, max_x = config().VIEW_WIDTH, 0
         lines = text.split('\n')
         for i, line in enumerate(lines):
@@ -64,12 +73,50 @@ def _bitfont_render(pdf, text, x, y, justify=Justify.LEFT, size=8):
         pdf.set_text_color(*_ACTIVE_COLOR)
         pdf.set_font('BoxyBoldLight', size=size)
         pdf.text(x, y, text)
+    # Spaces width is not scaled by bitfont_renderglyph, hence lines with spaces are only rasterized at scale 1:
+    elif _RENDER_LINES_AS_IMAGES and text.strip() and scale == int(scale) and (scale == 1 or ' ' not in text):
+        line_img_filepath = _line_img_filepath(pdf, text)
+        pdf.image(line_img_filepath, x=x, y=y, w=text_width, h=(_HEIGHT - 1) * scale)
     else:
         for char in text:
             x += bitfont_renderglyph(pdf, char, x, y, scale)
     return start_x, text_width
 
 
+def _line_img_filepath(pdf, text):
+    '''
+    Rasterize a line of text at scale 1, like bitfont_renderglyph would do,
+    into a PNG named after a digest of its content, so that it can be reused between runs.
+    '''
+    glyphs_img_filepath = _RED_IMG_FILEPATH if _ACTIVE_COLOR == RED_RGB else _WHITE_IMG_FILEPATH
+    key = (text, glyphs_img_filepath)
+    img_filepath = _LINE_IMG_FILEPATHS.get(key)
+    if not img_filepath:
+        digest = hashlib.sha1(repr(key).encode())
+        digest.update(file_digest(glyphs_img_filepath))
+        img_filepath = _LINE_IMG_FILEPATHS[key] = f'{LINES_DIR_PATH}/{digest.hexdigest()}.png'
+    if img_filepath in _LINES_ALREADY_GENERATED or pdf.__class__.__name__.startswith('Fake'):
+        return img_filepath
+    if not exists(img_filepath):
+        makedirs(LINES_DIR_PATH, exist_ok=True)
+        line_img = Image.new('RGBA', (bitfont_calcwidth(text), _HEIGHT - 1))
+        with Image.open(glyphs_img_filepath) as glyphs_img:
+            glyphs_img = glyphs_img.convert('RGBA')
+        x = 0
+        for char in text:
+            if char == " ":
+                x += _SPACE
+                continue
+            glyph_x = _GLYPH_X[char]
+            line_img.paste(glyphs_img.crop((glyph_x, 0, glyph_x + _GLYPH_W[char], _HEIGHT - 1)), (x, 0))
+            x += _GLYPH_W[char] + _KERNING
+        tmp_filepath = f'{img_filepath}.{getpid()}.tmp'  # parallel rendering worker processes may generate the same image
+        line_img.save(tmp_filepath, format='PNG')
+        replace(tmp_filepath, img_filepath)
+    _LINES_ALREADY_GENERATED.add(img_filepath)
+    return img_filepath
+
+
 def _load_fonts(pdf):
     global _FONTS_LOADED
     if not _FONTS_LOADED and not pdf.__class__.__name__.startswith('Fake'):
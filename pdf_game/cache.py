@@ -0,0 +1,77 @@
+'''
+On-disk cache of the explored GameViews graph.
+
+It is keyed by a digest of all the modules defining the game logic (including mod/campaign.py),
+of the heroine-dusk JS sources and of the CLI arguments that alter exploration.
+Hence iterating on rendering code does not require to explore all game states again.
+Modules that only take part in rendering or post-processing are excluded from this digest:
+if they change in a way that alters the code of the cached callables, or the order in which they are registered,
+loading fails and exploration is performed.
+'''
+import hashlib, os, pickle, sys
+from glob import glob
+from os.path import dirname, join, relpath
+
+from .js import REL_RELEASE_DIR
+from .serializer import dump_views, load_views, relink_post_defeat_views
+
+
+CACHE_FILEPATH = '.cache/game_views.pickle'
+RENDER_MODULE, CONTENT_MODULE = 'render', 'content'
+# Modules with a specific role, shared by this cache key & incremental_pdf.render_digest so that they always agree:
+# - render modules only take part in rendering or post-processing: they are excluded from the explored views cache key.
+# - content modules mostly hold game content, like dialog texts, that can be copied in GameStates:
+#   they are part of the explored views cache key, but excluded from the render digest, as page digests cover them.
+#   As page IDs are deterministic, editing them triggers an exploration that assigns the same IDs to the same views.
+MODULE_ROLES = {
+    **{module: RENDER_MODULE for module in (
+        'ascii.py', 'assigner.py', 'bitfont.py', 'cache.py', 'content_stream.py', 'deadends.py', 'form_xobjects.py',
+        'incremental_pdf.py', 'logs.py', 'memory_report.py', 'parallel_render.py', 'perfs.py', 'streaming_pdf.py',
+        'reducer.py', 'render.py', 'render_dialog.py', 'render_info.py', 'render_minimap.py',
+        'render_treasure.py', 'render_utils.py', 'mod/metadata.py', 'mod/minimap.py')},
+    'mod/campaign.py': CONTENT_MODULE,
+    'mod/scenes.py': CONTENT_MODULE,
+}
+PKG_DIR = dirname(__file__)
+
+
+def load_explored_views(args):
+    'Return (start_view, game_views) from the cache if it is up-to-date, else None'
+    try:
+        with open(CACHE_FILEPATH, 'rb') as cache_file:
+            if pickle.load(cache_file) != cache_key(args):
+                print('Explored game states cache is outdated')
+                return None
+            start_view, game_views = load_views(cache_file)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as error:
+        print(f'Explored game states cache could not be loaded: {error}')
+        return None
+    print(f'{len(game_views)} views have been loaded from {CACHE_FILEPATH}')
+    return start_view, list(relink_post_defeat_views(game_views))
+
+
+def save_explored_views(args, start_view, game_views):
+    os.makedirs(dirname(CACHE_FILEPATH), exist_ok=True)
+    tmp_filepath = CACHE_FILEPATH + '.tmp'
+    with open(tmp_filepath, 'wb') as cache_file:
+        pickle.dump(cache_key(args), cache_file)
+        dump_views(cache_file, (start_view, game_views))
+    os.replace(tmp_filepath, CACHE_FILEPATH)  # atomic, so that an interrupted run never leaves a corrupted cache
+
+
+def cache_key(args):
+    digest = hashlib.sha256(f'{sys.version}|{args.inbetween_checkpoints}|{args.no_script}'.encode())
+    filepaths = package_source_filepaths(excluded_role=RENDER_MODULE) + glob(REL_RELEASE_DIR + 'js/*.js')
+    for filepath in sorted(filepaths):
+        digest.update(relpath(filepath, PKG_DIR).encode())
+        with open(filepath, 'rb') as src_file:
+            digest.update(src_file.read())
+    return digest.hexdigest()
+
+
+def package_source_filepaths(excluded_role):
+    'Return the filepaths of all the package modules, except tests & the ones with the given role in MODULE_ROLES'
+    return [filepath for filepath in glob(join(PKG_DIR, '**', '*.py'), recursive=True)
+            if not filepath.endswith('_test.py') and MODULE_ROLES.get(relpath(filepath, PKG_DIR).replace(os.sep, '/')) != excluded_role]
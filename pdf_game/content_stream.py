@@ -0,0 +1,46 @@
+'''
+Compaction of the pages content streams generated by fpdf2.
+
+fpdf2 formats all coordinates with 2 decimals (e.g. "24.00 0 0 24.00 10.00 76.00 cm"),
+and starts every page by setting the line cap style & line width ("2 J\n0.57 w"),
+whereas Undying Dusk never strokes any path.
+Across ~200k pages, every byte saved per page removes ~200KB from the final PDF.
+'''
+import re
+
+from .parallel_render import page_contents
+
+
+# Strings are matched first, so that the numbers they contain are left untouched:
+_STRING_OR_REAL_REGEX = re.compile(rb'\((?:\\.|[^\\)])*\)|(?<![\w/.])-?\d*\.\d+')
+_STROKE_STATE_PREAMBLE_REGEX = re.compile(rb'^2 J\n[\d.]+ w\n')
+_STROKE_OPERATOR_REGEX = re.compile(rb'(?:^|\s)[SsBb]\*?(?=\s|$)')
+
+
+def compact_content_stream(contents):
+    'Return an equivalent content stream, without the bytes that have no effect'
+    if not _STROKE_OPERATOR_REGEX.search(contents):
+        contents = _STROKE_STATE_PREAMBLE_REGEX.sub(b'', contents)
+    return _STRING_OR_REAL_REGEX.sub(_compact_real, contents)
+
+
+def compact_pages(pdf):
+    'Compact in place the content streams of all the pages of a FPDF instance'
+    for page in range(1, pdf.page + 1):
+        contents = page_contents(pdf, page)
+        contents[:] = compact_content_stream(bytes(contents))
+
+
+def _compact_real(match):
+    'Output the shortest representation of a real number: 16.00 -> 16, 0.50 -> .5, -0.00 -> 0'
+    token = match.group()
+    if token.startswith(b'('):
+        return token
+    number = token.rstrip(b'0').rstrip(b'.')
+    if number in (b'', b'-', b'-0'):
+        return b'0'
+    if number.startswith(b'0.'):
+        return number[1:]
+    if number.startswith(b'-0.'):
+        return b'-' + number[2:]
+    return number
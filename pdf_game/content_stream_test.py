@@ -0,0 +1,11 @@
+from .content_stream import compact_content_stream
+
+
+def test_compact_content_stream():
+    contents = b'2 J\n0.57 w\nq 24.00 0 0 24.00 10.00 -0.00 cm /I1 Do Q\nq 0.50 -0.25 16.00 16.00 re W n\nQ'
+    assert compact_content_stream(contents) == b'q 24 0 0 24 10 0 cm /I1 Do Q\nq .5 -.25 16 16 re W n\nQ'
+
+
+def test_compact_content_stream_preserves_strings_and_stroke_state():
+    contents = b'2 J\n0.57 w\n/P <</Alt (Drink 1.00 potion\\))>> BDC\n10.50 20.00 m 30.00 40.00 l S\nEMC'
+    assert compact_content_stream(contents) == b'2 J\n.57 w\n/P <</Alt (Drink 1.00 potion\\))>> BDC\n10.5 20 m 30 40 l S\nEMC'
@@ -1,6 +1,9 @@
+import sys
 from enum import IntEnum
 from typing import Callable, NamedTuple, Optional, Tuple, Union
 
+from .sorted_collections import SortedMap, SortedSet
+
 
 class Position(NamedTuple):
     x: int
@@ -132,7 +135,50 @@ class CustomCombatAction(NamedTuple):
         return self.name.split('_', 1)[0]
 
 
-class Enemy(NamedTuple):
+_HASH_MODULUS = (1 << 61) - 1  # cf. sys.hash_info.modulus
+_HASH_WEIGHTS = tuple(pow(1000003, i + 1, _HASH_MODULUS) for i in range(64))
+
+
+class _HashMemoized:
+    '''
+    Mixin for NamedTuples heavily used as dict keys, that memoizes their hash as an extra, hidden, last tuple item.
+    This hash is a weighted sum of the fields hashes, so that _replace only needs to hash the fields that changed.
+    Must be placed before the NamedTuple in the bases classes list.
+    '''
+    # pylint: disable=no-member,unsubscriptable-object
+    __slots__ = ()
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_index = {name: i for i, name in enumerate(cls._fields)}
+    def __new__(cls, *args, **kwargs):
+        return cls._make(super().__new__(cls, *args, **kwargs))
+    @classmethod
+    def _make(cls, iterable):
+        values = tuple(iterable)
+        assert len(values) == len(cls._fields), f'Expected {len(cls._fields)} values, got {len(values)}'
+        fields_hash = sum(hash(value) * weight for value, weight in zip(values, _HASH_WEIGHTS)) % _HASH_MODULUS
+        return tuple.__new__(cls, (*values, fields_hash))
+    def _replace(self, **kwargs):
+        values = list(self)
+        fields_hash = values.pop()
+        for name, value in kwargs.items():
+            i = self._field_index[name]
+            fields_hash += (hash(value) - hash(values[i])) * _HASH_WEIGHTS[i]
+            values[i] = value
+        values.append(fields_hash % _HASH_MODULUS)
+        return tuple.__new__(type(self), values)
+    def __hash__(self):
+        return self[-1]
+    def fields_values(self):
+        'Return the fields values as a plain tuple, without the memoized hash'
+        return self[:len(self._fields)]
+    def __getnewargs__(self):  # used by pickle & copy, the hash must not be serialized
+        return self.fields_values()
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self))})'
+
+
+class _EnemyFields(NamedTuple):
     name : str
     category : int
     hp : int
@@ -158,6 +204,10 @@ class Enemy(NamedTuple):
     post_defeat : Optional[Callable[['FPDF'], None]] = None  # renderer function, will receive a .game_view attribute
     victory_msg : str = ''
     post_victory : Optional[Callable[['GameState'], Optional['GameState']]] = None  # GameState -> GameState
+
+
+class Enemy(_HashMemoized, _EnemyFields):
+    __slots__ = ()
     @property
     def custom_actions_names(self):
         return tuple(cca.name for cca in self.custom_actions)
@@ -170,7 +220,7 @@ class CombatLog(NamedTuple):
     result : str
 
 
-class CombatState(NamedTuple):
+class _CombatStateFields(NamedTuple):
     enemy: Enemy
     combat_round: CombatRound = None
     round: int = -1
@@ -179,6 +229,10 @@ class CombatState(NamedTuple):
     enemy_log: Optional[CombatLog] = None
     boneshield_up: bool = False
     action_name: Optional[str] = None  # if round > 0, name of the action clicked by the player on the previous round
+
+
+class CombatState(_HashMemoized, _CombatStateFields):
+    __slots__ = ()
     def incr_round(self):
         # pylint: disable=no-member,protected-access
         combat_state = self._replace(round=self.round + 1)
@@ -225,8 +279,7 @@ class Book(NamedTuple):
     extra_render: Optional[Callable[['FPDF'], None]] = None
 
 
-class GameState(NamedTuple):
-    'Minimal, immutable set of properties that define a unique instant in the game'
+class _GameStateFields(NamedTuple):
     # Avatar info:
     map_id: int = -1
     x: int = -1
@@ -243,14 +296,14 @@ class GameState(NamedTuple):
     bonus_atk: int = 0
     bonus_def: int = 0
     items: Tuple[str] = ()
-    hidden_triggers: Tuple[str] = ()
+    hidden_triggers: SortedSet = SortedSet()  # of str
     puzzle_step: Optional[int] = None
     rolling_boulder: Optional[RollingBoulder] = None
-    triggers_activated: Tuple[Tuple[int]] = ()  # sequence of coords
+    triggers_activated: SortedSet = SortedSet()  # of coords
     # Tile-transient state:
     mode: GameMode = GameMode.EXPLORE
     combat: Optional[CombatState] = None
-    vanquished_enemies: Tuple[Tuple[int]] = ()  # sequence of coords - includes enemy bribed & that ran away
+    vanquished_enemies: SortedSet = SortedSet()  # of coords - includes enemy bribed & that ran away
     shop_id: int = -1  # meaningful only if >= 0
     message: str = ''
     msg_place: MessagePlacement = MessagePlacement.DOWN
@@ -265,8 +318,65 @@ class GameState(NamedTuple):
     reverse_id: bool = False  # indicates this GameView ID must be the symetrical of its src_view
     milestone: GameMilestone = GameMilestone.NONE
     last_checkpoint: int = 0
-    tile_overrides: Tuple[tuple] = ()  # pairs: ((map_id, x, y), tile_id)
+    tile_overrides: SortedMap = SortedMap()  # (map_id, x, y) -> tile_id
     secrets_found: Tuple[str] = ()
+
+
+# Hundreds of thousands of GameStates are alive at once during exploration,
+# and most of their fields values are equal to ones of their source state.
+# This table is cleared once exploration is over, as it would otherwise keep alive
+# the values of all the states discarded since:
+_INTERNED_VALUES = {}
+
+
+def interned(value):
+    'Return a single shared instance for every equal string, integer, tuple or sorted collection'
+    value_type = type(value)
+    if value_type is str:
+        return sys.intern(value)
+    if value_type in (int, SortedMap, SortedSet) or isinstance(value, tuple):
+        return _INTERNED_VALUES.setdefault((value_type, value), value)
+    return value
+
+
+def clear_interned_values():
+    'Values already interned remain shared, but new equal values will not be the same instances'
+    _INTERNED_VALUES.clear()
+
+
+def interned_values_count():
+    return len(_INTERNED_VALUES)
+
+
+# Those fields can be assigned any iterable, that will be converted:
+_COLLECTION_FIELDS = {'hidden_triggers': SortedSet, 'triggers_activated': SortedSet,
+                      'vanquished_enemies': SortedSet, 'tile_overrides': SortedMap}
+_COLLECTIONS_TYPES = (tuple, SortedMap, SortedSet)
+
+
+def _field_value(name, value):
+    collection_type = _COLLECTION_FIELDS.get(name)
+    if collection_type and type(value) is not collection_type:  # pylint: disable=unidiomatic-typecheck
+        value = collection_type(value)
+    return interned(value)
+
+
+def _as_set(value):
+    return set(value.items() if isinstance(value, SortedMap) else value or ())
+
+
+class GameState(_HashMemoized, _GameStateFields):
+    '''
+    Minimal, immutable set of properties that define a unique instant in the game.
+    Fields values are interned, so that identical ones are shared between all states,
+    and its hash is memoized.
+    '''
+    __slots__ = ()  # no per-instance __dict__
+    def __new__(cls, *args, **kwargs):
+        return super().__new__(cls, *map(_field_value, cls._fields, args),
+                               **{name: _field_value(name, value) for name, value in kwargs.items()})
+    def _replace(self, **kwargs):  # pylint: disable=arguments-differ
+        return super()._replace(**{name: _field_value(name, value) for name, value in kwargs.items()})
     # pylint: disable=no-member
     def clean_copy(self):
         return self._replace(message='', msg_place=MessagePlacement.DOWN,
@@ -278,12 +388,12 @@ class GameState(NamedTuple):
                              combat=self.combat and self.combat._replace(
                                 avatar_log=None, enemy_log=None, action_name=None))
     def tile_override_at(self, coords):
-        return next((tile_id for (pos, tile_id) in self.tile_overrides if pos == coords), None)
+        return self.tile_overrides.get(coords)
     def with_hidden_trigger(self, hidden_trigger):
         assert hidden_trigger not in self.hidden_triggers
-        return self._replace(hidden_triggers=tuple(sorted(self.hidden_triggers + (hidden_trigger,))))
+        return self._replace(hidden_triggers=self.hidden_triggers.insert(hidden_trigger))
     def without_hidden_trigger(self, hidden_trigger):
-        return self._replace(hidden_triggers=tuple(ht for ht in self.hidden_triggers if ht != hidden_trigger))
+        return self._replace(hidden_triggers=self.hidden_triggers.delete(hidden_trigger))
     def with_secret(self, secret):
         assert secret not in self.secrets_found
         return self._replace(secrets_found=tuple(sorted(self.secrets_found + (secret,))))
@@ -292,17 +402,17 @@ class GameState(NamedTuple):
         if existing_override and exist_ok:
             return self if existing_override == tile_id else self.without_tile_override(coords).with_tile_override(tile_id, coords)
         assert not existing_override, f'Existing tile override @{coords}: {existing_override}'
-        return self._replace(tile_overrides=tuple(sorted(self.tile_overrides + ((coords, tile_id),))))
+        return self._replace(tile_overrides=self.tile_overrides.insert(coords, tile_id))
     def without_tile_override(self, coords):
         assert self.tile_override_at(coords) is not None
-        return self._replace(tile_overrides=tuple((pos, tile_id) for (pos, tile_id) in self.tile_overrides if pos != coords))
+        return self._replace(tile_overrides=self.tile_overrides.delete(coords))
     def with_trigger_activated(self, trigger_coords):
         if trigger_coords in self.triggers_activated:
             return self
-        return self._replace(triggers_activated=tuple(sorted(self.triggers_activated + (trigger_coords,))))
+        return self._replace(triggers_activated=self.triggers_activated.insert(trigger_coords))
     def with_vanquished_enemy(self, enemy_coords):
         assert enemy_coords not in self.vanquished_enemies
-        return self._replace(vanquished_enemies=tuple(sorted(self.vanquished_enemies + (enemy_coords,))))
+        return self._replace(vanquished_enemies=self.vanquished_enemies.insert(enemy_coords))
     def with_combat_action(self, action_name):
         return self._replace(combat=self.combat._replace(action_name=action_name))
     @property
@@ -315,8 +425,8 @@ class GameState(NamedTuple):
             self_val, other_val = getattr(self, field), getattr(other, field)
             if self_val != other_val:
                 out += f'{field}: '
-                if isinstance(self_val, tuple) or isinstance(other_val, tuple):
-                    self_val_set, other_val_set = set(self_val or ()), set(other_val or ())
+                if isinstance(self_val, _COLLECTIONS_TYPES) or isinstance(other_val, _COLLECTIONS_TYPES):
+                    self_val_set, other_val_set = _as_set(self_val), _as_set(other_val)
                     left_diff, right_diff = self_val_set - other_val_set, other_val_set - self_val_set
                     left_diff = ('+' + ','.join(map(str, left_diff))) if left_diff else ''
                     right_diff = ('+' + ','.join(map(str, right_diff))) if right_diff else ''
@@ -482,9 +592,12 @@ class GameView:
         combat = self.state.combat
         # removing non-serializable fields:
         view_dict['extra_render'] = bool(view_dict['extra_render'])
+        view_dict['tile_overrides'] = tuple(self.state.tile_overrides.items())
+        for field in ('hidden_triggers', 'triggers_activated', 'vanquished_enemies'):
+            view_dict[field] = tuple(view_dict[field])
         if combat:
-            view_dict['combat'] = combat._replace(enemy=combat.enemy._replace(
-                    post_defeat_condition=None, post_defeat=None, post_victory=None))
+            enemy = combat.enemy._replace(post_defeat_condition=None, post_defeat=None, post_victory=None)
+            view_dict['combat'] = {**combat._asdict(), 'enemy': enemy._asdict()}
         view_dict['actions'] = {action: next_gv.page_id if next_gv else None
                                 for action, next_gv in self.actions.items()}
         return view_dict
@@ -0,0 +1,20 @@
+import json, pickle
+
+from .entities import CombatState, Enemy, GameState, GameView
+
+
+AN_ENEMY = Enemy(name='Skeleton', category=0, hp=7, max_hp=7, post_defeat=print)
+
+
+def test_fields_values_exclude_the_memoized_hash():
+    combat = CombatState(enemy=AN_ENEMY, round=2)
+    assert combat.fields_values() == tuple(combat._asdict().values())
+    assert pickle.loads(pickle.dumps(combat)) == combat
+
+
+def test_game_view_as_dict_is_json_serializable():
+    game_view = GameView(GameState(map_id=1, x=2, y=3, facing='north', combat=CombatState(enemy=AN_ENEMY, round=2)))
+    view_dict = json.loads(json.dumps(game_view.as_dict()))
+    assert view_dict['combat']['round'] == 2
+    assert view_dict['combat']['enemy']['name'] == 'Skeleton'
+    assert view_dict['combat']['enemy']['post_defeat'] is None
@@ -0,0 +1,53 @@
+'''
+Form XObjects (cf. PDF spec 8.10): static layers drawn identically on many pages,
+like the arrow buttons, are defined only once in the document,
+and every page invokes them with a single "Do" operator.
+Links are not part of those layers, and remain specific to every page.
+
+Forms are named after their kind & arguments, e.g. /Farrow.TURN-LEFT,
+so that the content streams rendered by parallel worker processes can refer to them,
+and so that StreamingPdfWriter can draw them by name when closing the document.
+They are only enabled along with StreamingPdfWriter: otherwise, layers are drawn inline.
+'''
+import re
+
+from .parallel_render import page_contents
+
+
+FORM_RENDERERS = {}  # kind -> function(pdf, *args) drawing the form content
+FORM_DO_REGEX = re.compile(rb'/F([\w.-]+) Do')
+_FORM_NAME_PART_REGEX = re.compile(r'[\w-]+', re.ASCII)
+_ENABLED = False
+
+
+def enable_form_xobjects():
+    global _ENABLED
+    _ENABLED = True
+
+
+def form_renderer(kind):
+    'Decorator registering a function that draws a form, given its arguments: integers or names without dots'
+    def decorator(func):
+        FORM_RENDERERS[kind] = func
+        return func
+    return decorator
+
+
+def form_render(pdf, kind, *args):
+    if _ENABLED:
+        page_contents(pdf, pdf.page).extend(b'/F%s Do\n' % form_name(kind, *args).encode())
+    else:
+        FORM_RENDERERS[kind](pdf, *args)
+
+
+def form_name(kind, *args):
+    'Arguments must be parsed back identically by draw_form: only integers & names without dots are allowed'
+    for part in (kind,) + args:
+        assert isinstance(part, int) or (isinstance(part, str) and _FORM_NAME_PART_REGEX.fullmatch(part)), f'Invalid form name part: {part!r}'
+    return '.'.join(map(str, (kind,) + args))
+
+
+def draw_form(pdf, name):
+    'Draw a form on the current page of a FPDF instance'
+    kind, *args = name.split('.')
+    FORM_RENDERERS[kind](pdf, *(int(arg) if arg.lstrip('-').isdigit() else arg for arg in args))
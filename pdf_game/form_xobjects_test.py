@@ -0,0 +1,43 @@
+import fpdf
+import pytest
+
+from . import form_xobjects
+from .form_xobjects import draw_form, form_name, form_render, form_renderer
+from .parallel_render import page_contents
+
+
+@form_renderer('test-square')
+def _square_render(pdf, size, color):
+    assert color == 'RED'
+    pdf.rect(0, 0, size, size)
+
+
+def test_form_render_inline():
+    pdf = _new_pdf()
+    form_render(pdf, 'test-square', 16, 'RED')
+    assert b'/Ftest-square' not in page_contents(pdf, 1)
+    assert b' re' in page_contents(pdf, 1)
+
+
+def test_form_render_as_xobject(monkeypatch):
+    monkeypatch.setattr(form_xobjects, '_ENABLED', True)
+    pdf = _new_pdf()
+    form_render(pdf, 'test-square', 16, 'RED')
+    assert page_contents(pdf, 1).endswith(b'/Ftest-square.16.RED Do\n')
+    assert b' re' not in page_contents(pdf, 1)
+    draw_form(pdf, 'test-square.16.RED')  # arguments are parsed back from the form name
+    assert b' re' in page_contents(pdf, 1)
+
+
+def test_form_name_only_accepts_arguments_parsed_back_identically():
+    assert form_name('test-square', 16, 'RED') == 'test-square.16.RED'
+    assert form_name('bar-frame', -2, 'DARK_RED') == 'bar-frame.-2.DARK_RED'
+    for invalid_arg in (1.5, 'RED.DARK', 'RED BLUE', 'ROUGE\u00c9', None):
+        with pytest.raises(AssertionError):
+            form_name('test-square', invalid_arg)
+
+
+def _new_pdf():
+    pdf = fpdf.FPDF(format=[160, 120], unit='pt')
+    pdf.add_page()
+    return pdf
@@ -0,0 +1,264 @@
+'''
+Incremental PDF rebuilds.
+
+A build manifest records, per page ID, a digest of everything the page rendering depends on:
+its GameState, the page IDs it links to, the dialog data it displays,
+and the code of the callables involved, including the ones they call.
+A global render digest covers all the rest: rendering code, images, JS data & CLI options.
+
+When the render digest is unchanged, only the pages whose digest changed are rendered again,
+and they are appended to the previous PDF as an incremental update section (cf. PDF spec 7.5.6).
+This relies on the fixed objects numbering of StreamingPdfWriter: page N dictionary is always object 2N+1.
+Content modules (cf. cache.MODULE_ROLES) are the ones mostly holding game content, like dialog texts:
+they are excluded from the render digest, so that iterating on them only requires to re-render the pages they alter.
+'''
+import hashlib, io, json, os, pickle, re, sys
+from glob import glob
+from os.path import dirname, isfile, join, relpath
+from types import FunctionType
+
+from .cache import package_source_filepaths, CONTENT_MODULE, MODULE_ROLES, PKG_DIR
+from .entities import GameMode, GameView
+from .js import shop, REL_RELEASE_DIR
+from .streaming_pdf import StreamingPdfWriter
+
+
+MANIFEST_FILEPATH = '.cache/build_manifest.json'
+MANIFEST_VERSION = 2  # to increment when the manifest format or the digests computation change
+_IMAGE_DO_REGEX = re.compile(rb'/I(\d+) Do')
+_CODE_DIGESTS = {}  # code object -> digest of this code & of the code of the package functions it references
+
+
+def render_digest(args, game_views_count, start_page_id):
+    'Digest of everything the rendering of all pages depends on: if it changes, a full rebuild is required'
+    digest = hashlib.sha256(f'{MANIFEST_VERSION}|{sys.version}|{game_views_count}|{start_page_id}'
+                            f'|{args.no_marked_content}|{args.composite_maze_views}|{args.object_streams}'.encode())
+    filepaths = package_source_filepaths(excluded_role=CONTENT_MODULE)
+    filepaths.append(join(dirname(PKG_DIR), 'gen_pdf.py'))
+    filepaths += glob(REL_RELEASE_DIR + 'js/*.js') + glob(REL_RELEASE_DIR + 'images/**/*', recursive=True)
+    filepaths += glob('assets/**/*', recursive=True)
+    for filepath in sorted(filepath for filepath in filepaths if isfile(filepath)):
+        digest.update(relpath(filepath).encode())
+        with open(filepath, 'rb') as src_file:
+            digest.update(src_file.read())
+    return digest.hexdigest()
+
+
+def page_digest(game_view):
+    'Return a digest of everything this page rendering depends on, or None if some of it cannot be digested'
+    game_state = game_view.state
+    links = tuple((action_name, next_game_view and next_game_view.page_id) for action_name, next_game_view in game_view.actions.items())
+    post_defeat = game_state and game_state.combat and game_state.combat.enemy.post_defeat
+    if post_defeat and hasattr(post_defeat, 'game_view'):
+        links += (post_defeat.game_view.page_id,)
+    dialog = shop()[game_state.shop_id] if game_state and game_state.mode == GameMode.DIALOG and game_state.shop_id >= 0 else None
+    buffer = io.BytesIO()
+    try:
+        _DigestPickler(buffer).dump((game_view, links, dialog))
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError):
+        return None  # the page will always be rendered
+    return hashlib.blake2b(buffer.getvalue(), digest_size=12).hexdigest()
+
+
+def load_manifest(output_filepath, digest):
+    'Return the manifest of the previous build of output_filepath, if this file can be incrementally updated, else None'
+    try:
+        with open(MANIFEST_FILEPATH, encoding='utf8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or manifest['output_filepath'] != output_filepath or manifest['render_digest'] != digest:
+        print('Build manifest is outdated: all pages will be rendered')
+        return None
+    if not isfile(output_filepath) or os.path.getsize(output_filepath) != manifest['file_size']:
+        print(f'{output_filepath} has been modified since the last build: all pages will be rendered')
+        return None
+    return manifest
+
+
+def save_manifest(output_filepath, digest, page_digests, pdf):
+    'pdf must be a closed StreamingPdfWriter'
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'output_filepath': output_filepath,
+        'render_digest': digest,
+        'file_size': pdf.file_size,
+        'xref_offset': pdf.xref_offset,
+        'size': pdf.size,
+        'pages_count': pdf.pages_count,
+        'images': pdf.image_refs,
+        'named_dests_links': sorted(pdf.named_dests_links),
+        'forms': sorted(pdf.form_names),
+        'page_digests': page_digests,
+    }
+    os.makedirs(dirname(MANIFEST_FILEPATH), exist_ok=True)
+    tmp_filepath = MANIFEST_FILEPATH + '.tmp'
+    with open(tmp_filepath, 'w', encoding='utf8') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_filepath, MANIFEST_FILEPATH)
+
+
+class IncrementalPdfWriter(StreamingPdfWriter):
+    '''
+    Appends an incremental update section to a PDF written by a StreamingPdfWriter:
+    all pages must be added again, but only the ones that are not skipped are rewritten,
+    along with the resources, the document information & the catalog.
+    '''
+    def __init__(self, instance, filepath, manifest, link_alt_texts=True, object_streams=False):
+        self.manifest = manifest
+        super().__init__(instance, filepath, link_alt_texts, object_streams)
+        self.image_refs = {name: tuple(image_ref) for name, image_ref in manifest['images'].items()}
+        self.size = manifest['size']
+        self.named_dests_links = set(manifest['named_dests_links'])
+        self.form_names = set(manifest['forms'])  # all forms are written again, as the resources dictionary is
+        self._prev_xref_offset = manifest['xref_offset']
+        self._skipped_pages = set()
+        self._name_per_index = {}  # index of image in this FPDF instance -> image name
+        self._next_image_index = max((index for index, _ in self.image_refs.values()), default=0) + 1
+
+    def _open(self, filepath):
+        pdf_file = open(filepath, 'r+b')  # pylint: disable=consider-using-with
+        pdf_file.seek(self.manifest['file_size'])
+        return pdf_file
+
+    def skip_page(self):
+        'Keep the previous version of the next page'
+        self.add_page()
+        self._skipped_pages.add(self.instance.page)
+
+    def _flush_page(self, page):
+        if page not in self._skipped_pages:
+            super()._flush_page(page)
+            return
+        self._skipped_pages.remove(page)
+        self.pages_count += 1
+        assert page == self.pages_count, f'Pages must be written in order: {page} != {self.pages_count}'
+        assert not self.links_per_page.pop(page, None), f'Links were added to skipped page {page}'
+        del self.instance.pages[page]
+
+    def _page_contents(self, page):
+        'Images are renamed after the ones of the previous build'
+        return _IMAGE_DO_REGEX.sub(self._rename_image, super()._page_contents(page))
+
+    def _rename_image(self, match):
+        index = int(match.group(1))
+        if index not in self._name_per_index:
+            self._name_per_index.update((info['i'], name) for name, info in self.instance.images.items())
+        name = self._name_per_index[index]
+        if name not in self.image_refs:
+            self.image_refs[name] = (self._next_image_index, None)  # object number assigned on close
+            self._next_image_index += 1
+        return b'/I%d Do' % self.image_refs[name][0]
+
+    def _new_contents_obj_num(self, page):
+        'Content streams get new objects numbers, as the previous ones may be shared with pages that are not rewritten'
+        self.size += 1
+        return self.size - 1
+
+    def _last_obj_num(self):
+        return self.size - 1
+
+    def _write_images(self, obj_num):
+        for name, (index, img_obj_num) in sorted(self.image_refs.items(), key=lambda item: item[1][0]):
+            if img_obj_num is None:
+                self.image_refs[name] = (index, obj_num + 1)
+                obj_num = self._write_image(obj_num + 1, self.instance.images[name])
+        return obj_num
+
+    def _write_pages_tree(self):
+        'The pages tree is unchanged'
+        if self.pages_count != self.manifest['pages_count']:
+            raise RuntimeError(f'Pages count changed since the last build: {self.manifest["pages_count"]} -> {self.pages_count}')
+
+
+class _DigestPickler(pickle.Pickler):
+    '''
+    Only used to compute digests, its output is never loaded.
+    GameViews are serialized without following their links, and functions by their code & closure.
+    Memoization is disabled, so that the output does not depend on how objects are shared.
+    '''
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.fast = True
+        self._in_progress = set()  # ids of GameViews & functions being serialized, to break cycles
+
+    def reducer_override(self, obj):
+        obj_type = type(obj)
+        if obj_type is GameView:
+            if id(obj) in self._in_progress:
+                return tuple, (('GameView', obj.page_id),)
+            self._in_progress.add(id(obj))
+            return tuple, (('GameView', obj.page_id, obj.state, obj.renderer),)
+        if obj_type is FunctionType:
+            if id(obj) in self._in_progress:
+                return tuple, (('function', obj.__module__, obj.__qualname__),)
+            self._in_progress.add(id(obj))
+            return tuple, (('function', obj.__module__, obj.__qualname__, _code_digest(obj),
+                            obj.__defaults__, obj.__kwdefaults__, _cells_content(obj)),)
+        if isinstance(obj, type) and _is_content_module(obj.__module__):
+            return tuple, (('class', obj.__module__, obj.__qualname__, obj.__bases__, tuple(_class_attrs(obj))),)
+        return NotImplemented
+
+
+def _code_digest(func):
+    digest = _CODE_DIGESTS.get(func.__code__)  # closures sharing the same code also share the same globals
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=12)
+        seen, stack = set(), [func]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            if isinstance(current, type):  # class from a content module
+                stack.extend(value for _, value in _class_attrs(current) if type(value) is FunctionType)  # pylint: disable=unidiomatic-typecheck
+                continue
+            for code in _iter_codes(current.__code__):
+                hasher.update(code.co_code)
+                hasher.update(repr((_consts(code), code.co_names)).encode())
+                for name in code.co_names:
+                    value = current.__globals__.get(name)
+                    if type(value) is FunctionType and (value.__module__ or '').startswith(__package__):  # pylint: disable=unidiomatic-typecheck
+                        stack.append(value)
+                    elif isinstance(value, type) and _is_content_module(value.__module__):
+                        stack.append(value)
+        digest = _CODE_DIGESTS[func.__code__] = hasher.digest()
+    return digest
+
+
+def _iter_codes(code):
+    yield code
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            yield from _iter_codes(const)
+
+
+def _consts(code):
+    'Code objects are digested separately, and frozensets iteration order depends on the process hash seed'
+    return tuple('<code>' if hasattr(const, 'co_code') else tuple(sorted(map(repr, const))) if isinstance(const, frozenset) else const
+                 for const in code.co_consts)
+
+
+def _cells_content(func):
+    cells_content = []
+    for cell in func.__closure__ or ():
+        try:
+            cells_content.append(cell.cell_contents)
+        except ValueError:  # empty cell
+            cells_content.append(None)
+    return tuple(cells_content)
+
+
+def _class_attrs(cls):
+    'Return (name, value) pairs of the functions & plain data defined in a class body'
+    for name, value in sorted(vars(cls).items()):
+        if isinstance(value, (staticmethod, classmethod)):
+            yield name, value.__func__
+        elif isinstance(value, property):
+            yield name, (value.fget, value.fset, value.fdel)
+        elif isinstance(value, (FunctionType, str, int, float, tuple, type(None))) and name not in ('__module__', '__qualname__'):
+            yield name, value
+
+
+def _is_content_module(module_name):
+    return MODULE_ROLES.get(module_name.split('.', 1)[-1].replace('.', '/') + '.py') == CONTENT_MODULE
@@ -0,0 +1,138 @@
+import re
+
+import fpdf
+import pytest
+
+from . import incremental_pdf
+from .entities import GameState, GameView
+from .incremental_pdf import load_manifest, page_digest, save_manifest, IncrementalPdfWriter
+from .render_utils import link_from_page_id
+from .streaming_pdf import StreamingPdfWriter
+from .streaming_pdf_test import _check_xref_entries, _get_obj, _read_xref, _ref, ARROW_IMG, COMPASS_IMG
+
+
+A_STATE = GameState(map_id=1, x=2, y=3, facing='north', message='Hello')
+RENDER_DIGEST = 'render digest'
+
+
+def test_page_digest_depends_on_state_and_links():
+    view1, view2 = GameView(A_STATE), GameView(A_STATE._replace(items=('BOOTS',)))
+    assert page_digest(view1) == page_digest(GameView(A_STATE))
+    assert page_digest(view1) != page_digest(GameView(A_STATE._replace(message='Bye')))
+    view1.actions['MOVE-FORWARD'] = view2
+    view2.set_page_id(10)
+    digest = page_digest(view1)
+    assert digest != page_digest(GameView(A_STATE))
+    view2.set_page_id(11)
+    assert page_digest(view1) != digest
+
+
+def test_page_digest_of_renderers_depends_on_closures():
+    def renderer(text):
+        return lambda pdf: pdf.text(0, 0, text)
+    assert page_digest(GameView(renderer=renderer('a'))) == page_digest(GameView(renderer=renderer('a')))
+    assert page_digest(GameView(renderer=renderer('a'))) != page_digest(GameView(renderer=renderer('b')))
+
+
+def test_manifest_round_trip(tmp_path, monkeypatch):
+    output_filepath = _use_tmp_path(tmp_path, monkeypatch)
+    _build(output_filepath, _game_views())
+    manifest = load_manifest(output_filepath, RENDER_DIGEST)
+    assert manifest['pages_count'] == 4
+    assert manifest['page_digests'] == {str(gv.page_id): page_digest(gv) for gv in _game_views()}
+    assert load_manifest(output_filepath, 'other render digest') is None
+    assert load_manifest(str(tmp_path / 'other.pdf'), RENDER_DIGEST) is None
+    with open(output_filepath, 'ab') as pdf_file:
+        pdf_file.write(b'%')
+    assert load_manifest(output_filepath, RENDER_DIGEST) is None
+
+
+def test_incremental_updates_only_rewrite_changed_pages(tmp_path, monkeypatch):
+    output_filepath = _use_tmp_path(tmp_path, monkeypatch)
+    assert _build(output_filepath, _game_views()) == [1, 2, 3, 4]
+    full_build_size = load_manifest(output_filepath, RENDER_DIGEST)['size']
+    assert not _build(output_filepath, _game_views())
+    game_views = _game_views()
+    game_views[2].renderer = _renderer(COMPASS_IMG, x=20, next_page_id=1)
+    assert _build(output_filepath, game_views) == [3]
+    with open(output_filepath, 'rb') as pdf_file:
+        data = pdf_file.read()
+    xref_offsets = [int(offset) for offset in re.findall(rb'startxref\n(\d+)\n', data)]
+    assert len(xref_offsets) == 3
+    assert [int(offset) for offset in re.findall(rb'/Prev (\d+)', data)] == xref_offsets[:-1]
+    entries, _ = _read_xref(data)
+    for obj_num, (entry_type, offset, _) in entries.items():
+        if entry_type == 1:
+            assert data.startswith(b'%d 0 obj\n' % obj_num, offset), f'Wrong offset for object {obj_num}'
+    assert entries[5][1] < xref_offsets[0]  # page 2 dictionary is the one of the full build
+    assert entries[7][1] > xref_offsets[1]  # page 3 dictionary has been rewritten
+    contents_obj_num = _ref(_get_obj(data, entries, 7), b'Contents')
+    assert contents_obj_num >= full_build_size
+    assert entries[contents_obj_num][1] > xref_offsets[1]
+    assert b'/Dest [3 0 R ' in _get_obj(data, entries, 7)
+    with pytest.raises(RuntimeError):  # the pages tree is never rewritten
+        _build(output_filepath, game_views[:3])
+
+
+def test_incremental_update_with_object_streams(tmp_path, monkeypatch):
+    output_filepath = _use_tmp_path(tmp_path, monkeypatch)
+    _build(output_filepath, _game_views(), object_streams=True)
+    full_build_size = load_manifest(output_filepath, RENDER_DIGEST)['size']
+    game_views = _game_views()
+    game_views[2].renderer = _renderer(COMPASS_IMG, x=20, next_page_id=1)
+    assert _build(output_filepath, game_views, object_streams=True) == [3]
+    with open(output_filepath, 'rb') as pdf_file:
+        data = pdf_file.read()
+    xref_offsets = [int(offset) for offset in re.findall(rb'startxref\n(\d+)\n', data)]
+    assert [int(offset) for offset in re.findall(rb'/Prev (\d+)', data)] == xref_offsets[:1]
+    entries, trailer = _read_xref(data)
+    assert b'/Type /XRef' in trailer
+    _check_xref_entries(data, entries)
+    assert entries[entries[5][1]][1] < xref_offsets[0]  # page 2 dictionary is in an object stream of the full build
+    assert entries[entries[7][1]][1] > xref_offsets[0]  # page 3 dictionary is in an object stream of the update
+    assert _ref(_get_obj(data, entries, 7), b'Contents') >= full_build_size
+    assert re.search(rb'/I2 (\d+) 0 R', _get_obj(data, entries, 2))  # the image added by the update is in the resources
+
+
+def _game_views():
+    'Every page displays an image, linking to the next page'
+    game_views = []
+    for page_id in range(1, 5):
+        game_view = GameView(renderer=_renderer(ARROW_IMG, x=10 * page_id, next_page_id=page_id % 4 + 1))
+        game_view.set_page_id(page_id)
+        game_views.append(game_view)
+    return game_views
+
+
+def _renderer(img_filepath, x, next_page_id):
+    def render(pdf):
+        pdf.add_page()
+        pdf.image(img_filepath, x=x, y=0, link=link_from_page_id(pdf, next_page_id))
+    return render
+
+
+def _build(output_filepath, game_views, object_streams=False):
+    'Perform an incremental build like gen_pdf.main, and return the IDs of the pages rendered'
+    page_digests = {str(gv.page_id): page_digest(gv) for gv in game_views}
+    manifest = load_manifest(output_filepath, RENDER_DIGEST)
+    instance = fpdf.FPDF(format=[160, 120], unit='pt')
+    if manifest:
+        pdf = IncrementalPdfWriter(instance, output_filepath, manifest, object_streams=object_streams)
+    else:
+        pdf = StreamingPdfWriter(instance, output_filepath, object_streams=object_streams)
+    rendered_page_ids = []
+    for game_view in game_views:
+        if manifest and page_digests[str(game_view.page_id)] == manifest['page_digests'].get(str(game_view.page_id)):
+            pdf.skip_page()
+        else:
+            game_view.renderer(pdf)
+            rendered_page_ids.append(game_view.page_id)
+    pdf.close()
+    save_manifest(output_filepath, RENDER_DIGEST, page_digests, pdf)
+    return rendered_page_ids
+
+
+def _use_tmp_path(tmp_path, monkeypatch):
+    'Return the output filepath to use, in tmp_path, where the build manifest is also written'
+    monkeypatch.setattr(incremental_pdf, 'MANIFEST_FILEPATH', str(tmp_path / 'build_manifest.json'))
+    return str(tmp_path / 'undying-dusk.pdf')
@@ -1,7 +1,14 @@
+'''
+Access to the original Heroine Dusk JS game data.
+
+The JS code is only evaluated once, with pyduktape, to build a snapshot of all its global variables,
+as plain Python data stored in a JSON file, that is then loaded by every run as long as the JS sources do not change.
+The mod patches are applied when loading this snapshot, as some of them register CutScenes.
+'''
+import hashlib, json, os
 from functools import lru_cache as cached
-
-# pylint: disable=no-name-in-module, redefined-outer-name
-from pyduktape import DuktapeContext
+from glob import glob
+from os.path import dirname
 
 from .mod import Proxy
 from .mod.hero import patch_avatar, patch_info
@@ -10,155 +17,168 @@ from .mod.world import patch_atlas, patch_tileset
 
 
 REL_RELEASE_DIR = 'heroine-dusk/release/'
+SNAPSHOT_FILEPATH = '.cache/js_snapshot.json'
+SNAPSHOT_VERSION = 1  # to increment when the snapshot format changes
+# JS global name -> (JS files to evaluate, initialization code)
+_JS_CONTEXTS = {
+    'action': (('action.js',), 'action_init()'),
+    'atlas': (('enemy.js', 'atlas.js'), None),  # dependency due to ENEMY_SHADOW_TENDRILS constant
+    'avatar': (('avatar.js',), 'avatar_reset()'),
+    'bitfont': (('bitfont.js',), 'bitfont_init()'),
+    'config': (('config.js',), None),
+    'dialog': (('dialog.js',), None),
+    'enemy': (('power.js', 'enemy.js'), 'enemy_init()'),  # dependency due to ENEMY_POWER_ATTACK constant
+    'info': (('info.js',), 'info_init()'),
+    'mapscript': (('mapscript.js',), None),
+    'minimap': (('minimap.js',), None),
+    'shop': (('shop.js',), None),
+    'tileset': (('tileset.js',), 'tileset_init()'),
+    'treasure': (('treasure.js',), 'treasure_init()'),
+}
+# Serializes all enumerable JS globals, skipping functions & the ones that cannot be converted to JSON:
+_DUMP_GLOBALS_JS = '''(function(global) {
+    var globals = {};
+    Object.keys(global).forEach(function(name) {
+        try {
+            globals[name] = JSON.parse(JSON.stringify(global[name]));
+        } catch (error) {}
+    });
+    return JSON.stringify(globals);
+})(this)'''
+
+
+class JsObject(Proxy):
+    'Undefined attributes are None, as they were with pyduktape.DuktapeContext.get_global and the JS objects it returned'
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return self.get(attr)
 
 
 @cached()
 def action():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/action.js')
-    context.eval_js('action_init()')
-    action = context.get_global('action')
-    class Action:
-        def __getattr__(self, attr):
-            glob = context.get_global(attr)
-            return glob if glob is not None else getattr(action, attr)
-    return Action()
+    return _globals_with_fields_of('action')
 
 
 @cached()
 def atlas():
-    context = DuktapeContext()
-    context.eval_js_file(REL_RELEASE_DIR + 'js/enemy.js')  # dependency due to ENEMY_SHADOW_TENDRILS constant
-    context.eval_js_file(REL_RELEASE_DIR + 'js/atlas.js')
-    atlas = context.get_global('atlas')
-    atlas = patch_atlas(atlas)
     # Commented out as locked doors & skukk piles are placed manually in the mod.
     # for bp in mapscript().bone_piles:
         # atlas.maps[bp.map_id].tiles[bp.y][bp.x] = 16  # skull_pile
     # for ld in mapscript().locked_doors:
         # atlas.maps[ld.map_id].tiles[ld.y][ld.x] = 18  # locked_door
-    return atlas
+    return patch_atlas(_snapshot()['atlas']['atlas'])
 
 
 @cached()
 def avatar():
-    context = DuktapeContext()
-    context.eval_js_file(REL_RELEASE_DIR + 'js/avatar.js')
-    context.eval_js('avatar_reset()')
-    avatar = context.get_global('avatar')
-    return patch_avatar(avatar)
+    return patch_avatar(_snapshot()['avatar']['avatar'])
 
 
 @cached()
 def bitfont():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/bitfont.js')
-    context.eval_js('bitfont_init()')
-    return context.get_global('bitfont')
+    return _snapshot()['bitfont']['bitfont']
 
 
 @cached()
 def config():
-    context = DuktapeContext()
-    context.eval_js_file(REL_RELEASE_DIR + 'js/config.js')
-    return Proxy(VIEW_WIDTH=context.get_global('VIEW_WIDTH'),
-                 VIEW_HEIGHT=context.get_global('VIEW_HEIGHT'))
+    js_globals = _snapshot()['config']
+    return Proxy(VIEW_WIDTH=js_globals['VIEW_WIDTH'], VIEW_HEIGHT=js_globals['VIEW_HEIGHT'])
 
 
 @cached()
 def enemy():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/power.js')  # dependency due to ENEMY_POWER_ATTACK constant
-    context.eval_js_file(REL_RELEASE_DIR + 'js/enemy.js')
-    context.eval_js('enemy_init()')
-    enemy = context.get_global('enemy')
-    class Enemy:
-        def __getattr__(self, attr):
-            glob = context.get_global(attr)
-            return glob if glob is not None else getattr(enemy, attr)
-    return Enemy()
+    return _globals_with_fields_of('enemy')
 
 
 @cached()
 def info():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/info.js')
-    context.eval_js('info_init()')
-    info = patch_info(context.get_global('info'))
-    class Info:
-        def __getattr__(self, attr):
-            glob = context.get_global(attr)
-            return glob if glob is not None else getattr(info, attr)
-    return Info()
+    return _globals_with_fields_of('info', patch_info)
 
 
 @cached()
 def tileset():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/tileset.js')
-    context.eval_js('tileset_init()')
-    return patch_tileset(context.get_global('tileset'))
+    return patch_tileset(_snapshot()['tileset']['tileset'])
 
 
 @cached()
 def treasure():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/treasure.js')
-    context.eval_js('treasure_init()')
-    treasure = context.get_global('treasure')
-    class Treasure:
-        def __getattr__(self, attr):
-            glob = context.get_global(attr)
-            return glob if glob is not None else getattr(treasure, attr)
-    return Treasure()
+    return _globals_with_fields_of('treasure')
 
 
 @cached()
 def dialog():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/dialog.js')
-    class Dialog:
-        def __getattr__(self, attr):
-            return context.get_global(attr)
-    return Dialog()
+    return JsObject(_snapshot()['dialog'])
 
 
 @cached()
 def shop():
-    context = DuktapeContext()
-    context.eval_js_file(REL_RELEASE_DIR + 'js/shop.js')
-    shop = context.get_global('shop')
+    shop_globals = _snapshot()['shop']
+    shops = shop_globals['shop']
     class Shop:
         def __getattr__(self, attr):
-            return context.get_global(attr)
+            return shop_globals.get(attr)
         def __getitem__(self, index):
-            # pylint: disable=unsubscriptable-object
-            return patch_shop(shop[index] if index < len(shop) else None, index)
+            return patch_shop(shops[index] if index < len(shops) else None, index)
     return Shop()
 
 
 @cached()
 def mapscript():
-    context = DuktapeContext()
-    context.eval_js_file(REL_RELEASE_DIR + 'js/mapscript.js')
-    return context.get_global('mapscript')
+    return _snapshot()['mapscript']['mapscript']
 
 
 @cached()
 def minimap():
-    context = DuktapeContext()
-    context.set_globals(Image=context.get_global('Object'))
-    context.eval_js_file(REL_RELEASE_DIR + 'js/minimap.js')
-    minimap = context.get_global('minimap')
-    class Minimap:
-        def __getattr__(self, attr):
-            glob = context.get_global(attr)
-            return glob if glob is not None else getattr(minimap, attr)
-    return Minimap()
+    return _globals_with_fields_of('minimap')
+
+
+def _globals_with_fields_of(name, patch=lambda js_object: js_object):
+    'Replicates the lookup of JS globals first, then of the fields of the JS object with the same name'
+    js_globals = _snapshot()[name]
+    return JsObject({**patch(js_globals[name]), **{key: value for key, value in js_globals.items() if value is not None and key != name}})
+
+
+@cached()
+def _snapshot():
+    key = _snapshot_key()
+    try:
+        with open(SNAPSHOT_FILEPATH, encoding='utf8') as snapshot_file:
+            snapshot = json.load(snapshot_file, object_hook=JsObject)
+        if snapshot['key'] == key:
+            return snapshot['data']
+        print('JS data snapshot is outdated')
+    except FileNotFoundError:
+        pass
+    data = build_snapshot()
+    os.makedirs(dirname(SNAPSHOT_FILEPATH), exist_ok=True)
+    with open(SNAPSHOT_FILEPATH, 'w', encoding='utf8') as snapshot_file:
+        json.dump({'key': key, 'data': data}, snapshot_file)
+    return data
+
+
+def build_snapshot():
+    'Evaluate the JS code, and extract all its global variables'
+    # pyduktape is only required to build the snapshot:
+    # pylint: disable=import-outside-toplevel,no-name-in-module
+    from pyduktape import DuktapeContext
+    print('Building JS data snapshot')
+    data = {}
+    for name, (js_files, init_code) in _JS_CONTEXTS.items():
+        context = DuktapeContext()
+        context.set_globals(Image=context.get_global('Object'))
+        for js_file in js_files:
+            context.eval_js_file(REL_RELEASE_DIR + 'js/' + js_file)
+        if init_code:
+            context.eval_js(init_code)
+        data[name] = json.loads(context.eval_js(_DUMP_GLOBALS_JS), object_hook=JsObject)
+    return data
+
+
+def _snapshot_key():
+    'Digest of everything the snapshot content depends on'
+    digest = hashlib.sha256(str(SNAPSHOT_VERSION).encode())
+    for filepath in sorted(glob(REL_RELEASE_DIR + 'js/*.js')):
+        with open(filepath, 'rb') as src_file:
+            digest.update(src_file.read())
+    return digest.hexdigest()
@@ -0,0 +1,41 @@
+import json, pickle
+
+import pytest
+
+from . import js
+from .js import JsObject, _DUMP_GLOBALS_JS, _snapshot
+
+
+JS_CODE = 'var enemy = {name: "Skeleton", stats: {hp: 7}, powers: [{name: "ATTACK"}]};'
+
+
+def test_snapshot_objects_absent_attributes_are_none(tmp_path, monkeypatch):
+    snapshot_filepath = tmp_path / 'js_snapshot.json'
+    snapshot_filepath.write_text(json.dumps({'key': 'KEY', 'data': {'enemy': {'enemy': {'name': 'Skeleton', 'stats': {'hp': 7}}}}}))
+    monkeypatch.setattr(js, 'SNAPSHOT_FILEPATH', str(snapshot_filepath))
+    monkeypatch.setattr(js, '_snapshot_key', lambda: 'KEY')
+    _snapshot.cache_clear()
+    try:
+        enemy = _snapshot()['enemy']['enemy']
+    finally:
+        _snapshot.cache_clear()
+    assert enemy.stats.hp == 7
+    assert enemy.absent is None
+    assert enemy.stats.absent is None
+    assert getattr(enemy.stats, 'absent', 'default') is None
+    assert pickle.loads(pickle.dumps(enemy)) == enemy
+
+
+def test_snapshot_objects_behave_like_pyduktape_proxies():
+    pyduktape = pytest.importorskip('pyduktape')
+    context = pyduktape.DuktapeContext()
+    context.eval_js(JS_CODE)
+    live_enemy = context.get_global('enemy')
+    snapshot_enemy = json.loads(context.eval_js(_DUMP_GLOBALS_JS), object_hook=JsObject)['enemy']
+    assert snapshot_enemy.name == live_enemy.name
+    assert snapshot_enemy.stats.hp == live_enemy.stats.hp
+    assert snapshot_enemy.powers[0].name == live_enemy.powers[0].name
+    assert snapshot_enemy.absent == live_enemy.absent
+    assert snapshot_enemy.stats.absent == live_enemy.stats.absent
+    assert snapshot_enemy.powers[0].absent == live_enemy.powers[0].absent
+    assert hasattr(snapshot_enemy, 'absent') == hasattr(live_enemy, 'absent')
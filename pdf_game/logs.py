@@ -1,13 +1,18 @@
-from collections import defaultdict
-from queue import LifoQueue
+import atexit, json, os
+from collections import OrderedDict
+from queue import LifoQueue, SimpleQueue
+from threading import Thread
 
 from .entities import GameMilestone, GameMode
 from .js import shop
 from .optional_deps import ansi_wrap
 
 
-ALREADY_LOGGED = defaultdict(list)
+LOG_DEDUP_CACHE_SIZE = 2**16  # max number of (state, message) digests remembered to avoid logging duplicates
+LOG_FILE_BUFFER_SIZE = 2**20
 QUIET_LOGGING = False
+_ALREADY_LOGGED = OrderedDict()  # LRU: (state without facing, message) digest -> None
+_LOG_SINK = None  # set by enable_log_file
 
 
 def quiet_logging():
@@ -15,15 +20,25 @@ def quiet_logging():
     QUIET_LOGGING = True
 
 
+def enable_log_file(filepath, json_lines=False):
+    global _LOG_SINK
+    _LOG_SINK = _LogFileSink(filepath, json_lines)
+    atexit.register(_LOG_SINK.close)
+
+
 def log(game_state, msg, color=None):
     assert msg
     if QUIET_LOGGING:
         return
-    game_state_nofacing = game_state._replace(facing='')
-    if msg in ALREADY_LOGGED[game_state_nofacing]:
+    # Only a compact digest is kept, and the least recently logged ones are evicted:
+    # in the rare event of an eviction or hash collision, a message is logged twice or skipped.
+    digest = hash((game_state._replace(facing=''), msg))
+    if digest in _ALREADY_LOGGED:
+        _ALREADY_LOGGED.move_to_end(digest)
         return
-    if color:
-        msg = ansi_wrap(msg, color=color)
+    _ALREADY_LOGGED[digest] = None
+    if len(_ALREADY_LOGGED) > LOG_DEDUP_CACHE_SIZE:
+        _ALREADY_LOGGED.popitem(last=False)
     progress = (game_state.armor
               + len(game_state.items)
               + len(game_state.hidden_triggers)
@@ -32,8 +47,46 @@ def log(game_state, msg, color=None):
               + len(game_state.triggers_activated)
               + len(game_state.vanquished_enemies)
               + game_state.weapon)
-    print(' ' * progress + msg)
-    ALREADY_LOGGED[game_state_nofacing].append(msg)
+    if _LOG_SINK and _LOG_SINK.pid == os.getpid():  # worker processes (--jobs) print their logs
+        _LOG_SINK.write(game_state, msg, progress)
+    else:
+        print(' ' * progress + (ansi_wrap(msg, color=color) if color else msg))
+
+
+class _LogFileSink:
+    '''
+    Logs are formatted & written by a background thread, in a buffered file,
+    as plain text or as JSON lines.
+    '''
+    def __init__(self, filepath, json_lines):
+        self.pid = os.getpid()
+        self.json_lines = json_lines
+        self._queue = SimpleQueue()
+        self._file = open(filepath, 'w', encoding='utf8', buffering=LOG_FILE_BUFFER_SIZE)  # pylint: disable=consider-using-with
+        self._thread = Thread(target=self._run, name='log-file-sink', daemon=True)
+        self._thread.start()
+
+    def write(self, game_state, msg, progress):
+        self._queue.put((game_state, msg, progress))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        with self._file:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    return
+                game_state, msg, progress = entry
+                if self.json_lines:
+                    self._file.write(json.dumps({'msg': msg, 'progress': progress, 'map_id': game_state.map_id,
+                                                 'x': game_state.x, 'y': game_state.y, 'mode': game_state.mode.name,
+                                                 'last_checkpoint': game_state.last_checkpoint}) + '\n')
+                else:
+                    self._file.write(' ' * progress + msg + '\n')
 
 
 def log_path_to(game_view, actions_only=False, map_as_string=None, stop_at=None, stop_at_cond=None):
@@ -0,0 +1,28 @@
+import json
+
+from . import logs
+from .entities import GameState
+from .logs import enable_log_file, log
+
+
+A_STATE = GameState(map_id=1, x=2, y=3, facing='north')
+
+
+def test_log_dedup_and_json_lines_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs, 'LOG_DEDUP_CACHE_SIZE', 2)
+    monkeypatch.setattr(logs, '_ALREADY_LOGGED', logs.OrderedDict())
+    logs_filepath = tmp_path / 'logs.jsonl'
+    enable_log_file(str(logs_filepath), json_lines=True)
+    try:
+        log(A_STATE, 'a')
+        log(A_STATE._replace(facing='south'), 'a')  # duplicate: facing is ignored
+        log(A_STATE, 'b')
+        log(A_STATE, 'c')  # evicts 'a' from the dedup cache
+        log(A_STATE, 'a')
+    finally:
+        logs._LOG_SINK.close()  # pylint: disable=protected-access
+        monkeypatch.setattr(logs, '_LOG_SINK', None)
+    with open(logs_filepath, encoding='utf8') as logs_file:
+        entries = [json.loads(line) for line in logs_file]
+    assert [entry['msg'] for entry in entries] == ['a', 'b', 'c', 'a']
+    assert entries[0] == {'msg': 'a', 'progress': 0, 'map_id': 1, 'x': 2, 'y': 3, 'mode': 'EXPLORE', 'last_checkpoint': 0}
@@ -1,3 +1,6 @@
+from functools import lru_cache as cached
+from typing import NamedTuple
+
 from .js import atlas, tileset
 from .mod.world import custom_can_move_to
 
@@ -113,18 +116,42 @@ LEFT_TILE_POS_PER_FACING = {
 }
 
 
+class MapIndex(NamedTuple):
+    'Lookup tables built once per map, as movement resolution is performed for every explored state'
+    width: int
+    height: int
+    walkable: tuple  # [y][x] -> bool, ignoring tile overrides
+    exit_per_pos: dict  # (x, y) -> exit
+    shop_per_pos: dict  # (x, y) -> shop
+    @classmethod
+    def new(cls, _map):
+        exit_per_pos, shop_per_pos = {}, {}
+        for _exit in _map.exits:
+            exit_per_pos.setdefault((_exit.exit_x, _exit.exit_y), _exit)
+        for shop in _map.shops:
+            shop_per_pos.setdefault((shop.exit_x, shop.exit_y), shop)
+        walkable = tileset().walkable
+        return cls(width=len(_map.tiles[0]), height=len(_map.tiles),
+                   walkable=tuple(tuple(walkable[tile_id] for tile_id in row) for row in _map.tiles),
+                   exit_per_pos=exit_per_pos, shop_per_pos=shop_per_pos)
+
+
+@cached()
+def _map_index_per_id():
+    # Maps are never altered once loaded, and atlas() is cached, so they can be identified by their id():
+    return {id(_map): MapIndex.new(_map) for _map in atlas().maps}
+
+
+def mazemap_index(_map):
+    return _map_index_per_id()[id(_map)]
+
+
 def mazemap_is_exit(_map, x, y):
-    for _exit in _map.exits:
-        if _exit.exit_x == x and _exit.exit_y == y:
-            return _exit
-    return False
+    return mazemap_index(_map).exit_per_pos.get((x, y), False)
 
 
 def mazemap_is_shop(_map, x, y):
-    for shop in _map.shops:
-        if shop.exit_x == x and shop.exit_y == y:
-            return shop
-    return False
+    return mazemap_index(_map).shop_per_pos.get((x, y), False)
 
 
 def mazemap_get_tile(game_view, map_id=None, x=None, y=None):
@@ -133,7 +160,8 @@ def mazemap_get_tile(game_view, map_id=None, x=None, y=None):
     if x is None and y is None:
         x, y = game_view.state.coords[1:]
     _map = atlas().maps[map_id]
-    if not mazemap_bounds_check(_map, x, y):
+    index = mazemap_index(_map)
+    if not (0 <= y < index.height and 0 <= x < index.width):
         return None
     tile_override = game_view.tile_override((map_id, x, y))
     return tile_override or _map.tiles[y][x]
@@ -186,14 +214,16 @@ def mazemap_facing_from_positions(pos1, pos2):
 def avatar_can_move_to(game_view, map_id, x, y):
     # replicates avatar.js:avatar_move logic:
     _map = atlas().maps[map_id]
-    if not mazemap_bounds_check(_map, x, y):
+    index = mazemap_index(_map)
+    if not (0 <= y < index.height and 0 <= x < index.width):
         return False
     can_move = custom_can_move_to(_map, x, y, game_view.state)
     if can_move is not None:
         return can_move
-    tile_id = mazemap_get_tile(game_view, map_id, x, y)
-    return tileset().walkable[tile_id]
+    tile_override = game_view.tile_override((map_id, x, y))
+    return tileset().walkable[tile_override] if tile_override else index.walkable[y][x]
 
 
 def mazemap_bounds_check(_map, x, y):
-    return 0 <= y < len(_map.tiles) and 0 <= x < len(_map.tiles[0])
+    index = mazemap_index(_map)
+    return 0 <= y < index.height and 0 <= x < index.width
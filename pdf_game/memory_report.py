@@ -0,0 +1,85 @@
+'''
+Memory accounting per build stage, enabled with gen_pdf.py --memory-report.
+
+Every checkpoint records the current & peak RSS, the current & peak memory traced by tracemalloc
+(only with --tracemalloc, as tracing allocations slows down the build),
+and the counts of the objects that make up most of the memory used: GameViews, their GameStates & CombatStates,
+the values held by the GameState fields interning table,
+and the pages buffered by FPDF, with the size of their content streams.
+The report file is rewritten after every checkpoint, so that it is available even if the build gets killed,
+e.g. by running out of memory.
+Counting objects requires to iterate over all the objects tracked by the garbage collector,
+which takes a few seconds on full builds.
+'''
+import gc, json, os, resource, tracemalloc
+from time import perf_counter
+
+from .entities import interned_values_count, GameView
+from .parallel_render import page_contents
+
+
+REPORT_VERSION = 1
+RENDER_CHECKPOINTS_COUNT = 4  # number of checkpoints performed during rendering
+_REPORT_FILEPATH = None  # set by enable_memory_report
+_CHECKPOINTS = []
+_START_TIME = perf_counter()
+
+
+def enable_memory_report(report_filepath, trace_allocations=False):
+    global _REPORT_FILEPATH
+    _REPORT_FILEPATH = report_filepath
+    if trace_allocations:
+        tracemalloc.start()
+
+
+def memory_checkpoint(stage, pdf=None):
+    'pdf must be provided once a FPDF instance has been created, to account for the pages it buffers'
+    if not _REPORT_FILEPATH:
+        return
+    checkpoint = {'stage': stage, 'elapsed_s': round(perf_counter() - _START_TIME, 3),
+                  'rss_mb': _current_rss_mb(), 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        checkpoint.update(tracemalloc_current_mb=current / 1024**2, tracemalloc_peak_mb=peak / 1024**2)
+    checkpoint['counts'] = _objects_counts(pdf)
+    _CHECKPOINTS.append(checkpoint)
+    print(f'Memory checkpoint "{stage}": RSS={checkpoint["rss_mb"]:.0f}MB peak={checkpoint["peak_rss_mb"]:.0f}MB'
+          + ''.join(f' #{name}={count}' for name, count in checkpoint['counts'].items()))
+    tmp_filepath = _REPORT_FILEPATH + '.tmp'
+    with open(tmp_filepath, 'w', encoding='utf8') as report_file:
+        json.dump({'version': REPORT_VERSION, 'checkpoints': _CHECKPOINTS}, report_file, indent=2)
+    os.replace(tmp_filepath, _REPORT_FILEPATH)
+
+
+def with_memory_checkpoints(iterable, total, stage, pdf=None):
+    'Yield all items of iterable, performing RENDER_CHECKPOINTS_COUNT memory checkpoints along the way'
+    interval = max(1, total // RENDER_CHECKPOINTS_COUNT)
+    for i, item in enumerate(iterable, start=1):
+        yield item
+        if _REPORT_FILEPATH and i % interval == 0 and i < total:
+            memory_checkpoint(f'{stage}:{100 * i // total}%', pdf)
+
+
+def _current_rss_mb():
+    'Only available on Linux: the peak RSS is reported on other platforms'
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (FileNotFoundError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _objects_counts(pdf):
+    '''
+    GameStates & CombatStates are NamedTuples, that the garbage collector may stop tracking:
+    they are counted through the GameViews referencing them.
+    '''
+    game_views = [obj for obj in gc.get_objects() if type(obj) is GameView]  # pylint: disable=unidiomatic-typecheck
+    game_states = {id(game_view.state): game_view.state for game_view in game_views if game_view.state}
+    counts = {'GameView': len(game_views), 'GameState': len(game_states),
+              'CombatState': len({id(game_state.combat) for game_state in game_states.values() if game_state.combat}),
+              'interned values': interned_values_count()}
+    if pdf:
+        counts['FPDF pages'] = len(pdf.pages)
+        counts['FPDF pages bytes'] = sum(len(page_contents(pdf, page)) for page in pdf.pages)
+    return counts
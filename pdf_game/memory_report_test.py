@@ -0,0 +1,24 @@
+import json
+
+from . import memory_report
+from .entities import GameState, GameView
+from .memory_report import enable_memory_report, memory_checkpoint, with_memory_checkpoints
+
+
+def test_memory_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_report, '_CHECKPOINTS', [])
+    report_filepath = str(tmp_path / 'memory_report.json')
+    enable_memory_report(report_filepath)
+    try:
+        state = GameState(map_id=1, x=2, y=3, facing='north')
+        game_views = [GameView(state), GameView(state._replace(gold=1))]
+        memory_checkpoint('explore')
+        assert list(with_memory_checkpoints(game_views, len(game_views), 'render')) == game_views
+    finally:
+        monkeypatch.setattr(memory_report, '_REPORT_FILEPATH', None)
+    with open(report_filepath, encoding='utf8') as report_file:
+        report = json.load(report_file)
+    assert [checkpoint['stage'] for checkpoint in report['checkpoints']] == ['explore', 'render:50%']
+    assert report['checkpoints'][0]['counts']['GameView'] >= 2
+    assert report['checkpoints'][0]['counts']['GameState'] >= 2
+    assert report['checkpoints'][0]['rss_mb'] > 0
@@ -0,0 +1,113 @@
+'''
+Parallel states exploration.
+
+As every checkpoint must be reachable through a unique path,
+the game segments inbetween checkpoints can be explored independently,
+once the GameStates they start from are known.
+Worker processes are speculatively started from the checkpoints states found during a previous run,
+and their results are merged only if those states are confirmed by the exploration of the previous segment.
+Otherwise the segment is explored by the main process.
+
+All worker processes are forked when the pool is created, before the main process starts exploring:
+they all start from the same state, whatever the exploration progress is.
+As workers are then reused for several segments, every task resets the process-wide state it altered.
+'''
+import io, multiprocessing, os
+from os.path import exists, join
+
+from .entities import clear_interned_values, GameView
+from .serializer import dump_views, load_views, relink_post_defeat_views
+
+
+CHECKPOINTS_CACHE_DIR = '.cache/checkpoints'
+_EXPLORE_SEGMENT = None  # set before forking worker processes
+
+
+def iterate_segments_in_parallel(checkpoints_count, initial_views, game_view_per_state, explore_segment, jobs):
+    '''
+    Yield (game_views, checkpoint_game_views) for every segment, in order.
+    explore_segment(i, start_views, game_view_per_state) must explore the segment leading to the i+1-th checkpoint.
+    '''
+    global _EXPLORE_SEGMENT
+    _EXPLORE_SEGMENT = explore_segment
+    # Workers are never replaced: none is forked later on by the pool handler thread,
+    # while the main process is exploring & mutating global state:
+    with multiprocessing.get_context('fork').Pool(jobs) as pool:
+        speculative_results = {}
+        for i in range(1, checkpoints_count):
+            start_dump = _read_cached_start(i)
+            if start_dump:
+                speculative_results[i] = start_dump, pool.apply_async(_explore_segment_worker, (i, start_dump))
+        print(f'{len(speculative_results)} segments are being speculatively explored by {jobs} worker processes')
+        start_views, start_dump = initial_views, None
+        for i in range(checkpoints_count):
+            start_dump_used, async_result = speculative_results.pop(i, (None, None))
+            if async_result and start_dump_used == start_dump:
+                game_views, checkpoint_game_views = _merge_segment(async_result.get(), start_views, game_view_per_state)
+            else:
+                if async_result:
+                    print(f'Checkpoint {i}: cached states are outdated, discarding speculative exploration')
+                game_views, checkpoint_game_views = explore_segment(i, start_views, game_view_per_state)
+            if checkpoint_game_views and i + 1 < checkpoints_count:
+                start_dump = _dump_start(checkpoint_game_views, game_view_per_state)
+                _write_cached_start(i + 1, start_dump)
+            yield game_views, checkpoint_game_views
+            start_views = checkpoint_game_views
+
+
+def _explore_segment_worker(i, start_dump):
+    start_states, entries = load_views(io.BytesIO(start_dump))
+    start_views = [GameView(state) for state in start_states]  # without any .src_view
+    game_view_per_state = {state: start_views[index] for state, index in entries}
+    game_views, checkpoint_game_views = _EXPLORE_SEGMENT(i, start_views, game_view_per_state)
+    clear_interned_values()  # the next segment explored by this worker starts from an empty table
+    out = io.BytesIO()
+    try:
+        dump_views(out, (list(game_views), checkpoint_game_views,
+                         [start_view.actions for start_view in start_views], game_view_per_state),
+                   external_views=start_views)
+    finally:
+        _reset_post_defeat_views(game_views)
+    return out.getvalue()
+
+
+def _merge_segment(result_dump, start_views, game_view_per_state):
+    game_views, checkpoint_game_views, start_views_actions, worker_game_view_per_state = load_views(io.BytesIO(result_dump), external_views=start_views)
+    for start_view, actions in zip(start_views, start_views_actions):
+        assert not start_view.actions, f'Segment start view already explored: {start_view}'
+        start_view.actions, start_view.freeze_state = actions, True
+    game_view_per_state.update(worker_game_view_per_state)
+    # The post-defeat views the main process already has are dropped, the other ones are linked:
+    return list(relink_post_defeat_views(game_views)), checkpoint_game_views
+
+
+def _reset_post_defeat_views(game_views):
+    'So that the next segment explored by this worker creates its own post-defeat views, cf. iterate_game_views'
+    for game_view in game_views:
+        if game_view.renderer and not game_view.state and getattr(game_view.renderer, 'game_view', None) is game_view:
+            del game_view.renderer.game_view
+
+
+def _dump_start(start_views, game_view_per_state):
+    'The start views are serialized along with all the GameStates that point to them in game_view_per_state'
+    index_per_view_id = {id(gv): i for i, gv in enumerate(start_views)}
+    entries = [(state, index_per_view_id[id(gv)]) for state, gv in game_view_per_state.items() if id(gv) in index_per_view_id]
+    out = io.BytesIO()
+    dump_views(out, (tuple(gv.state for gv in start_views), entries))
+    return out.getvalue()
+
+
+def _read_cached_start(i):
+    filepath = join(CHECKPOINTS_CACHE_DIR, f'{i}.pickle')
+    if not exists(filepath):
+        return None
+    with open(filepath, 'rb') as cache_file:
+        return cache_file.read()
+
+
+def _write_cached_start(i, start_dump):
+    if _read_cached_start(i) == start_dump:
+        return
+    os.makedirs(CHECKPOINTS_CACHE_DIR, exist_ok=True)
+    with open(join(CHECKPOINTS_CACHE_DIR, f'{i}.pickle'), 'wb') as cache_file:
+        cache_file.write(start_dump)
@@ -0,0 +1,66 @@
+'''
+Parallel pages rendering.
+
+Once page ids have been assigned, pages can be rendered independently:
+worker processes render contiguous ranges of GameViews in their own FPDF instance,
+only recording links instead of adding them, and send back the content stream of every page.
+The main process then appends those pages to the final document, in order,
+remapping images names to its own images table, and adds the links.
+'''
+import multiprocessing, re
+
+from .render_utils import add_link, get_image_info, LinksRecorder
+
+
+SHARD_SIZE = 1000  # number of GameViews rendered by a worker process per task
+_IMAGE_DO_REGEX = re.compile(rb'/I(\d+) Do')
+_SHARD = None  # (game_views, new_pdf, render_view) - set before forking worker processes
+
+
+def render_pages_in_parallel(pdf, game_views, new_pdf, render_view, jobs):
+    '''
+    Render all game_views into pdf, yielding after every page added.
+    new_pdf() must return a FPDF instance configured like pdf,
+    and render_view(pdf, game_view) must render a GameView page in it.
+    '''
+    global _SHARD
+    _SHARD = (game_views, new_pdf, render_view)
+    ranges = [(start, min(start + SHARD_SIZE, len(game_views))) for start in range(0, len(game_views), SHARD_SIZE)]
+    with multiprocessing.get_context('fork').Pool(jobs) as pool:
+        for pages, image_index_per_name in pool.imap(_render_shard_worker, ranges):
+            rename_image = _image_renamer(pdf, image_index_per_name)
+            for contents, links in pages:
+                pdf.add_page()
+                page_contents(pdf, pdf.page)[:] = _IMAGE_DO_REGEX.sub(rename_image, contents)
+                for x, y, width, height, (link_type, target), link_alt in links:
+                    if link_type == 'page':
+                        add_link(pdf, x, y, width, height, page_id=target, link_alt=link_alt)
+                    else:  # URL, or link created by the main process, e.g. links_to_credits
+                        pdf.link(x, y, width, height, target, link_alt)
+                yield
+
+
+def page_contents(pdf, page):
+    'Return the mutable content stream buffer of a page, for all the fpdf2 versions supported'
+    page = pdf.pages[page]
+    return page['content'] if isinstance(page, dict) else page.contents
+
+
+def _image_renamer(pdf, image_index_per_name):
+    'Images indices are specific to every FPDF instance, and are used to name them in content streams'
+    new_index = {str(index).encode(): str(get_image_info(pdf, name)['i']).encode()
+                 for name, index in image_index_per_name.items()}
+    return lambda match: b'/I' + new_index[match.group(1)] + b' Do'
+
+
+def _render_shard_worker(views_range):
+    game_views, new_pdf, render_view = _SHARD
+    shard_pdf = LinksRecorder(new_pdf())
+    for game_view in game_views[slice(*views_range)]:
+        render_view(shard_pdf, game_view)
+    pdf = shard_pdf.instance
+    assert not pdf._drawing_graphics_state_registry, "No /ExtGState are needed in Undying Dusk"  # pylint: disable=protected-access
+    pages = [(bytes(page_contents(pdf, page)),
+              [(x, y, w, h, shard_pdf.link_target(link), alt_text) for x, y, w, h, link, alt_text in shard_pdf.links_per_page[page]])
+             for page in range(1, pdf.page + 1)]
+    return pages, {name: info['i'] for name, info in pdf.images.items()}
@@ -1,66 +1,199 @@
-import resource, tracemalloc
+'''
+Hierarchical profiling of the build pipeline.
+
+Spans are nested: a span named "bitfont" entered inside the "render" span is recorded under the path "render/bitfont".
+For every path, durations are aggregated in a streaming Histogram, that uses a constant amount of memory,
+whatever the number of calls.
+The first TRACE_EVENTS_PER_PATH spans of every path are also kept as Chrome trace events,
+that can be loaded in chrome://tracing or https://ui.perfetto.dev
+
+Note that spans entered in worker processes (--jobs) are not recorded.
+'''
+import json, math, resource, tracemalloc
 from collections import defaultdict
-from contextlib import contextmanager
-from time import perf_counter
-from types import SimpleNamespace
-
-
-_EXEC_TIMES_MS = defaultdict(list)
-_DISABLE_TRACING = False
-
-
-@contextmanager
-def disable_tracing():
-    global _DISABLE_TRACING
-    _DISABLE_TRACING = True
-    yield
-    _DISABLE_TRACING = False
-
-
-@contextmanager
-def trace_time(global_key=None, timings_in_ms=None):
-    if _DISABLE_TRACING:
-        yield
-        return
-    trace = SimpleNamespace() if (timings_in_ms is None and not global_key) else None  # do not create object if not needed
-    start = perf_counter()
-    yield trace
-    duration = perf_counter() - start
-    if global_key:
-        _EXEC_TIMES_MS[global_key].append(duration * 1000)
-    elif timings_in_ms is None:
-        trace.time = duration
-    else:
-        timings_in_ms.append(duration * 1000)
+from time import perf_counter, perf_counter_ns
+
+
+TRACE_EVENTS_PER_PATH = 1000
+PERF_STATS_VERSION = 1  # to increment when the format of the summary exported by export_perf_stats changes
+_BUCKET_LOG_BASE = math.log(1.05)  # histograms buckets bounds grow by 5%: percentiles have a relative error under 2.5%
+_HISTOGRAMS = {}  # span path -> Histogram
+_SPAN_PATHS = {}  # (parent path, name) -> path
+_SPAN_STACK = []  # paths of the spans currently entered
+_TRACE_EVENTS = []  # (path, start, duration)
+_START_TIME = perf_counter()
+
+
+class Histogram:
+    'Streaming histogram of durations in seconds'
+    __slots__ = ('count', 'total', 'max', '_buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.max = 0.
+        self._buckets = defaultdict(int)  # bucket index -> count
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self._buckets[int(math.log(duration * 1e9 + 1) / _BUCKET_LOG_BASE)] += 1
+
+    def percentile(self, percent):
+        rank, count = math.ceil(self.count * percent / 100), 0
+        for bucket in sorted(self._buckets):
+            count += self._buckets[bucket]
+            if count >= rank:
+                return min((math.exp((bucket + .5) * _BUCKET_LOG_BASE) - 1) / 1e9, self.max)
+        return self.max
+
+    def as_dict(self):
+        'Durations are in milliseconds'
+        return {'count': self.count, 'total_ms': self.total * 1000, 'p50_ms': self.percentile(50) * 1000,
+                'p99_ms': self.percentile(99) * 1000, 'max_ms': self.max * 1000}
+
+
+class trace_time:  # pylint: disable=invalid-name
+    '''
+    Context manager timing a span: its duration is then available as .time, in seconds.
+    Named spans are recorded in the global histograms, under their path,
+    and anonymous ones in the provided histogram, if any.
+    '''
+    __slots__ = ('name', 'histogram', 'path', 'start', 'time')
+
+    def __init__(self, name=None, histogram=None):
+        self.name = name
+        self.histogram = histogram
+        self.path = self.start = self.time = None
+
+    def __enter__(self):
+        if self.name:
+            parent_path = _SPAN_STACK[-1] if _SPAN_STACK else None
+            self.path = _SPAN_PATHS.get((parent_path, self.name))
+            if not self.path:
+                self.path = _SPAN_PATHS[(parent_path, self.name)] = f'{parent_path}/{self.name}' if parent_path else self.name
+                _HISTOGRAMS.setdefault(self.path, Histogram())
+            _SPAN_STACK.append(self.path)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.time = perf_counter() - self.start
+        if self.path:
+            _SPAN_STACK.pop()
+            histogram = _HISTOGRAMS[self.path]
+            histogram.add(self.time)
+            if histogram.count <= TRACE_EVENTS_PER_PATH:
+                _TRACE_EVENTS.append((self.path, self.start, self.time))
+        elif self.histogram:
+            self.histogram.add(self.time)
 
 
 # pylint: disable=dangerous-default-value
-def print_perf_stats(header='Stage', timings_in_ms_per_stage=_EXEC_TIMES_MS):
-    print(f'{header:<25} | Total exec time (ms) | #execs')
-    print('--------------------------|----------------------|-------')
-    for stage, timings_in_ms in sorted(timings_in_ms_per_stage.items()):
-        count, total = len(timings_in_ms), sum(timings_in_ms)
-        print(f'{stage:>25} | {total:>20.2f} | {count}')
+def print_perf_stats(header='Span', histograms=_HISTOGRAMS):
+    'Spans are listed as a tree, children being indented below their parent, in the order they were first entered'
+    print(f'{header:<40} | Total exec time (ms) |   #execs | p50 (ms) | p99 (ms) | max (ms)')
+    print('-----------------------------------------|----------------------|----------|----------|----------|---------')
+    order = {path: i for i, path in enumerate(histograms)}
+    def tree_order(path):
+        parts = path.split('/')
+        return tuple(order.get('/'.join(parts[:depth]), -1) for depth in range(1, len(parts) + 1))
+    for path in sorted(histograms, key=tree_order):
+        label = '  ' * path.count('/') + path.rsplit('/', 1)[-1]
+        stats = histograms[path].as_dict()
+        print(f'{label:<40} | {stats["total_ms"]:>20.2f} | {stats["count"]:>8} | {stats["p50_ms"]:>8.3f} | {stats["p99_ms"]:>8.3f} | {stats["max_ms"]:>8.3f}')
+
+
+def perf_stats():
+    'Return the statistics of every span path, as dicts'
+    return {path: histogram.as_dict() for path, histogram in _HISTOGRAMS.items()}
+
+
+def export_perf_stats(summary_filepath=None, chrome_trace_filepath=None):
+    'Export the histograms of all spans as a JSON summary, and the recorded trace events in the Chrome trace format'
+    if summary_filepath:
+        with open(summary_filepath, 'w', encoding='utf8') as summary_file:
+            json.dump({'version': PERF_STATS_VERSION, 'spans': perf_stats()}, summary_file, indent=2)
+    if chrome_trace_filepath:
+        events = [{'name': path.rsplit('/', 1)[-1], 'cat': path, 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': round((start - _START_TIME) * 1e6, 3), 'dur': round(duration * 1e6, 3)}
+                  for path, start, duration in sorted(_TRACE_EVENTS, key=lambda event: event[1])]
+        with open(chrome_trace_filepath, 'w', encoding='utf8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
 
 
 class PerfsMonitorWrapper:
-    'Measure execution times of all method calls performed on a given class instance'
-    def __init__(self, instance):
+    '''
+    Measure execution times of all method calls performed on a given class instance.
+    Instrumented methods are bound once, on first access, so that next accesses do not go through __getattr__.
+    With sample_every=N, only 1 call in N is timed, starting with the first one so that every method called is reported,
+    and total durations are extrapolated from those samples.
+    '''
+    def __init__(self, instance, sample_every=1):
+        assert sample_every >= 1, f'Invalid sampling: 1 call in {sample_every}'
         self.instance = instance
-        self.timings_in_ms_per_method = defaultdict(list)
+        self.sample_every = sample_every
+        self.stats_per_method = {}  # method name -> [calls count, timed calls count, timed calls total duration in ns]
 
     def __getattr__(self, name):
         attr = getattr(self.instance, name)
         if not callable(attr):
             return attr
-        def wrapper(*args, **kwargs):
-            with trace_time(timings_in_ms=self.timings_in_ms_per_method[name]):
-                return attr(*args, **kwargs)
+        wrapper = self.__dict__[name] = self._instrument(attr, self.stats_per_method.setdefault(name, [0, 0, 0]))
+        return wrapper
+
+    def _instrument(self, method, stats):
+        sample_every = self.sample_every
+        if sample_every == 1:
+            def wrapper(*args, **kwargs):
+                start = perf_counter_ns()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stats[2] += perf_counter_ns() - start
+                    stats[0] += 1
+                    stats[1] += 1
+        else:
+            def wrapper(*args, **kwargs):
+                stats[0] += 1
+                if stats[0] % sample_every != 1:
+                    return method(*args, **kwargs)
+                start = perf_counter_ns()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stats[2] += perf_counter_ns() - start
+                    stats[1] += 1
         return wrapper
 
+    def measure_overhead(self, calls=100000):
+        'Return the average duration in ns added by the monitoring to a method call'
+        def noop(): pass
+        wrapper = self._instrument(noop, [0, 0, 0])
+        start = perf_counter_ns()
+        for _ in range(calls):
+            noop()
+        bare_duration = perf_counter_ns() - start
+        start = perf_counter_ns()
+        for _ in range(calls):
+            wrapper()
+        return max(0, perf_counter_ns() - start - bare_duration) / calls
+
     def print_perf_stats(self):
-        print(f'Perf stats of all calls made to {self.instance.__class__.__name__} methods:')
-        print_perf_stats('Method name', self.timings_in_ms_per_method)
+        print(f'Perf stats of all calls made to {self.instance.__class__.__name__} methods'
+              + (f' (1 call in {self.sample_every} timed):' if self.sample_every > 1 else ':'))
+        print(f'{"Method name":<25} | Total exec time (ms) |   #calls | Mean (µs)')
+        print('--------------------------|----------------------|----------|----------')
+        total_ms, total_calls = 0, 0
+        for name, (calls, timed_calls, timed_ns) in sorted(self.stats_per_method.items()):
+            if not timed_calls:
+                continue
+            method_total_ms = timed_ns / timed_calls * calls / 1e6
+            total_ms += method_total_ms
+            total_calls += calls
+            print(f'{name:>25} | {method_total_ms:>20.2f} | {calls:>8} | {timed_ns / timed_calls / 1000:>9.2f}')
+        overhead_ms = self.measure_overhead() * total_calls / 1e6
+        print(f'Estimated monitoring overhead: {overhead_ms:.2f}ms ({overhead_ms / max(total_ms, 1e-9):.1%} of the measured time)')
 
 
 def print_memory_stats(detailed=False):
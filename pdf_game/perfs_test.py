@@ -0,0 +1,48 @@
+import json
+
+from .perfs import export_perf_stats, trace_time, Histogram, PerfsMonitorWrapper
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(1, 1001):
+        histogram.add(i / 1000)
+    assert histogram.count == 1000
+    assert abs(histogram.total - 500.5) < 1e-6
+    assert histogram.max == 1
+    assert abs(histogram.percentile(50) - .5) < .5 * .025
+    assert abs(histogram.percentile(99) - .99) < .99 * .025
+
+
+def test_nested_spans_export(tmp_path):
+    with trace_time('test-stage') as stage:
+        for _ in range(3):
+            with trace_time('test-step'):
+                pass
+    assert stage.time > 0
+    summary_filepath, chrome_trace_filepath = tmp_path / 'summary.json', tmp_path / 'trace.json'
+    export_perf_stats(summary_filepath, chrome_trace_filepath)
+    spans = json.loads(summary_filepath.read_text())['spans']
+    assert spans['test-stage']['count'] == 1
+    assert spans['test-stage/test-step']['count'] == 3
+    events = json.loads(chrome_trace_filepath.read_text())['traceEvents']
+    assert sum(event['cat'] == 'test-stage/test-step' for event in events) == 3
+
+
+def test_perfs_monitor_wrapper_sampling(capsys):
+    class Instance:
+        value = 42
+        def double(self, number):
+            return 2 * number
+        def close(self):
+            pass
+    pdf = PerfsMonitorWrapper(Instance(), sample_every=3)
+    assert [pdf.double(i) for i in range(10)] == [2 * i for i in range(10)]
+    pdf.close()
+    assert pdf.value == 42
+    assert 'double' in vars(pdf)  # the instrumented method is only bound once
+    assert pdf.stats_per_method['double'][:2] == [10, 4]  # calls #1, #4, #7 & #10 are timed
+    assert pdf.stats_per_method['close'][:2] == [1, 1]  # methods called less than sample_every times are timed too
+    assert pdf.measure_overhead(calls=1000) >= 0
+    pdf.print_perf_stats()
+    assert '    close | ' in capsys.readouterr().out
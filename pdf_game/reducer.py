@@ -2,88 +2,183 @@
 An optimizer to reduce the GameViews by identifying the ones that will end up
 being rendered exactly the same, including the links.
 In practice, this only applies to Game Over death pages, and pages pointing to them.
+
+Pages are compared through a "render key", derived from the GameState fields that are used to render them,
+and from the page IDs they link to.
+compute_fingerprint, that performs a fake rendering of the page, is the reference implementation of this comparison.
+
+As links make this comparison recursive, the coarsest grouping of identical pages is computed
+in a single pass, as the minimization of a DFA whose states are the GameViews, and whose transitions are the links:
+this is Hopcroft's partition refinement algorithm, running in O(m log n) for n views & m links.
 '''
 import os
 from contextlib import contextmanager
 from textwrap import indent
 
-from .assigner import assign_page_ids
-from .entities import GameMilestone
+from .entities import GameMilestone, GameMode
 from .optional_deps import tqdm
-from .perfs import disable_tracing, print_memory_stats
-from .render import render_page
+from .perfs import print_memory_stats
+from .render import mazemap_layers, render_page
+from .render_minimap import minimap_render_key
 
 
 def reduce_views(game_views, print_reduced_views=False):
-    print('Starting views reducer: 1st, assigning page IDs')
-    fake_pdf = FakePdfRecorder()
-    pass_number, total_views_removed = 1, 0
-    # We need to assign page IDs in order to detect pages with identical links:
-    game_views = assign_page_ids(game_views, assign_special_pages=False)
-    fingerprinted_pages = build_fingerprinted_pages(fake_pdf, game_views)
-    while True:
-        print(f'Pass {pass_number} - #views removed so far: {total_views_removed}')
-        gv_per_page_fingerprint, filtered_fp_pages = {}, []
-        print_memory_stats()  # Per safety, this function used to eat up memory
-        for fp_page in tqdm(fingerprinted_pages, disable='NO_TQDM' in os.environ):
-            existing_matching_gv = gv_per_page_fingerprint.get(fp_page.fingerprint)
-            # 2nd condition ensures checkpoints are preserved: removing it would break nothing though.
-            # 3rd condition ensures we don't alter secrets_cound in the process.
-            if existing_matching_gv and (not fp_page.game_view.state or fp_page.game_view.state.milestone != GameMilestone.CHECKPOINT) and (not fp_page.game_view.state or fp_page.game_view.state.secrets_found == existing_matching_gv.state.secrets_found):
-                assert fp_page.game_view.page_id != existing_matching_gv.page_id, f'Infinite loop detected in reducer!\n{fp_page.game_view}\n{existing_matching_gv}'
-                if print_reduced_views:
-                    gs = fp_page.game_view.state
-                    print('- reducer.removes:', f'{gs.coords}/{gs.facing} HP={gs.hp} round={gs.combat and gs.combat.round}')
-                    gs = existing_matching_gv.state
-                    print('  identical to:   ', f'{gs.coords}/{gs.facing} HP={gs.hp} round={gs.combat and gs.combat.round}')
-                    print('  differing:   \n' + indent(fp_page.game_view.state.differing(existing_matching_gv.state), '    '), end='')
-                total_views_removed += 1
-                fp_page.game_view.page_id_from(existing_matching_gv)
-                for incoming_fp_page in fp_page.incoming_pages:
-                    incoming_fp_page.fingerprint = compute_fingerprint(fake_pdf, incoming_fp_page.game_view)
-            else:
-                gv_per_page_fingerprint[fp_page.fingerprint] = fp_page.game_view
-                filtered_fp_pages.append(fp_page)
-        pass_number += 1
-        no_views_removed = len(fingerprinted_pages) == len(filtered_fp_pages)
-        fingerprinted_pages = filtered_fp_pages
-        if no_views_removed:
-            break
+    print('Starting views reducer: 1st, computing render keys')
+    block_of_state, successors = _initial_partition(game_views)
+    print('Refining partition of views')
+    block_of_state = _refine_partition(block_of_state, successors)
+    print_memory_stats()
+    # Every block is replaced by its first GameView, unless it contains a checkpoint, that must be preserved:
+    representative_per_block = {}
+    for index, game_view in enumerate(game_views):
+        block = block_of_state[index]
+        if block not in representative_per_block or (game_view.state and game_view.state.milestone == GameMilestone.CHECKPOINT):
+            representative_per_block[block] = game_view
+    reduced_game_views = []
+    for index, game_view in enumerate(game_views):
+        representative = representative_per_block[block_of_state[index]]
+        if representative is game_view:
+            reduced_game_views.append(game_view)
+            continue
+        if print_reduced_views and game_view.state:
+            gs = game_view.state
+            print('- reducer.removes:', f'{gs.coords}/{gs.facing} HP={gs.hp} round={gs.combat and gs.combat.round}')
+            gs = representative.state
+            print('  identical to:   ', f'{gs.coords}/{gs.facing} HP={gs.hp} round={gs.combat and gs.combat.round}')
+            print('  differing:   \n' + indent(game_view.state.differing(representative.state), '    '), end='')
+        game_view.page_id_from(representative)
+    total_views_removed = len(game_views) - len(reduced_game_views)
     print(f'-{100*total_views_removed/len(game_views):.1f}% of views were removed by the reducer')
-    return [fp_page.game_view for fp_page in fingerprinted_pages]
-
-
-def build_fingerprinted_pages(fake_pdf, game_views):
-    print('FingerprintedPages build step 1/2: initialization')
-    fp_pages = []
+    return reduced_game_views
+
+
+def _initial_partition(game_views):
+    '''
+    Group views by render key, without the page IDs they link to.
+    States are the indices of game_views, followed by a sink state for missing links (None),
+    and by any linked GameView that is not part of game_views.
+    Return a list of blocks numbers per state, and the list of successors states per state.
+    '''
+    state_per_gv_id = {id(game_view): index for index, game_view in enumerate(game_views)}
+    sink_state = len(game_views)
+    block_per_label, block_of_state, successors = {}, [], []
+    checkpoints_count_per_label = {}
+    def state_of(game_view):
+        if game_view is None:
+            return sink_state
+        if id(game_view) not in state_per_gv_id:  # view not being reduced: it must keep its own page
+            state_per_gv_id[id(game_view)] = len(state_per_gv_id) + 1
+            extra_views.append(game_view)
+        return state_per_gv_id[id(game_view)]
+    extra_views = []
     for game_view in tqdm(game_views, disable='NO_TQDM' in os.environ):
-        fp_pages.append(FingerprintedPage(fake_pdf, game_view))
-    print('FingerprintedPages build step 2/2: setting .incoming_pages')
-    fp_pages_per_page_id = {fp_page.game_view.page_id: fp_page for fp_page in fp_pages}
-    for fp_page in tqdm(fp_pages, disable='NO_TQDM' in os.environ):
-        for game_view in fp_page.game_view.actions.values():
-            if game_view:
-                fp_pages_per_page_id[game_view.page_id].incoming_pages.append(fp_page)
-    return fp_pages
-
-
-class FingerprintedPage:
-    def __init__(self, fake_pdf, game_view):
-        self.game_view = game_view
-        self.fingerprint = compute_fingerprint(fake_pdf, game_view)
-        self.incoming_pages = []  # FingerprintedPages
+        key, linked_game_views = render_key_parts(game_view)
+        label = (key, game_view.state and game_view.state.secrets_found)
+        if game_view.state and game_view.state.milestone == GameMilestone.CHECKPOINT:
+            # Each block can contain at most one checkpoint, that will represent it:
+            checkpoints_count = checkpoints_count_per_label.get(label, 0)
+            checkpoints_count_per_label[label] = checkpoints_count + 1
+            label += (checkpoints_count,)
+        block_of_state.append(block_per_label.setdefault(label, len(block_per_label)))
+        successors.append(tuple(state_of(linked_game_view) for linked_game_view in linked_game_views))
+    for _ in range(len(extra_views) + 1):  # sink state & extra views are all distinct
+        block_of_state.append(len(block_per_label) + len(block_of_state) - len(game_views))
+        successors.append(())
+    return block_of_state, successors
+
+
+def _refine_partition(block_of_state, successors):
+    '''
+    Hopcroft's algorithm: split blocks until all states of every block have their i-th successors in the same block, for every i.
+    Return the refined list of blocks numbers per state.
+    '''
+    blocks = []
+    for state, block in enumerate(block_of_state):
+        while block >= len(blocks):
+            blocks.append(set())
+        blocks[block].add(state)
+    letters_count = max(map(len, successors), default=0)
+    # predecessors[letter][state] = states whose letter-th successor is state:
+    predecessors = [{} for _ in range(letters_count)]
+    for state, next_states in enumerate(successors):
+        for letter, next_state in enumerate(next_states):
+            predecessors[letter].setdefault(next_state, []).append(state)
+    worklist = [(block, letter) for block in range(len(blocks)) for letter in range(letters_count)]
+    in_worklist = set(worklist)
+    while worklist:
+        splitter = worklist.pop()
+        in_worklist.remove(splitter)
+        splitter_block, splitter_letter = splitter
+        preds = predecessors[splitter_letter]
+        touched_per_block = {}
+        for state in tuple(blocks[splitter_block]):
+            for pred_state in preds.get(state, ()):
+                touched_per_block.setdefault(block_of_state[pred_state], []).append(pred_state)
+        for block, touched_states in touched_per_block.items():
+            if len(touched_states) == len(blocks[block]):
+                continue
+            new_block = len(blocks)
+            blocks.append(set(touched_states))
+            blocks[block].difference_update(touched_states)
+            for state in touched_states:
+                block_of_state[state] = new_block
+            smaller_block = new_block if len(blocks[new_block]) <= len(blocks[block]) else block
+            for letter in range(letters_count):
+                splitter = (smaller_block, letter) if (block, letter) not in in_worklist else (new_block, letter)
+                if splitter not in in_worklist:
+                    worklist.append(splitter)
+                    in_worklist.add(splitter)
+    return block_of_state
 
 
 def compute_fingerprint(fake_pdf, game_view):
     fake_pdf.reset()
-    with disable_tracing():  # avoids perfs._EXEC_TIMES_MS eating memory
-        render_page(fake_pdf, game_view, render_victory_noop)
+    render_page(fake_pdf, game_view, render_victory_noop)
     return fake_pdf.get_fingerprint()
 
 
 def render_victory_noop(*_): pass
 
 
+def compute_render_key(game_view):
+    '''
+    Two GameViews have equal render keys if compute_fingerprint would render them the same way.
+    It mirrors render.render_page, without rendering anything.
+    Custom renderers & extra_render callables are compared by identity.
+    '''
+    key, linked_game_views = render_key_parts(game_view)
+    return key, tuple(linked_game_view and linked_game_view.page_id for linked_game_view in linked_game_views)
+
+
+def render_key_parts(game_view):
+    'Return the render key of a GameView, without the page IDs it links to, and the sequence of GameViews it links to'
+    if game_view.renderer:
+        return game_view.renderer, ()
+    game_state = game_view.state
+    if game_state.milestone == GameMilestone.VICTORY:
+        return GameMilestone.VICTORY, ()  # cf. render_victory_noop
+    action_names = tuple(game_view.actions.keys())
+    linked_game_views = tuple(game_view.actions.values())
+    if game_state.mode == GameMode.DIALOG:  # dialog options may depend on any field
+        return (game_state._replace(fixed_id=0, reverse_id=False, last_checkpoint=0), action_names), linked_game_views
+    key = (game_state.mode, game_state.hp <= game_state.max_hp/3, mazemap_layers(game_view), game_state.combat, game_state.sfx,
+           game_state.extra_render, game_state.message, game_state.msg_place, game_state.music, game_state.music_btn_pos,
+           game_state.treasure_id, game_state.book, action_names)
+    if game_state.combat:
+        key += (game_state.hp, game_state.max_hp, game_state.mp, game_state.max_mp)
+        post_defeat = game_state.combat.enemy.post_defeat
+        if post_defeat and game_state.hp <= 0:
+            linked_game_views += (post_defeat.game_view,)
+    if game_state.mode == GameMode.INFO:
+        key += (game_state.hp, game_state.max_hp, game_state.mp, game_state.max_mp, game_state.gold,
+                game_state.armor, game_state.weapon, game_state.spellbook, game_state.items, minimap_render_key(game_view))
+    elif 'THROW-COIN' in game_view.actions:
+        key += (game_state.gold,)
+    if game_state.mode in (GameMode.EXPLORE, GameMode.INFO):
+        key += (game_state.bonus_atk,)
+    return key, linked_game_views
+
+
 class FakePdfRecorder:
     'Fake fpdf.FPDF class that must implement all the methods used during the pages rendering'
     def __init__(self):
@@ -1,6 +1,7 @@
+from .assigner import assign_page_ids
 from .bitfont import bitfont_render
 from .entities import GameMilestone, GameMode, GameView
-from .reducer import compute_fingerprint, reduce_views, FakePdfRecorder
+from .reducer import compute_fingerprint, compute_render_key, reduce_views, FakePdfRecorder
 from .visit import build_initial_state
 
 
@@ -89,6 +90,17 @@ def test_no_over_reduce():
     assert len(reduced) == 6
 
 
+def test_reduce_identical_cycles():
+    cycle_views = []
+    for hidden_triggers in ((), ('X',)):
+        view1 = GameView(AN_EXPLORE_STATE._replace(hidden_triggers=hidden_triggers))
+        view2 = GameView(AN_EXPLORE_STATE._replace(hidden_triggers=hidden_triggers, facing='south'))
+        view1.actions['TURN-LEFT'] = view2
+        view2.actions['TURN-LEFT'] = view1
+        cycle_views.extend((view1, view2))
+    assert len(reduce_views(cycle_views)) == 2
+
+
 def test_fingerprint_differ():
     fake_pdf = FakePdfRecorder()
     fp1 = compute_fingerprint(fake_pdf, GameView(A_FINAL_STATE))
@@ -96,6 +108,36 @@ def test_fingerprint_differ():
     assert fp1 != fp2
 
 
+def test_render_key_partitions_match_fake_rendering():
+    leaf_views = [
+        GameView(A_FINAL_STATE),
+        GameView(A_FINAL_STATE._replace(hidden_triggers=('X',))),
+        GameView(A_FINAL_STATE._replace(x=2)),
+        GameView(A_FINAL_STATE._replace(gold=10)),
+        GameView(A_FINAL_STATE._replace(message='You died')),
+        GameView(AN_EXPLORE_STATE._replace(mode=GameMode.INFO)),
+        GameView(AN_EXPLORE_STATE._replace(mode=GameMode.INFO, gold=10)),
+        GameView(AN_EXPLORE_STATE._replace(mode=GameMode.INFO, triggers_activated=((0, 1, 1),))),
+        GameView(AN_EXPLORE_STATE._replace(milestone=GameMilestone.VICTORY)),
+        GameView(AN_EXPLORE_STATE._replace(milestone=GameMilestone.VICTORY, gold=10)),
+    ]
+    middle_views = []
+    for leaf_view in leaf_views[:3]:
+        middle_view = GameView(AN_EXPLORE_STATE._replace(y=2))
+        middle_view.actions['MOVE-BACKWARD'] = leaf_view
+        middle_views.append(middle_view)
+    game_views = assign_page_ids(leaf_views + middle_views, assign_special_pages=False)
+    fake_pdf = FakePdfRecorder()
+    assert _partition(game_views, lambda gv: compute_fingerprint(fake_pdf, gv)) == _partition(game_views, compute_render_key)
+
+
+def _partition(game_views, key_func):
+    page_ids_per_key = {}
+    for game_view in game_views:
+        page_ids_per_key.setdefault(key_func(game_view), set()).add(game_view.page_id)
+    return sorted(sorted(page_ids) for page_ids in page_ids_per_key.values())
+
+
 def _print_reduced(reduced):
     for gv in reduced:
         gs = gv.state
@@ -1,25 +1,29 @@
-from os import makedirs
+import hashlib
+from os import getpid, makedirs, replace
 from os.path import dirname, exists, join, realpath
 
 from PIL import Image
 try:
     from PIL.Image import Resampling
     NEAREST = Resampling.NEAREST
+    ADAPTIVE = Image.Palette.ADAPTIVE
 except ImportError:  # for older versions of Pillow:
     NEAREST = Image.NEAREST
+    ADAPTIVE = Image.ADAPTIVE
 
 from .bitfont import bitfont_set_color_red, bitfont_render, Justify
 from .entities import GameMilestone, GameMode, Position
+from .form_xobjects import form_render, form_renderer
 from .js import action, atlas, config, enemy, tileset, REL_RELEASE_DIR
 from .mapscript import mapscript_get_enemy_at
-from .mazemap import mazemap_bounds_check, mazemap_get_tile, mazemap_next_pos_facing, DX_DY_PER_FACING_AND_RENDER_POS
+from .mazemap import mazemap_next_pos_facing
 from .render_minimap import minimap_render
 from .perfs import trace_time
 from .render_dialog import dialog_render
 from .render_info import info_render, info_render_button, info_render_gold, info_render_hpmp
 from .render_treasure import treasure_render_collectible, treasure_render_gold, treasure_render_item
-from .render_utils import add_link, action_button_render, get_image_info, link_from_page_id, portrait_render, sfx_render, tileset_background_render, white_arrow_render, ACTION_BUTTONS
-from .warp_portals import warp_portal_in_sight
+from .render_utils import add_link, action_button_render, file_digest, image_size, link_from_page_id, portrait_render, sfx_render, sprite_render, tileset_background_filepath, white_arrow_render, ACTION_BUTTONS
+from .warp_portals import warp_portal_view_frustum
 
 from .mod.world import patch_enemy_name, CLICK_ZONES
 
@@ -41,6 +45,9 @@ ARROW_LINK_WIDTH = 12
 ARROW_LINK_HEIGHT = 9
 MINIATURES_DIR_PATH = join(dirname(realpath(__file__)), '..', 'small_enemies')
 MINIATURES_ALREADY_GENERATED = set()
+MAZE_VIEWS_DIR_PATH = '.cache/maze_views'
+COMPOSITE_MAZE_VIEWS = False  # enabled with --composite-maze-views
+_MAZE_VIEW_FILEPATHS = {}  # layers -> composited image filepath
 
 
 def render_page(pdf, game_view, render_victory):
@@ -54,14 +61,14 @@ def render_page(pdf, game_view, render_victory):
         render_victory(pdf, game_state)
         return
     if game_state.mode == GameMode.DIALOG:
-        with trace_time('render:0:dialog'):
+        with trace_time('dialog'):
             dialog_render(pdf, game_view)
         return
     bitfont_set_color_red(game_state.hp <= game_state.max_hp/3)
-    with trace_time('render:1:mazemap'):
+    with trace_time('mazemap'):
         mazemap_render(pdf, game_view)
     if game_state.combat:
-        with trace_time('render:3:combat'):
+        with trace_time('combat'):
             combat_render(pdf, game_state)
     elif game_state.sfx:
         sfx_render(pdf, game_state.sfx)
@@ -70,7 +77,7 @@ def render_page(pdf, game_view, render_victory):
     if game_state.extra_render:
         game_state.extra_render(pdf)
     if game_state.mode == GameMode.INFO:
-        with trace_time('render:2:info_page'):
+        with trace_time('info_page'):
             minimap_render(pdf, game_view)
             info_render(pdf, game_state)
             action_render(pdf, game_state.spellbook, game_state.items)
@@ -93,7 +100,7 @@ def render_page(pdf, game_view, render_victory):
             treasure_render_gold(pdf, int(gold_found))
         else:
             treasure_render_item(pdf, game_state.treasure_id)
-    with trace_time('render:4:actions'):
+    with trace_time('actions'):
         for action_name, next_game_view in game_view.actions.items():
             if action_name == 'SHOW-INFO':
                 info_render_button(pdf, next_game_view.page_id, down=game_state.mode == GameMode.INFO)
@@ -130,47 +137,86 @@ def render_page(pdf, game_view, render_victory):
 
 
 def mazemap_render(pdf, game_view):
-    tileset_background_render(pdf, atlas().maps[game_view.state.map_id].background)
-    dx_dy_per_render_pos = DX_DY_PER_FACING_AND_RENDER_POS[game_view.state.facing]
-    for render_pos in range(13):
-        dx, dy = dx_dy_per_render_pos[render_pos]
-        mazemap_render_tile(pdf, game_view, dx, dy, render_pos)
+    layers = mazemap_layers(game_view)
+    if COMPOSITE_MAZE_VIEWS:
+        pdf.image(_maze_view_filepath(layers), x=0, y=0)
+        return
+    for img_filepath, x, y, clip in layers:
+        if clip:
+            # relies on: https://github.com/reingart/pyfpdf/pull/158
+            with pdf.rect_clip(*clip):
+                pdf.image(img_filepath, x=x, y=y)
+        else:
+            pdf.image(img_filepath, x=x, y=y)
 
 
-def mazemap_render_tile(pdf, game_view, dx, dy, render_pos):
+def mazemap_layers(game_view):
+    'Return the images making a 3D maze view, as a tuple of (img_filepath, x, y, clip or None)'
     map_id, x, y = game_view.state.coords
-    portal_in_sight = warp_portal_in_sight(map_id, (x, y), game_view.state.facing, render_pos)
-    if portal_in_sight:
-        warp_portal, edge = portal_in_sight
-        x, y = warp_portal.translate(edge, x, y)
-        # print(f'WARP! {game_view.state.coords} -> {(x, y)} (render_pos={render_pos})')
-    else:
-        map_id, x, y = game_view.state.coords
-    x += dx
-    y += dy
-    _map = atlas().maps[map_id]
-    if not mazemap_bounds_check(_map, x, y):
-        return
-    tile_id = mazemap_get_tile(game_view, map_id, x, y)
+    layers = [(tileset_background_filepath(atlas().maps[map_id].background), 0, 0, None)]
+    for render_pos, src_pos in enumerate(warp_portal_view_frustum(map_id, x, y, game_view.state.facing)):
+        if src_pos:
+            layers.extend(_mazemap_tile_layers(game_view, render_pos, *src_pos))
+    return tuple(layers)
+
+
+def _mazemap_tile_layers(game_view, render_pos, x, y):
+    map_id = game_view.state.map_id
+    tile_id = game_view.tile_override((map_id, x, y)) or atlas().maps[map_id].tiles[y][x]
     tile = TILES[tile_id]
     if not tile:
         return
     img_filepath = (REL_RELEASE_DIR + f'images/tiles/{tile}.png') if tile_id < 20 else f'assets/tiles/{tile}.png'
     if tile_id == 16: img_filepath = 'assets/tiles/skull_pile2.png'
     draw_area = _DRAW_AREAS[render_pos]
-    # relies on: https://github.com/reingart/pyfpdf/pull/158
-    with pdf.rect_clip(x=draw_area.dest_x, y=draw_area.dest_y, w=draw_area.width, h=draw_area.height):
-        pdf.image(img_filepath, x=draw_area.dest_x-draw_area.src_x, y=draw_area.dest_y-draw_area.src_y)
+    yield (img_filepath, draw_area.dest_x-draw_area.src_x, draw_area.dest_y-draw_area.src_y,
+           (draw_area.dest_x, draw_area.dest_y, draw_area.width, draw_area.height))
     if render_pos == 4:  # center of back row
         next_pos_facing = mazemap_next_pos_facing(x, y, game_view.state.facing)
         # Extra rendering in case of a boulder one tile further:
         if game_view.tile_override((map_id, *next_pos_facing)) in (20, 21, 22):
-            pdf.image('assets/boulder_small.png', x=68, y=48)
+            yield ('assets/boulder_small.png', 68, 48, None)
     if render_pos == 9:  # center of midle row
         _enemy = mapscript_get_enemy_at((map_id, x, y), game_view.state)
         # Rendering enemy on map:
         if _enemy and _enemy.show_on_map and not game_view.enemy_vanquished((map_id, x, y)):
-            enemy_render_small(pdf, _enemy)
+            yield (enemy_small_img_filepath(_enemy), 25, 18, None)
+
+
+def _maze_view_filepath(layers):
+    '''
+    Composite all the layers of a maze view into a single PNG, stored in MAZE_VIEWS_DIR_PATH.
+    Its name is a digest of the layers & of the source images content, so that it can be reused between runs.
+    '''
+    img_filepath = _MAZE_VIEW_FILEPATHS.get(layers)
+    if img_filepath:
+        return img_filepath
+    digest = hashlib.sha1(repr(layers).encode())
+    for layer in layers:
+        digest.update(file_digest(layer[0]))
+    img_filepath = f'{MAZE_VIEWS_DIR_PATH}/{digest.hexdigest()}.png'
+    if not exists(img_filepath):
+        makedirs(MAZE_VIEWS_DIR_PATH, exist_ok=True)
+        view = Image.new('RGBA', (config().VIEW_WIDTH, config().VIEW_HEIGHT))
+        for layer_filepath, x, y, clip in layers:
+            with Image.open(layer_filepath) as img:
+                img = img.convert('RGBA')
+            if clip:
+                clip_x, clip_y, width, height = clip
+                img = img.crop((clip_x - x, clip_y - y, clip_x - x + width, clip_y - y + height))
+                x, y = clip_x, clip_y
+            view.alpha_composite(img, dest=(x, y))
+        # Images are palette-based, which keeps them small once embedded in the PDF:
+        tmp_filepath = f'{img_filepath}.{getpid()}.tmp'  # parallel rendering worker processes may generate the same image
+        view.convert('RGB').convert('P', palette=ADAPTIVE).save(tmp_filepath, format='PNG')
+        replace(tmp_filepath, img_filepath)
+    _MAZE_VIEW_FILEPATHS[layers] = img_filepath
+    return img_filepath
+
+
+def enable_composite_maze_views():
+    global COMPOSITE_MAZE_VIEWS
+    COMPOSITE_MAZE_VIEWS = True
 
 
 def action_render(pdf, spellbook, items):
@@ -193,7 +239,7 @@ def combat_render(pdf, game_state):
     'Replicates combat_render_input'
     combat = game_state.combat
     _enemy = combat.enemy
-    enemy_has_frames = get_image_info(pdf, _enemy_img_filepath(_enemy))['w'] > config().VIEW_WIDTH
+    enemy_has_frames = image_size(_enemy_img_filepath(_enemy))[0] > config().VIEW_WIDTH
     if _enemy.hp > 0 or enemy_has_frames:  # if the enemy visual is made of several frames, assume there is one for its death
         enemy_render(pdf, combat, game_state.sfx)
         if combat.boneshield_up:
@@ -229,7 +275,7 @@ def enemy_render(pdf, combat, sfx=None):
     _enemy, _round = combat.enemy, combat.round
     combat_round, img_filepath = combat.combat_round, _enemy_img_filepath(_enemy)
     # If the image is larger than the VIEW_WIDTH, it is sliced in frames:
-    frame_count = get_image_info(pdf, img_filepath)['w'] / config().VIEW_WIDTH
+    frame_count = image_size(img_filepath)[0] / config().VIEW_WIDTH
     # Some enemies explicitely state the frame to display:
     frame = _enemy.enemy_frame and _enemy.enemy_frame(combat)
     if frame is None:
@@ -238,7 +284,8 @@ def enemy_render(pdf, combat, sfx=None):
             frame = frame_count - 1  # In case there are more rounds than frames, the last one is used for the remaining rounds:
         else:
             frame = (_round + 1) % frame_count
-    pdf.image(img_filepath, x=-frame*config().VIEW_WIDTH, y=0)
+    width, height = config().VIEW_WIDTH, config().VIEW_HEIGHT
+    sprite_render(pdf, img_filepath, 0, 0, (round(frame*width), 0, round((frame + 1)*width), height))
     # Rendering SFX *after* enemy sprite (e.g. for BURN spell) but *before* CombatLogs (to improve readability):
     if _round >= 0 and combat_round and combat_round.sfx:
         sfx_render(pdf, combat_round.sfx)
@@ -247,7 +294,7 @@ def enemy_render(pdf, combat, sfx=None):
         sfx_render(pdf, sfx)
 
 
-def enemy_render_small(pdf, _enemy, scale=2/3):
+def enemy_small_img_filepath(_enemy, scale=2/3):
     small_img_filepath = f'assets/enemies/small/{_enemy.name}.png'
     if not exists(small_img_filepath):  # fallback to auto-generated miniature:
         small_img_filepath = f'{MINIATURES_DIR_PATH}/{_enemy.name}.png'
@@ -260,7 +307,7 @@ def enemy_render_small(pdf, _enemy, scale=2/3):
                    .resize((round(width*scale), round(height*scale)), resample=NEAREST)\
                    .save(small_img_filepath)
             MINIATURES_ALREADY_GENERATED.add(small_img_filepath)
-    pdf.image(small_img_filepath, x=25, y=18)
+    return small_img_filepath
 
 
 def _enemy_img_filepath(_enemy):
@@ -269,20 +316,23 @@ def _enemy_img_filepath(_enemy):
 
 def render_bar(pdf, value, max_value, y=1, color_index=0):
     start_x = 2
-    with pdf.rect_clip(x=start_x, y=y, w=10 + max_value, h=14):
-        pdf.image('assets/healthbar.png', x=start_x, y=y)
-    with pdf.rect_clip(x=start_x + 10 + max_value, y=y, w=10, h=14):
-        pdf.image('assets/healthbar.png', x=start_x + max_value - 140, y=y)
+    form_render(pdf, 'bar-frame', max_value, y)
     if value > 0:
-        with pdf.rect_clip(x=start_x + 10, y=y, w=value, h=14):
-            pdf.image('assets/healthbar.png', x=start_x + 10, y=y-(1 + color_index)*14)
+        sprite_render(pdf, 'assets/healthbar.png', start_x + 10, y, (0, (1 + color_index)*14, value, (2 + color_index)*14))
+
+
+@form_renderer('bar-frame')
+def _bar_frame_render(pdf, max_value, y):
+    start_x = 2
+    sprite_render(pdf, 'assets/healthbar.png', start_x, y, (0, 0, 10 + max_value, 14))
+    sprite_render(pdf, 'assets/healthbar.png', start_x + 10 + max_value, y, (150, 0, 160, 14))
 
 
 def arrow_button_render(pdf, direction, page_id=None, shift_x=0, shift_y=0):
-    btn_pos = ARROW_BUTTONS_POS[direction]
-    with pdf.rotation(btn_pos.angle, x=btn_pos.x + _ACTION_BTN_SIZE//2 + shift_x,
-                                     y=btn_pos.y + _ACTION_BTN_SIZE//2 + shift_y):
-        pdf.image('assets/arrow-right.png', x=btn_pos.x + shift_x, y=btn_pos.y + shift_y)
+    if shift_x or shift_y:
+        _arrow_render(pdf, direction, shift_x, shift_y)
+    else:
+        form_render(pdf, 'arrow', direction)
     if page_id:
         link_pos = ARROW_LINKS_POS[direction]
         flipped = direction in ('MOVE-FORWARD', 'MOVE-BACKWARD')
@@ -293,6 +343,14 @@ def arrow_button_render(pdf, direction, page_id=None, shift_x=0, shift_y=0):
     return None
 
 
+@form_renderer('arrow')
+def _arrow_render(pdf, direction, shift_x=0, shift_y=0):
+    btn_pos = ARROW_BUTTONS_POS[direction]
+    with pdf.rotation(btn_pos.angle, x=btn_pos.x + _ACTION_BTN_SIZE//2 + shift_x,
+                                     y=btn_pos.y + _ACTION_BTN_SIZE//2 + shift_y):
+        pdf.image('assets/arrow-right.png', x=btn_pos.x + shift_x, y=btn_pos.y + shift_y)
+
+
 def render_book(pdf, book, page_id, treasure_id):
     y = 70 - book.text.count('\n') * 6
     if treasure_id:
@@ -313,8 +371,7 @@ def render_book(pdf, book, page_id, treasure_id):
         if book.bird_index is not None:
             link = link_from_page_id(pdf, page_id)
             x, y = 80, 60
-            with pdf.rect_clip(x=x, y=y, w=45, h=47):
-                pdf.image('assets/black_bird.png', x=x - book.bird_index*45, y=y, link=link, alt_text='NEXT')
+            sprite_render(pdf, 'assets/black_bird.png', x, y, (book.bird_index*45, 0, (book.bird_index + 1)*45, 47), link=link, alt_text='NEXT')
         if book.extra_render:
             book.extra_render(pdf)
     bitfont_render(pdf, book.text, 80, y, Justify.CENTER, page_id=page_id)
@@ -1,13 +1,21 @@
 from .bitfont import bitfont_render, Justify
 from .js import action, info, REL_RELEASE_DIR
-from .render_utils import render_button
+from .form_xobjects import form_render, form_renderer
+from .render_utils import button_link, render_button, sprite_render
 
 
 def info_render_button(pdf, page_id=None, down=False, btn_pos=None):
-    if not btn_pos:
-        btn_pos = action().BUTTON_POS_INFO
-    render_button(pdf, btn_pos, REL_RELEASE_DIR + info().button_img.src, 1 if down else 0,
-                  page_id=page_id, link_alt="INFO")
+    if btn_pos:
+        render_button(pdf, btn_pos, REL_RELEASE_DIR + info().button_img.src, 1 if down else 0,
+                      page_id=page_id, link_alt="INFO")
+    else:
+        form_render(pdf, 'info-button', 1 if down else 0)
+        button_link(pdf, action().BUTTON_POS_INFO, page_id=page_id, link_alt="INFO")
+
+
+@form_renderer('info-button')
+def _info_button_render(pdf, img_index):
+    render_button(pdf, action().BUTTON_POS_INFO, REL_RELEASE_DIR + info().button_img.src, img_index)
 
 
 def info_render(pdf, game_state):
@@ -52,7 +60,4 @@ def info_render_equipment(pdf, game_state):
 def info_render_equiplayer(pdf, itemtier, itemtype):
     x, y = info().AVATAR_DRAW_X, info().AVATAR_DRAW_Y
     w, h = info().AVATAR_SPRITE_W, info().AVATAR_SPRITE_H
-    with pdf.rect_clip(x=x, y=y, w=w, h=h):
-        pdf.image(REL_RELEASE_DIR + info().avatar_img.src,
-                  x=x - itemtier * info().AVATAR_SPRITE_W,
-                  y=y - itemtype * info().AVATAR_SPRITE_H)
+    sprite_render(pdf, REL_RELEASE_DIR + info().avatar_img.src, x, y, (itemtier * w, itemtype * h, (itemtier + 1) * w, (itemtype + 1) * h))
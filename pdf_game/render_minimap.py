@@ -5,6 +5,7 @@ from typing import Dict, NamedTuple, Tuple
 from PIL import Image
 
 from .js import atlas, minimap, tileset
+from .render_utils import sprite_render
 
 from .mod.minimap import minimap_is_unknown
 
@@ -41,6 +42,13 @@ def minimap_render(pdf, game_view):
     _minimap_render_cursor(pdf, draw_x, draw_y, cursor_direction)
 
 
+def minimap_render_key(game_view):
+    'Return the minimap image filepath & the avatar cursor position, that fully define the minimap rendering'
+    state = game_view.state
+    cursor = None if minimap_is_unknown(*state.coords) else (state.x, state.y, state.facing)
+    return _get_img_filepath(state.map_id, _get_walkablity_changing_tile_overrides(state.map_id, atlas().maps[state.map_id], state)), cursor
+
+
 def _get_prerendered_img(map_id, game_state):
     'Pre-render all minimaps as PNG files to make rendering faster'
     _map = atlas().maps[map_id]
@@ -76,7 +84,7 @@ def _get_prerendered_img(map_id, game_state):
 
 def _get_walkablity_changing_tile_overrides(map_id, _map, game_state):
     walkablity_changes = {}  # (x, y) -> walkable
-    for ((_map_id, x, y), tile_override) in game_state.tile_overrides:
+    for ((_map_id, x, y), tile_override) in game_state.tile_overrides.items():
         if _map_id != map_id:
             continue
         if game_state.rolling_boulder and (_map_id, x, y) == game_state.rolling_boulder.coords:
@@ -127,5 +135,4 @@ def plain_icon(color):
 def _minimap_render_cursor(pdf, screen_x, screen_y, icon_type):
     btn_size = minimap().MINIMAP_ICON_SIZE
     img_filepath = 'assets/minimap_cursor.png'
-    with pdf.rect_clip(x=screen_x, y=screen_y, w=btn_size, h=btn_size):
-        pdf.image(img_filepath, x=screen_x - 2*icon_type*btn_size, y=screen_y)
+    sprite_render(pdf, img_filepath, screen_x, screen_y, (2*icon_type*btn_size, 0, (2*icon_type + 1)*btn_size, btn_size))
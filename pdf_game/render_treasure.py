@@ -1,7 +1,7 @@
 from .bitfont import bitfont_render
 from .entities import Position
 from .js import treasure, REL_RELEASE_DIR
-from .render_utils import action_button_render, get_image_info
+from .render_utils import action_button_render, sprite_render
 
 
 COLLECTIBLE_IMG_POS = Position(x=130, y=70)
@@ -45,9 +45,4 @@ def _treasure_render(pdf, treasure_id, x, y, scale=1):
     else:  # Newly introduced item:
         treasure_id -= 16
         treasure_img = 'assets/extra_treasure.png'
-    width, height = 0, 0
-    if scale != 1:
-        img_info = get_image_info(pdf, treasure_img)
-        width, height = img_info['w'] * scale, img_info['h'] * scale
-    with pdf.rect_clip(x=x, y=y, w=icon_size * scale, h=icon_size * scale):
-        pdf.image(treasure_img, x=x - treasure_id * icon_size * scale, y=y, w=width, h=height)
+    sprite_render(pdf, treasure_img, x, y, (treasure_id * icon_size, 0, (treasure_id + 1) * icon_size, icon_size), scale=scale)
@@ -1,3 +1,11 @@
+import hashlib
+from collections import defaultdict
+from functools import lru_cache as cached
+from os import getpid, makedirs, replace
+from os.path import exists
+
+from PIL import Image
+
 from .entities import Position
 from .js import action, REL_RELEASE_DIR
 
@@ -57,21 +65,24 @@ ACTION_BUTTON_POS = {
 }
 WHITE_ARROW_NAMES = 'BACK,NEXT'.split(',')  # order matches position in .png
 WHITE_ARROW_SIZE = 16
+SPRITES_DIR_PATH = '.cache/sprites'
+_SPRITES = {}  # (img_filepath, box) -> (sprite_filepath, left, upper, width, height) or None if the box is outside the image
 
 
 def portrait_render(pdf, portrait_id, x=0, y=0):
-    with pdf.rect_clip(x=x, y=y, w=32, h=32):
-        pdf.image('assets/portraits.png', x=x - portrait_id * 32, y=y)
+    sprite_render(pdf, 'assets/portraits.png', x, y, (portrait_id * 32, 0, portrait_id * 32 + 32, 32))
 
 
 def sfx_render(pdf, sfx):
-    with pdf.rect_clip(x=sfx.pos.x, y=sfx.pos.y, w=32, h=32):
-        pdf.image('assets/sfx.png', x=sfx.pos.x - sfx.id * 32, y=sfx.pos.y)
+    sprite_render(pdf, 'assets/sfx.png', sfx.pos.x, sfx.pos.y, (sfx.id * 32, 0, sfx.id * 32 + 32, 32))
 
 
 def tileset_background_render(pdf, bg_id):
-    img_filepath = f'assets/backgrounds/{bg_id}.png' if isinstance(bg_id, str) else REL_RELEASE_DIR + f'images/backgrounds/{BACKGROUNDS[bg_id]}.png'
-    pdf.image(img_filepath, x=0, y=0)
+    pdf.image(tileset_background_filepath(bg_id), x=0, y=0)
+
+
+def tileset_background_filepath(bg_id):
+    return f'assets/backgrounds/{bg_id}.png' if isinstance(bg_id, str) else REL_RELEASE_DIR + f'images/backgrounds/{BACKGROUNDS[bg_id]}.png'
 
 
 def action_button_render(pdf, btn_type, page_id=None, url='', btn_pos=None, item_index=None):
@@ -89,21 +100,68 @@ def action_button_render(pdf, btn_type, page_id=None, url='', btn_pos=None, item
 def white_arrow_render(pdf, name, x, y, page_id=None):
     img_index = WHITE_ARROW_NAMES.index(name)
     link = link_from_page_id(pdf, page_id) if page_id else None
-    with pdf.rect_clip(x=x, y=y, w=WHITE_ARROW_SIZE, h=WHITE_ARROW_SIZE):
-        pdf.image('assets/white_arrows.png', x=x - img_index*WHITE_ARROW_SIZE, y=y, link=link, alt_text=name)
+    sprite_render(pdf, 'assets/white_arrows.png', x, y, (img_index*WHITE_ARROW_SIZE, 0, (img_index + 1)*WHITE_ARROW_SIZE, WHITE_ARROW_SIZE),
+                  link=link, alt_text=name)
 
 
 def render_button(pdf, btn_pos, img_filepath, img_index=0, page_id=None, url='', link_alt=None):
     btn_size, btn_offset = action().BUTTON_SIZE, action().BUTTON_OFFSET
     x = btn_pos.x + btn_offset
     y = btn_pos.y + btn_offset
-    with pdf.rect_clip(x=x, y=y, w=btn_size, h=btn_size):
-        pdf.image(img_filepath, x=x - img_index*btn_size, y=y)  # DEBUG NOTE: passing link= here creates a bug with RUN button
+    sprite_render(pdf, img_filepath, x, y, (img_index*btn_size, 0, (img_index + 1)*btn_size, btn_size))  # DEBUG NOTE: passing link= here creates a bug with RUN button
+    return button_link(pdf, btn_pos, page_id=page_id, url=url, link_alt=link_alt)
+
+
+def button_link(pdf, btn_pos, page_id=None, url='', link_alt=None):
     if page_id or url:
-        return add_link(pdf, x, y, btn_size, btn_size, page_id=page_id, url=url, link_alt=link_alt)
+        btn_size, btn_offset = action().BUTTON_SIZE, action().BUTTON_OFFSET
+        return add_link(pdf, btn_pos.x + btn_offset, btn_pos.y + btn_offset, btn_size, btn_size, page_id=page_id, url=url, link_alt=link_alt)
     return None
 
 
+def sprite_render(pdf, img_filepath, x, y, box, scale=1, **kwargs):
+    '''
+    Render the box=(left, upper, right, lower) region of a sprite sheet at (x, y), in pixels, like a clipped image would.
+    Instead of the whole sheet, only a slice of it is embedded, and slices with identical pixels are embedded once.
+    '''
+    sprite = _sprite_slice(img_filepath, box)
+    if sprite:
+        sprite_filepath, left, upper, width, height = sprite
+        pdf.image(sprite_filepath, x=x + (left - box[0])*scale, y=y + (upper - box[1])*scale, w=width*scale, h=height*scale, **kwargs)
+
+
+def _sprite_slice(img_filepath, box):
+    'Sprites are stored in SPRITES_DIR_PATH, named after a digest of their pixels'
+    key = (img_filepath, box)
+    if key in _SPRITES:
+        return _SPRITES[key]
+    sprite = None
+    with Image.open(img_filepath) as img:
+        left, upper, right, lower = max(box[0], 0), max(box[1], 0), min(box[2], img.width), min(box[3], img.height)
+        if left < right and upper < lower:
+            sprite_img = img.crop((left, upper, right, lower))
+            digest = hashlib.sha1(f'{sprite_img.mode}|{sprite_img.size}|{sprite_img.info.get("transparency")}'.encode())
+            digest.update(sprite_img.tobytes())
+            if sprite_img.mode == 'P':
+                digest.update(sprite_img.palette.tobytes())
+            sprite_filepath = f'{SPRITES_DIR_PATH}/{digest.hexdigest()}.png'
+            if not exists(sprite_filepath):
+                makedirs(SPRITES_DIR_PATH, exist_ok=True)
+                tmp_filepath = f'{sprite_filepath}.{getpid()}.tmp'  # parallel rendering worker processes may generate the same image
+                sprite_img.save(tmp_filepath, format='PNG', optimize=True)  # also strips unused palette entries
+                replace(tmp_filepath, sprite_filepath)
+            sprite = (sprite_filepath, left, upper, right - left, lower - upper)
+    _SPRITES[key] = sprite
+    return sprite
+
+
+@cached(maxsize=None)
+def image_size(img_filepath):
+    'Return the (width, height) of an image, without embedding it in the PDF, as get_image_info does'
+    with Image.open(img_filepath) as img:
+        return img.size
+
+
 def add_link(pdf, x, y, width, height, rotation=None, page_id=None, url='', link=None, link_alt=None):
     if page_id is not None:
         assert not (link or url)
@@ -125,6 +183,49 @@ def link_from_page_id(pdf, page_id):
     return link
 
 
+class LinksRecorder:
+    'Delegates all method calls to a FPDF instance, except links creation, that is only recorded, per page'
+    def __init__(self, instance):
+        self.instance = instance
+        self.links_per_page = defaultdict(list)  # page -> [(x, y, w, h, link, alt_text)]
+        self._page_per_link = {}
+
+    def __getattr__(self, name):
+        return getattr(self.instance, name)
+
+    def add_link(self):
+        link = -len(self._page_per_link) - 1  # negative, not to be confused with links created by the FPDF instance
+        self._page_per_link[link] = None
+        return link
+
+    def set_link(self, link, page=-1):
+        self._page_per_link[link] = page
+
+    def link(self, x, y, w, h, link, alt_text=None):
+        self.links_per_page[self.instance.page].append((x, y, w, h, link, alt_text))
+
+    def image(self, name, x=None, y=None, w=0, h=0, link='', title=None, alt_text=None):
+        'FPDF.image would add the link itself, hence the alternate text is attached to the recorded link'
+        if not link:
+            return self.instance.image(name, x=x, y=y, w=w, h=h, title=title, alt_text=alt_text)
+        info = get_image_info(self.instance, name)
+        if not w and not h:
+            w, h = info['w'] / self.instance.k, info['h'] / self.instance.k
+        elif not w:
+            w = h * info['w'] / info['h']
+        elif not h:
+            h = w * info['h'] / info['w']
+        self.link(x, y, w, h, link, alt_text)
+        return self.instance.image(name, x=x, y=y, w=w, h=h, title=title)
+
+    def link_target(self, link):
+        "Return ('url', url), ('page', page) or ('link', link) if this is not a link created by this recorder, or its page is not set yet"
+        if isinstance(link, str):
+            return 'url', link
+        page = self._page_per_link.get(link)
+        return ('page', page) if page else ('link', link)
+
+
 def get_image_info(pdf, img_filepath):
     # Replicates some logic from FPDF.image().
     # Could be exposed as a FPDF method with a minor refactor.
@@ -135,3 +236,10 @@ def get_image_info(pdf, img_filepath):
         info['i'] = len(pdf.images)
         info['usages'] = 1
     return info
+
+
+@cached(maxsize=None)
+def file_digest(filepath):
+    'Digest of a source image content, to name the images generated from it'
+    with open(filepath, 'rb') as img_file:
+        return hashlib.sha1(img_file.read()).digest()
@@ -0,0 +1,218 @@
+'''
+This module role is to serialize graphs of GameViews,
+so that they can be exchanged between processes or stored on disk.
+
+GameStates embed many callables (extra_render, Enemy logic...), that are mostly closures.
+They are serialized by reference:
+- the ones that already exist before states exploration are looked up in a registry,
+  built by register_callables(), by their module, qualified name & discovery order,
+  and loading fails if the code registered under this key has changed.
+- the ones created during exploration are rebuilt from their code object,
+  looked up by module / name / line number, and from the content of their closure cells.
+Attributes set on registered callables (e.g. post_defeat.game_view) are never serialized:
+they belong to the process that set them.
+'''
+import pickle, sys, zlib
+from functools import partial
+from types import CellType, FunctionType, ModuleType
+
+from .entities import GameView
+
+
+_CALLABLES = {}       # (module, qualname, discovery index) -> function existing before states exploration
+_CALLABLE_KEY = {}    # id(function) -> key in _CALLABLES
+_CODE_PER_KEY = {}    # (module, name, first line number, bytecode CRC) -> code object
+
+
+def register_callables():
+    '''
+    Must be called once the mod has been scripted, and before states exploration starts.
+    Functions are discovered by walking the pdf_game modules globals in a deterministic order,
+    so that registry keys are stable from one run to another.
+    '''
+    _CALLABLES.clear()
+    _CALLABLE_KEY.clear()
+    _CODE_PER_KEY.clear()
+    modules = [module for name, module in sorted(sys.modules.items()) if name.startswith(__package__)]
+    seen_ids, stack, count_per_qualname = set(), list(reversed(modules)), {}
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen_ids:
+            continue
+        seen_ids.add(id(obj))
+        if isinstance(obj, (ModuleType, type)):
+            if not (getattr(obj, '__module__', None) or obj.__name__).startswith(__package__):
+                continue
+            children = vars(obj).values()
+        elif isinstance(obj, dict):
+            children = [item for key_value in obj.items() for item in key_value]
+        elif isinstance(obj, (list, tuple)):
+            children = obj
+        elif isinstance(obj, (classmethod, staticmethod)):
+            children = (obj.__func__,)
+        elif type(obj) is FunctionType and (obj.__module__ or '').startswith(__package__):  # pylint: disable=unidiomatic-typecheck
+            qualname = (obj.__module__, obj.__qualname__)
+            key = (*qualname, count_per_qualname.get(qualname, 0))
+            count_per_qualname[qualname] = key[-1] + 1
+            _CALLABLES[key] = obj
+            _CALLABLE_KEY[id(obj)] = key
+            _index_code(obj.__module__, obj.__code__)
+            children = [*(obj.__defaults__ or ()), *(obj.__kwdefaults__ or {}).values(), *obj.__dict__.values(),
+                        *(cell.cell_contents for cell in obj.__closure__ or () if _is_cell_set(cell))]
+        elif isinstance(obj, partial):
+            children = (obj.func, *obj.args, *obj.keywords.values())
+        elif hasattr(obj, '__wrapped__'):  # e.g. functools.lru_cache
+            children = (obj.__wrapped__,)
+        elif hasattr(obj, '__dict__') and type(obj).__module__.startswith(__package__):
+            children = vars(obj).values()
+        else:
+            continue
+        stack.extend(reversed(list(children)))
+
+
+def dump_views(file, payload, external_views=()):
+    '''
+    Serialize the payload, and ALL the GameViews it references, directly or not,
+    except for the external_views, that are only referenced by their index in this sequence.
+    '''
+    pickler = _ViewsPickler(file, external_views)
+    pickler.dump(payload)
+    i = 0
+    while i < len(pickler.views):  # this list grows as new GameViews are referenced
+        pickler.dump(pickler.views[i].__dict__)
+        i += 1
+
+
+def load_views(file, external_views=()):
+    'Deserialize a payload written by dump_views, given the same external_views'
+    unpickler = _ViewsUnpickler(file, external_views)
+    payload = unpickler.load()
+    i = 0
+    while i < len(unpickler.views):
+        unpickler.views[i].__dict__.update(unpickler.load())
+        i += 1
+    return payload
+
+
+class _ViewsPickler(pickle.Pickler):
+    def __init__(self, file, external_views):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.external_index = {id(gv): i for i, gv in enumerate(external_views)}
+        self.view_index = {}
+        self.views = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not GameView:  # pylint: disable=unidiomatic-typecheck
+            return None
+        external_index = self.external_index.get(id(obj))
+        if external_index is not None:
+            return ('external', external_index)
+        index = self.view_index.get(id(obj))
+        if index is None:
+            index = self.view_index[id(obj)] = len(self.views)
+            self.views.append(obj)
+        return index
+
+    def reducer_override(self, obj):
+        if type(obj) is not FunctionType:  # pylint: disable=unidiomatic-typecheck
+            return NotImplemented
+        if _is_importable(obj):  # default behaviour: by reference
+            return NotImplemented
+        key = _CALLABLE_KEY.get(id(obj))
+        if key:  # the code key ensures that the same code is registered under this key when loading
+            return _registered_callable, (*key, _code_key(obj.__module__, obj.__code__))
+        code = obj.__code__
+        key = _code_key(obj.__module__, code)
+        if key not in _CODE_PER_KEY:
+            raise pickle.PicklingError(f'Cannot serialize {obj.__module__}.{obj.__qualname__}: its code object is unknown - has register_callables() been called?')
+        cells_content = tuple(cell.cell_contents for cell in obj.__closure__ or ())
+        state = (obj.__defaults__, obj.__kwdefaults__, cells_content, obj.__dict__)
+        return _rebuild_function, (key, obj.__qualname__, len(cells_content)), state, None, None, _restore_function
+
+
+class _ViewsUnpickler(pickle.Unpickler):
+    def __init__(self, file, external_views):
+        super().__init__(file)
+        self.external_views = external_views
+        self.views = []
+
+    def persistent_load(self, pid):
+        if isinstance(pid, tuple):
+            _, external_index = pid
+            return self.external_views[external_index]
+        while len(self.views) <= pid:
+            self.views.append(GameView.__new__(GameView))
+        return self.views[pid]
+
+
+def relink_post_defeat_views(game_views):
+    '''
+    Attributes of registered callables are not serialized, so post_defeat.game_view must be set back
+    on deserialized GameViews. cf. iterate_game_views: only one post-defeat view exists per post_defeat renderer,
+    so the ones already provided by the main process or by a previous segment are dropped.
+    '''
+    for game_view in game_views:
+        post_defeat = game_view.renderer
+        if post_defeat and not game_view.state:
+            existing_game_view = getattr(post_defeat, 'game_view', None)
+            if existing_game_view is not None and existing_game_view is not game_view:
+                continue
+            post_defeat.game_view = game_view
+        yield game_view
+
+
+def _registered_callable(module, qualname, index, code_key):
+    func = _CALLABLES.get((module, qualname, index))
+    if not func:
+        raise pickle.UnpicklingError(f'No registered callable found for {module}.{qualname} #{index}')
+    if _code_key(module, func.__code__) != code_key:
+        raise pickle.UnpicklingError(f'The code of the registered callable {module}.{qualname} #{index} has changed')
+    return func
+
+
+def _rebuild_function(key, qualname, cells_count):
+    code = _CODE_PER_KEY.get(key)
+    if not code:
+        raise pickle.UnpicklingError(f'No code object found for {key[0]}.{qualname}')
+    cells = tuple(CellType() for _ in range(cells_count))
+    func = FunctionType(code, sys.modules[key[0]].__dict__, code.co_name, None, cells or None)
+    func.__qualname__ = qualname
+    return func
+
+
+def _restore_function(func, state):
+    func.__defaults__, func.__kwdefaults__, cells_content, attrs = state
+    for cell, content in zip(func.__closure__ or (), cells_content):
+        cell.cell_contents = content
+    func.__dict__.update(attrs)
+
+
+def _is_cell_set(cell):
+    try:
+        cell.cell_contents  # pylint: disable=pointless-statement
+        return True
+    except ValueError:  # empty cell
+        return False
+
+
+def _is_importable(func):
+    if '<' in func.__qualname__:  # <lambda> or <locals>
+        return False
+    obj = sys.modules.get(func.__module__)
+    for name in func.__qualname__.split('.'):
+        obj = getattr(obj, name, None)
+    return obj is func
+
+
+def _code_key(module, code):
+    return module, code.co_name, code.co_firstlineno, zlib.crc32(code.co_code)
+
+
+def _index_code(module, code):
+    key = _code_key(module, code)
+    if key in _CODE_PER_KEY:
+        return
+    _CODE_PER_KEY[key] = code
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _index_code(module, const)
@@ -0,0 +1,25 @@
+import io, pickle
+
+import pytest
+
+from . import serializer
+from .entities import GameView
+from .serializer import dump_views, load_views, register_callables
+
+
+RENDERERS = {
+    'a': lambda pdf: pdf.text(0, 0, 'a'),
+    'b': lambda pdf: pdf.image('b.png', 0, 0),
+}
+
+
+def test_registered_callables_are_loaded_only_if_their_code_is_unchanged(monkeypatch):
+    register_callables()
+    out = io.BytesIO()
+    dump_views(out, GameView(renderer=RENDERERS['a']))
+    assert load_views(io.BytesIO(out.getvalue())).renderer is RENDERERS['a']
+    # Simulating an edit of this module, that would register another lambda under the same key:
+    key = serializer._CALLABLE_KEY[id(RENDERERS['a'])]  # pylint: disable=protected-access
+    monkeypatch.setitem(serializer._CALLABLES, key, RENDERERS['b'])  # pylint: disable=protected-access
+    with pytest.raises(pickle.UnpicklingError):
+        load_views(io.BytesIO(out.getvalue()))
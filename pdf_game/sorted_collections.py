@@ -0,0 +1,148 @@
+'''
+Immutable & hashable sorted collections, with O(log n) insertions, deletions & lookups.
+
+They are implemented as persistent treaps: an updated collection shares with the original one
+all the nodes that are not on the path to the inserted / deleted key.
+Nodes priorities are derived from the keys hashes, so that the tree shape only depends on the keys:
+equal collections have identical shapes, and can be compared node by node.
+'''
+_HASH_MODULUS = (1 << 61) - 1  # cf. sys.hash_info.modulus
+_PRIORITY_SALT = 'treap'  # avoids degenerated trees for integer keys, that are their own hashes
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'priority', 'left', 'right', 'size', 'hash')
+    def __init__(self, key, value, priority, left, right):
+        self.key, self.value, self.priority, self.left, self.right = key, value, priority, left, right
+        self.size = 1 + (left.size if left else 0) + (right.size if right else 0)
+        self.hash = (hash((key, value)) + (left.hash if left else 0) + (right.hash if right else 0)) % _HASH_MODULUS
+
+
+class _SortedCollection:
+    __slots__ = ('_root',)
+    def __init__(self, root=None):
+        self._root = root
+    def __len__(self):
+        return self._root.size if self._root else 0
+    def __hash__(self):
+        return self._root.hash if self._root else 0
+    def __eq__(self, other):
+        if type(other) is not type(self):  # pylint: disable=unidiomatic-typecheck
+            return NotImplemented
+        return len(self) == len(other) and hash(self) == hash(other) and _equal(self._root, other._root)
+    def __contains__(self, key):
+        return _find(self._root, key) is not None
+    def __iter__(self):
+        return (node.key for node in _iter_nodes(self._root))
+    def delete(self, key):
+        'Return a collection without this key - or this very same collection if it does not contain it'
+        if key not in self:
+            return self
+        return type(self)(root=_delete(self._root, key))
+
+
+class SortedSet(_SortedCollection):
+    __slots__ = ()
+    def __init__(self, keys=(), root=None):
+        for key in keys:
+            root = _insert(root, key, None, hash((_PRIORITY_SALT, key)))
+        super().__init__(root)
+    def __reduce__(self):  # priorities depend on the process hash seed, hence the tree must be rebuilt
+        return SortedSet, (tuple(self),)
+    def __repr__(self):
+        return f'SortedSet({tuple(self)})'
+    def insert(self, key):
+        return SortedSet(root=_insert(self._root, key, None, hash((_PRIORITY_SALT, key))))
+
+
+class SortedMap(_SortedCollection):
+    __slots__ = ()
+    def __init__(self, items=(), root=None):
+        for key, value in items:
+            root = _insert(root, key, value, hash((_PRIORITY_SALT, key)))
+        super().__init__(root)
+    def __reduce__(self):  # priorities depend on the process hash seed, hence the tree must be rebuilt
+        return SortedMap, (tuple(self.items()),)
+    def __repr__(self):
+        return f'SortedMap({tuple(self.items())})'
+    def get(self, key, default=None):
+        node = _find(self._root, key)
+        return node.value if node else default
+    def items(self):
+        return ((node.key, node.value) for node in _iter_nodes(self._root))
+    def insert(self, key, value):
+        'Return a map with this key set to the given value'
+        return SortedMap(root=_insert(self._root, key, value, hash((_PRIORITY_SALT, key))))
+
+
+def _above(priority, key, node):
+    return priority > node.priority or (priority == node.priority and key < node.key)
+
+
+def _find(node, key):
+    while node and node.key != key:
+        node = node.left if key < node.key else node.right
+    return node
+
+
+def _iter_nodes(node):
+    stack = []
+    while stack or node:
+        while node:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        yield node
+        node = node.right
+
+
+def _insert(node, key, value, priority):
+    if node is None:
+        return _Node(key, value, priority, None, None)
+    if key == node.key:
+        return _Node(key, value, priority, node.left, node.right)
+    if _above(priority, key, node):
+        left, right = _split(node, key)
+        return _Node(key, value, priority, left, right)
+    if key < node.key:
+        return _Node(node.key, node.value, node.priority, _insert(node.left, key, value, priority), node.right)
+    return _Node(node.key, node.value, node.priority, node.left, _insert(node.right, key, value, priority))
+
+
+def _split(node, key):
+    'Split a tree not containing key into the trees of the lower keys & of the greater keys'
+    if node is None:
+        return None, None
+    if key < node.key:
+        left, right = _split(node.left, key)
+        return left, _Node(node.key, node.value, node.priority, right, node.right)
+    left, right = _split(node.right, key)
+    return _Node(node.key, node.value, node.priority, node.left, left), right
+
+
+def _delete(node, key):
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        return _Node(node.key, node.value, node.priority, _delete(node.left, key), node.right)
+    return _Node(node.key, node.value, node.priority, node.left, _delete(node.right, key))
+
+
+def _merge(left, right):
+    'Merge two trees, all the keys of the left one being lower than the ones of the right one'
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if _above(left.priority, left.key, right):
+        return _Node(left.key, left.value, left.priority, left.left, _merge(left.right, right))
+    return _Node(right.key, right.value, right.priority, _merge(left, right.left), right.right)
+
+
+def _equal(node1, node2):
+    if node1 is node2:
+        return True
+    if node1 is None or node2 is None:
+        return False
+    return (node1.key == node2.key and node1.value == node2.value
+            and _equal(node1.left, node2.left) and _equal(node1.right, node2.right))
@@ -0,0 +1,44 @@
+import pickle
+from random import Random
+
+import pytest
+
+from .sorted_collections import SortedMap, SortedSet
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_sorted_map_matches_dict(seed):
+    rand, sorted_map, expected = Random(seed), SortedMap(), {}
+    for _ in range(200):
+        key = (rand.randrange(3), rand.randrange(10), rand.randrange(10))
+        if rand.random() < .3:
+            sorted_map, _ = sorted_map.delete(key), expected.pop(key, None)
+        else:
+            sorted_map = sorted_map.insert(key, rand.randrange(50))
+            expected[key] = sorted_map.get(key)
+        assert tuple(sorted_map.items()) == tuple(sorted(expected.items()))
+        assert sorted_map == SortedMap(expected.items())
+        assert hash(sorted_map) == hash(SortedMap(reversed(sorted(expected.items()))))
+
+
+def test_sorted_map_lookup():
+    sorted_map = SortedMap((((9, 4, 5), 26),))
+    assert sorted_map.get((9, 4, 5)) == 26
+    assert sorted_map.get((9, 4, 6)) is None
+    assert sorted_map.insert((9, 4, 5), 27).get((9, 4, 5)) == 27
+    assert sorted_map.insert((9, 4, 5), 27) != sorted_map
+
+
+def test_sorted_set_is_immutable():
+    empty = SortedSet()
+    hidden_triggers = empty.insert('TALKED_TO_SEAMUS').insert('BEEN_TO_VILLAGE')
+    assert not empty
+    assert tuple(hidden_triggers) == ('BEEN_TO_VILLAGE', 'TALKED_TO_SEAMUS')
+    assert 'BEEN_TO_VILLAGE' in hidden_triggers
+    assert hidden_triggers.delete('BEEN_TO_VILLAGE') == SortedSet(('TALKED_TO_SEAMUS',))
+    assert hidden_triggers.delete('UNKNOWN') is hidden_triggers
+
+
+def test_pickling():
+    sorted_set = SortedSet(range(20))
+    assert pickle.loads(pickle.dumps(sorted_set)) == sorted_set
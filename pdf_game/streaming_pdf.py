@@ -0,0 +1,333 @@
+'''
+Streaming PDF output: every page is written to disk as soon as the next one starts,
+and then removed from the FPDF instance, so that memory usage does not grow with the pages count.
+
+Objects numbers are assigned so that the ones of every page can be computed in advance:
+object 1 is the pages tree, object 2 the resources dictionary shared by all pages,
+then each page N is made of objects 2N+1 (page dictionary) & 2N+2 (content stream).
+Identical content streams are only written once: pages sharing them leave their object 2N+2 unused.
+The /MediaBox is defined once, in the pages tree, and inherited by all pages.
+All other objects (images, forms XObjects, document information...) are written at the end, along with the xref table.
+Links annotations are stored directly in the pages dictionaries.
+Links to pages that are not known yet when a page is written (e.g. links_to_credits)
+use named destinations, that are defined in the document catalog.
+
+With object_streams=True, a PDF 1.5 is produced: all objects that are not streams
+(pages dictionaries with their links annotations, resources, pages tree, catalog...)
+are packed by batches of OBJECT_STREAM_SIZE into compressed object streams (cf. PDF spec 7.5.7),
+and the xref table is replaced by a compressed cross-reference stream (cf. PDF spec 7.5.8).
+As object streams are written while pages are still being added,
+their objects numbers are only assigned on close, and then patched in their headers.
+'''
+import hashlib, zlib
+
+from .content_stream import compact_content_stream
+from .form_xobjects import draw_form, FORM_DO_REGEX
+from .parallel_render import page_contents
+from .render_utils import LinksRecorder
+
+
+PDF_VERSION = '1.3'  # cf. gen_pdf.main: avoids a transparency group per page
+OBJECT_STREAMS_PDF_VERSION = '1.5'
+OBJECT_STREAM_SIZE = 200  # number of objects per object stream
+_INFO_SETTERS = {'set_title': 'Title', 'set_subject': 'Subject', 'set_author': 'Author',
+                 'set_keywords': 'Keywords', 'set_creator': 'Creator', 'set_producer': 'Producer'}
+
+
+class StreamingPdfWriter(LinksRecorder):
+    'Wraps a FPDF instance, that must only be used to draw pages content'
+    def __init__(self, instance, filepath, link_alt_texts=True, object_streams=False):
+        super().__init__(instance)
+        self.link_alt_texts = link_alt_texts
+        self.object_streams = object_streams
+        self.info = {}
+        self.xmp_metadata = None
+        self.pages_count = 0
+        self.image_refs = {}  # image name -> (index, object number)
+        self.file_size = self.xref_offset = self.size = None  # set on close
+        self.named_dests_links = set()
+        self.form_names = set()
+        self._offsets = {}  # object number -> byte offset in file
+        self._compressed_objs = {}  # object number -> (index of its object stream, index in this object stream)
+        self._obj_stream_offsets = []  # byte offset in file of every object stream
+        self._pending_objs = []  # (object number, content) of the objects that will be written in the next object stream
+        self._first_obj_stream_num = None  # set on close
+        self._contents_obj_nums = {}  # digest of a content stream -> object number
+        self._prev_xref_offset = None  # set for incremental updates
+        self._file = self._open(filepath)
+
+    def _open(self, filepath):
+        pdf_file = open(filepath, 'wb')  # pylint: disable=consider-using-with
+        pdf_file.write(f'%PDF-{OBJECT_STREAMS_PDF_VERSION if self.object_streams else PDF_VERSION}\n%\xe2\xe3\xcf\xd3\n'.encode('latin-1'))
+        return pdf_file
+
+    def __getattr__(self, name):
+        if name in _INFO_SETTERS:
+            return lambda value: self.info.__setitem__(_INFO_SETTERS[name], value)
+        return super().__getattr__(name)
+
+    def set_xmp_metadata(self, xmp_metadata):
+        self.xmp_metadata = xmp_metadata
+
+    def add_page(self):
+        previous_page = self.instance.page
+        self.instance.add_page()
+        if previous_page:
+            self._flush_page(previous_page)
+
+    def close(self):
+        'Write the last page, all the shared objects, and close the file'
+        assert not self.instance.fonts, 'Fonts are not supported in streaming mode'
+        forms_contents = []
+        if self.instance.page:
+            self.instance.add_page()  # blank page used to draw forms, that is never written
+            self._flush_page(self.instance.page - 1)
+            forms_contents = [(name, self._form_contents(name)) for name in sorted(self.form_names)]  # they may add images
+            del self.instance.pages[self.instance.page]
+        obj_num = self._write_images(self._last_obj_num())
+        xobjects = [f'/I{index} {img_obj_num} 0 R' for index, img_obj_num in sorted(self.image_refs.values())]
+        for name, contents in forms_contents:
+            obj_num += 1
+            self._write_contents(obj_num, f'/Type /XObject /Subtype /Form /BBox [0 0 {_num(self.instance.w_pt)} {_num(self.instance.h_pt)}] '
+                                          '/Resources 2 0 R', contents)
+            xobjects.append(f'/F{name} {obj_num} 0 R')
+        xobjects = ' '.join(xobjects)
+        self._write_obj(2, f'<</ProcSet [/PDF /Text /ImageB /ImageC /ImageI] /XObject <<{xobjects}>>>>')
+        self._write_pages_tree()
+        info_obj_num = obj_num = obj_num + 1
+        self._write_obj(info_obj_num, '<<' + ' '.join(f'/{key} {_pdf_string(value)}' for key, value in sorted(self.info.items())) + '>>')
+        catalog = f'/Type /Catalog /Pages 1 0 R /Dests <<{self._named_dests()}>>'
+        if self.xmp_metadata:
+            obj_num += 1
+            self._write_stream(obj_num, '/Type /Metadata /Subtype /XML', self.xmp_metadata.encode())
+            catalog += f' /Metadata {obj_num} 0 R'
+        root_obj_num = obj_num = obj_num + 1
+        self._write_obj(root_obj_num, f'<<{catalog}>>')
+        if self._pending_objs:
+            self._write_obj_stream()
+        self._first_obj_stream_num = obj_num + 1
+        for obj_stream_offset in self._obj_stream_offsets:
+            obj_num += 1
+            self._patch_obj_stream_num(obj_stream_offset, obj_num)
+        self._write_xref(root_obj_num=root_obj_num, info_obj_num=info_obj_num)
+        self.file_size = self._file.tell()
+        self._file.close()
+
+    def _last_obj_num(self):
+        'Objects written on close are numbered after this one'
+        return 2 * self.pages_count + 2
+
+    def _write_images(self, obj_num):
+        'Return the last object number used'
+        for name, info in sorted(self.instance.images.items(), key=lambda item: item[1]['i']):
+            self.image_refs[name] = (info['i'], obj_num + 1)
+            obj_num = self._write_image(obj_num + 1, info)
+        return obj_num
+
+    def _write_pages_tree(self):
+        kids = ' '.join(f'{_page_obj_num(page)} 0 R' for page in range(1, self.pages_count + 1))
+        self._write_obj(1, f'<</Type /Pages /Kids [{kids}] /Count {self.pages_count} '
+                           f'/MediaBox [0 0 {_num(self.instance.w_pt)} {_num(self.instance.h_pt)}]>>')
+
+    def _write_xref(self, root_obj_num, info_obj_num):
+        'Only the objects written by this instance are listed, in contiguous subsections'
+        self.xref_offset = self._file.tell()
+        entries = {obj_num: (1, offset, 0) for obj_num, offset in self._offsets.items()}  # object number -> (type, field 2, field 3)
+        entries.update((obj_num, (2, self._first_obj_stream_num + obj_stream_index, index))
+                       for obj_num, (obj_stream_index, index) in self._compressed_objs.items())
+        if self._prev_xref_offset is None:  # unused objects numbers, e.g. of deduplicated content streams, are linked as free
+            free_obj_nums = [obj_num for obj_num in range(1, max(entries)) if obj_num not in entries]
+            for obj_num, next_free_obj_num in zip([0] + free_obj_nums, free_obj_nums + [0]):
+                entries[obj_num] = (0, next_free_obj_num, 65535)
+        else:
+            entries[0] = (0, 0, 65535)
+        trailer = f'/Root {root_obj_num} 0 R /Info {info_obj_num} 0 R'
+        if self._prev_xref_offset is not None:
+            trailer += f' /Prev {self._prev_xref_offset}'
+        if self.object_streams:
+            self._write_xref_stream(entries, trailer)
+            return
+        self.size = max(max(entries) + 1, self.size or 0)
+        xref = ['xref\n']
+        for start, count in _subsections(sorted(entries)):
+            xref.append(f'{start} {count}\n')
+            xref.extend(f'{field2:010} {field3:05} {"n" if entry_type else "f"} \n'
+                        for entry_type, field2, field3 in map(entries.get, range(start, start + count)))
+        xref.append(f'trailer\n<</Size {self.size} {trailer}>>\nstartxref\n{self.xref_offset}\n%%EOF\n')
+        self._write(''.join(xref).encode('latin-1'))
+
+    def _write_xref_stream(self, entries, trailer):
+        'Rows are encoded with the PNG Up predictor, as consecutive rows often share most of their bytes'
+        xref_obj_num = max(max(entries) + 1, self.size or 0)
+        entries[xref_obj_num] = (1, self.xref_offset, 0)
+        self.size = xref_obj_num + 1
+        field2_width = max(1, (max(field2 for _, field2, _ in entries.values()).bit_length() + 7) // 8)
+        obj_nums = sorted(entries)
+        subsections = list(_subsections(obj_nums))
+        rows = [entry_type.to_bytes(1, 'big') + field2.to_bytes(field2_width, 'big') + field3.to_bytes(2, 'big')
+                for entry_type, field2, field3 in map(entries.get, obj_nums)]
+        data, prev_row = bytearray(), bytes(len(rows[0]))
+        for row in rows:
+            data.append(2)  # PNG Up filter type
+            data.extend((byte - prev_byte) & 0xFF for byte, prev_byte in zip(row, prev_row))
+            prev_row = row
+        index = ' '.join(f'{start} {count}' for start, count in subsections)
+        self._write_stream(xref_obj_num, f'/Type /XRef /Size {self.size} {trailer} /W [1 {field2_width} 2] /Index [{index}] '
+                                         f'/Filter /FlateDecode /DecodeParms <</Predictor 12 /Columns {len(rows[0])}>>',
+                           zlib.compress(bytes(data), 9))
+        self._write(f'startxref\n{self.xref_offset}\n%%EOF\n'.encode('latin-1'))
+
+    def _flush_page(self, page):
+        self.pages_count += 1
+        assert page == self.pages_count, f'Pages must be written in order: {page} != {self.pages_count}'
+        annots = ' '.join(self._link_annot(*link) for link in self.links_per_page.pop(page, ()))
+        contents = self._page_contents(page)
+        digest = hashlib.blake2b(contents, digest_size=16).digest()
+        contents_obj_num = self._contents_obj_nums.get(digest)
+        if not contents_obj_num:
+            contents_obj_num = self._contents_obj_nums[digest] = self._new_contents_obj_num(page)
+            self._write_contents(contents_obj_num, '', contents)
+            self.form_names.update(name.decode() for name in FORM_DO_REGEX.findall(contents))
+        self._write_obj(_page_obj_num(page), f'<</Type /Page /Parent 1 0 R /Resources 2 0 R /Contents {contents_obj_num} 0 R'
+                                             + (f' /Annots [{annots}]' if annots else '') + '>>')
+        del self.instance.pages[page]
+
+    def _page_contents(self, page):
+        return compact_content_stream(bytes(page_contents(self.instance, page)))
+
+    def _new_contents_obj_num(self, page):
+        return _page_obj_num(page) + 1
+
+    def _form_contents(self, name):
+        page_contents(self.instance, self.instance.page).clear()
+        draw_form(self.instance, name)
+        return self._page_contents(self.instance.page)
+
+    def _link_annot(self, x, y, w, h, link, alt_text):
+        k, h_pt = self.instance.k, self.instance.h_pt
+        annot = f'<</Type /Annot /Subtype /Link /Rect [{_num(x*k)} {_num(h_pt - (y + h)*k)} {_num((x + w)*k)} {_num(h_pt - y*k)}] /Border [0 0 0]'
+        link_type, target = self.link_target(link)
+        if link_type == 'url':
+            annot += f' /A <</S /URI /URI {_pdf_string(target)}>>'
+        elif link_type == 'page':
+            annot += f' /Dest [{_page_obj_num(target)} 0 R /XYZ 0 {_num(h_pt)} null]'
+            self._page_per_link.pop(link, None)  # links are created for every usage, this keeps memory usage bounded
+        else:
+            annot += f' /Dest /L{-target}'
+            self.named_dests_links.add(target)
+        if alt_text and self.link_alt_texts:
+            annot += f' /Contents {_pdf_string(alt_text)}'
+        return annot + '>>'
+
+    def _named_dests(self):
+        h_pt = _num(self.instance.h_pt)
+        named_dests = []
+        for link in sorted(self.named_dests_links, reverse=True):
+            page = self._page_per_link.get(link)
+            assert page, f'Link {link} target page has never been set'
+            named_dests.append(f'/L{-link} [{_page_obj_num(page)} 0 R /XYZ 0 {h_pt} null]')
+        return ' '.join(named_dests)
+
+    def _write_image(self, obj_num, info):
+        'Return the last object number used'
+        dict_entries = [f'/Type /XObject /Subtype /Image /Width {info["w"]} /Height {info["h"]}']
+        last_obj_num = obj_num
+        if info['cs'] == 'Indexed':
+            last_obj_num += 1
+            dict_entries.append(f'/ColorSpace [/Indexed /DeviceRGB {len(info["pal"]) // 3 - 1} {last_obj_num} 0 R]')
+        else:
+            dict_entries.append(f'/ColorSpace /{info["cs"]}')
+        dict_entries.append(f'/BitsPerComponent {info["bpc"]}')
+        if info.get('f'):
+            dict_entries.append(f'/Filter /{info["f"]}')
+        if info.get('dp'):
+            decode_parms = info['dp'] if 'BitsPerComponent' in info['dp'] else f'{info["dp"]} /BitsPerComponent {info["bpc"]}'
+            dict_entries.append(f'/DecodeParms <<{decode_parms}>>')
+        if info.get('trns'):
+            dict_entries.append(f'/Mask [{" ".join(f"{value} {value}" for value in info["trns"])}]')
+        smask_obj_num = None
+        if info.get('smask'):
+            smask_obj_num = last_obj_num = last_obj_num + 1
+            dict_entries.append(f'/SMask {smask_obj_num} 0 R')
+        self._write_stream(obj_num, ' '.join(dict_entries), info['data'])
+        if info['cs'] == 'Indexed':
+            self._write_stream(obj_num + 1, '/Filter /FlateDecode', zlib.compress(info['pal']))
+        if smask_obj_num:
+            self._write_stream(smask_obj_num, f'/Type /XObject /Subtype /Image /Width {info["w"]} /Height {info["h"]} '
+                                              f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /{info["f"]} '
+                                              f'/DecodeParms <</Predictor 15 /Colors 1 /BitsPerComponent 8 /Columns {info["w"]}>>',
+                               info['smask'])
+        return last_obj_num
+
+    def _write_obj(self, obj_num, content):
+        if self.object_streams:
+            self._pending_objs.append((obj_num, content.encode('latin-1')))
+            if len(self._pending_objs) == OBJECT_STREAM_SIZE:
+                self._write_obj_stream()
+            return
+        self._offsets[obj_num] = self._file.tell()
+        self._write(f'{obj_num} 0 obj\n{content}\nendobj\n'.encode('latin-1'))
+
+    def _write_obj_stream(self):
+        'Its object number is not known yet: a placeholder of fixed width is written instead, cf. _patch_obj_stream_num'
+        header, body = [], bytearray()
+        for index, (obj_num, content) in enumerate(self._pending_objs):
+            self._compressed_objs[obj_num] = (len(self._obj_stream_offsets), index)
+            header.append(f'{obj_num} {len(body)}')
+            body += content + b'\n'
+        header = ' '.join(header).encode('latin-1') + b'\n'
+        data = zlib.compress(header + body)
+        self._obj_stream_offsets.append(self._file.tell())
+        self._write(f'{0:010} 0 obj\n<</Type /ObjStm /N {len(self._pending_objs)} /First {len(header)} '
+                    f'/Filter /FlateDecode /Length {len(data)}>>\nstream\n'.encode('latin-1'))
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+        self._pending_objs = []
+
+    def _patch_obj_stream_num(self, offset, obj_num):
+        'Leading zeros are valid in PDF integers'
+        self._offsets[obj_num] = offset
+        end_offset = self._file.tell()
+        self._file.seek(offset)
+        self._write(f'{obj_num:010}'.encode('latin-1'))
+        self._file.seek(end_offset)
+
+    def _write_contents(self, obj_num, dict_entries, contents):
+        if self.instance.compress:
+            self._write_stream(obj_num, (dict_entries + ' ' if dict_entries else '') + '/Filter /FlateDecode', zlib.compress(contents))
+        else:
+            self._write_stream(obj_num, dict_entries, contents)
+
+    def _write_stream(self, obj_num, dict_entries, data):
+        self._offsets[obj_num] = self._file.tell()
+        self._write(f'{obj_num} 0 obj\n<<{dict_entries} /Length {len(data)}>>\nstream\n'.encode('latin-1'))
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+
+    def _write(self, data):
+        self._file.write(data)
+
+
+def _page_obj_num(page):
+    return 2 * page + 1
+
+
+def _subsections(obj_nums):
+    'Yield (first object number, count) for every range of consecutive numbers among the sorted obj_nums'
+    start = 0
+    for i in range(1, len(obj_nums) + 1):
+        if i == len(obj_nums) or obj_nums[i] != obj_nums[i - 1] + 1:
+            yield obj_nums[start], i - start
+            start = i
+
+
+def _num(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+def _pdf_string(text):
+    try:
+        text.encode('latin-1')
+    except UnicodeEncodeError:
+        return '<FEFF' + text.encode('utf-16-be').hex().upper() + '>'
+    return '(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', '\\r') + ')'
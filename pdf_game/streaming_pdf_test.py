@@ -0,0 +1,173 @@
+import re, zlib
+from os.path import dirname, join
+
+import fpdf
+import pytest
+
+from . import streaming_pdf
+from .streaming_pdf import StreamingPdfWriter
+
+
+ASSETS_DIR = join(dirname(dirname(__file__)), 'assets')
+ARROW_IMG, COMPASS_IMG = join(ASSETS_DIR, 'arrow-right.png'), join(ASSETS_DIR, 'compass.png')
+
+
+def test_streaming_pdf_xref_pages_tree_and_named_dests(tmp_path):
+    filepath = tmp_path / 'streaming.pdf'
+    _write_pages(StreamingPdfWriter(_new_pdf(), filepath))
+    data = filepath.read_bytes()
+    entries, trailer = _read_xref(data)
+    for obj_num, (entry_type, offset, _) in entries.items():
+        if entry_type == 1:
+            assert data.startswith(b'%d 0 obj\n' % obj_num, offset), f'Wrong offset for object {obj_num}'
+    pages_tree = _get_obj(data, entries, 1)
+    assert b'/Count 4 ' in pages_tree
+    assert re.search(rb'/Kids \[(.*?)\]', pages_tree).group(1) == b'3 0 R 5 0 R 7 0 R 9 0 R'
+    _check_links(data, entries, trailer)
+
+
+def test_object_streams(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming_pdf, 'OBJECT_STREAM_SIZE', 3)  # so that object streams are written while pages are added
+    filepath = tmp_path / 'streaming.pdf'
+    _write_pages(StreamingPdfWriter(_new_pdf(), filepath, object_streams=True))
+    data = filepath.read_bytes()
+    assert data.startswith(b'%PDF-1.5\n')
+    entries, trailer = _read_xref(data)
+    assert b'/Type /XRef' in trailer
+    obj_stream_nums = {field2 for entry_type, field2, _ in entries.values() if entry_type == 2}
+    assert len(obj_stream_nums) > 1
+    assert b'0000000000 0 obj' not in data  # placeholders are patched on close
+    for obj_stream_num in obj_stream_nums:
+        assert data.startswith(b'%010d 0 obj\n' % obj_stream_num, entries[obj_stream_num][1])
+    _check_xref_entries(data, entries)
+    assert all(entries[obj_num][0] == 2 for obj_num in (1, 2, 3, 5, 7, 9, _ref(trailer, b'Root')))
+    assert b'/Count 4 ' in _get_obj(data, entries, 1)
+    _check_links(data, entries, trailer)
+
+
+@pytest.mark.parametrize('object_streams', (False, True))
+def test_deduplicated_contents_objects_numbers_are_linked_as_free(tmp_path, object_streams):
+    filepath = tmp_path / 'streaming.pdf'
+    _write_pages(StreamingPdfWriter(_new_pdf(), filepath, object_streams=object_streams))
+    data = filepath.read_bytes()
+    entries, trailer = _read_xref(data)
+    assert sorted(entries) == list(range(int(re.search(rb'/Size (\d+)', trailer).group(1))))
+    assert _ref(_get_obj(data, entries, 7), b'Contents') == 6  # the 3rd page shares the content stream of the 2nd one
+    free_obj_nums, obj_num = [], entries[0][1]
+    while obj_num:
+        assert entries[obj_num][0] == 0, f'Object {obj_num} is not free'
+        free_obj_nums.append(obj_num)
+        obj_num = entries[obj_num][1]
+    assert 8 in free_obj_nums
+    assert free_obj_nums == [obj_num for obj_num, (entry_type, _, _) in sorted(entries.items()) if obj_num and entry_type == 0]
+
+
+def _write_pages(pdf):
+    'Write 4 pages: the 3rd one is identical to the 2nd, and the 1st one links to the 4th, before it is set'
+    third_page_link, last_page_link = pdf.add_link(), pdf.add_link()
+    pdf.set_link(third_page_link, page=3)
+    pdf.add_page()
+    pdf.image(ARROW_IMG, x=0, y=0, link=third_page_link, alt_text='Next')
+    pdf.link(0, 100, 40, 20, last_page_link)
+    for _ in range(2):
+        pdf.add_page()
+        pdf.image(COMPASS_IMG, x=10, y=10)
+    pdf.add_page()
+    pdf.set_link(last_page_link, page=pdf.page)
+    pdf.image(ARROW_IMG, x=50, y=50, link='https://example.org')
+    pdf.close()
+
+
+def _check_links(data, entries, trailer):
+    first_page = _get_obj(data, entries, 3)
+    assert b'/Dest [7 0 R ' in first_page  # the target page of this link was set before this page was written
+    named_dests = dict(re.findall(rb'/(L\d+) \[(\d+) 0 R ', _get_obj(data, entries, _ref(trailer, b'Root'))))
+    links_names = re.findall(rb'/Dest /(L\d+)', first_page)
+    assert links_names
+    assert named_dests == {name: b'9' for name in links_names}
+
+
+def _check_xref_entries(data, entries):
+    'Offsets must land on objects headers, and compressed objects must be found at their index in their object stream'
+    for obj_num, (entry_type, field2, _) in entries.items():
+        if entry_type == 1:
+            assert re.compile(rb'0*%d 0 obj\n' % obj_num).match(data, field2), f'Wrong offset for object {obj_num}'
+        elif entry_type == 2:
+            _get_obj(data, entries, obj_num)
+
+
+def _read_xref(data):
+    'Return the entries of all the xref sections, as {object number: (type, field 2, field 3)}, and the last trailer'
+    entries, trailers = {}, []
+    offset = int(re.findall(rb'startxref\n(\d+)\n%%EOF', data)[-1])
+    while offset is not None:  # from the last section to the first one, following /Prev
+        section_entries, trailer = (_xref_table if data.startswith(b'xref\n', offset) else _xref_stream)(data, offset)
+        for obj_num, entry in section_entries.items():
+            entries.setdefault(obj_num, entry)
+        trailers.append(trailer)
+        prev = re.search(rb'/Prev (\d+)', trailer)
+        offset = prev and int(prev.group(1))
+    return entries, trailers[0]
+
+
+def _xref_table(data, offset):
+    assert data.startswith(b'xref\n', offset)
+    section, trailer = data[offset + len(b'xref\n'):].split(b'trailer\n', 1)
+    entries, lines = {}, section.splitlines()
+    while lines:
+        start, count = map(int, lines[0].split())
+        for obj_num, line in enumerate(lines[1:count + 1], start=start):
+            field2, field3, entry_type = line.split()
+            entries[obj_num] = (1 if entry_type == b'n' else 0, int(field2), int(field3))
+        lines = lines[count + 1:]
+    return entries, trailer.split(b'\nstartxref\n')[0]
+
+
+def _xref_stream(data, offset):
+    'Rows are encoded with the PNG Up predictor: every byte is stored as its difference with the one above it'
+    obj_dict, stream = _get_stream(data, offset)
+    assert b'/Type /XRef' in obj_dict
+    widths = [int(width) for width in re.search(rb'/W \[(\d+) (\d+) (\d+)\]', obj_dict).groups()]
+    index = [int(value) for value in re.search(rb'/Index \[([\d ]+)\]', obj_dict).group(1).split()]
+    obj_nums = [obj_num for start, count in zip(index[::2], index[1::2]) for obj_num in range(start, start + count)]
+    encoded_rows, columns = zlib.decompress(stream), sum(widths)
+    assert len(encoded_rows) == len(obj_nums) * (columns + 1)
+    entries, row = {}, bytes(columns)
+    for obj_num, start in zip(obj_nums, range(0, len(encoded_rows), columns + 1)):
+        assert encoded_rows[start] == 2, 'PNG Up filter type expected'
+        row = bytes((byte + byte_above) & 0xFF for byte, byte_above in zip(encoded_rows[start + 1:start + 1 + columns], row))
+        fields = (row[:widths[0]], row[widths[0]:widths[0] + widths[1]], row[widths[0] + widths[1]:])
+        entries[obj_num] = tuple(int.from_bytes(field, 'big') for field in fields)
+    return entries, obj_dict
+
+
+def _get_obj(data, entries, obj_num):
+    'Return the content of a non-stream object'
+    entry_type, field2, field3 = entries[obj_num]
+    if entry_type == 2:  # field2 is the object number of the object stream containing it, field3 its index in it
+        obj_dict, stream = _get_stream(data, entries[field2][1])
+        assert b'/Type /ObjStm' in obj_dict
+        first = int(re.search(rb'/First (\d+)', obj_dict).group(1))
+        content = zlib.decompress(stream)
+        header = [int(value) for value in content[:first].split()]
+        assert len(header) == 2 * int(re.search(rb'/N (\d+)', obj_dict).group(1))
+        assert header[2 * field3] == obj_num, f'Object {obj_num} is not at index {field3} of object stream {field2}'
+        offsets = header[1::2] + [len(content) - first]
+        return content[first + offsets[field3]:first + offsets[field3 + 1]].rstrip(b'\n')
+    assert entry_type == 1, f'Object {obj_num} is not in use'
+    start = re.compile(rb'0*%d 0 obj\n' % obj_num).match(data, field2).end()
+    return data[start:data.index(b'\nendobj\n', start)]
+
+
+def _get_stream(data, offset):
+    'Return the dictionary & the raw data of the stream object at offset'
+    match = re.compile(rb'0*\d+ 0 obj\n<<(.*?) /Length (\d+)>>\nstream\n', re.DOTALL).match(data, offset)
+    return match.group(1), data[match.end():match.end() + int(match.group(2))]
+
+
+def _ref(obj, key):
+    return int(re.search(rb'/%s (\d+) 0 R' % key, obj).group(1))
+
+
+def _new_pdf():
+    return fpdf.FPDF(format=[160, 120], unit='pt')
@@ -6,14 +6,18 @@ from textwrap import indent
 
 from .ascii import map_as_string
 from .assigner import assign_page_ids
+from .cache import load_explored_views, save_explored_views
 from .deadends import detect_deadends
 from .explore import disable_burn_and_push
-from .entities import CutScene, GameMilestone, GameMode, GameState, GameView
+from .entities import clear_interned_values, CutScene, GameMilestone, GameMode, GameState, GameView
 from .js import avatar
 from .logs import log, log_victorious_combats, log_paths_diff, diff_game_states
 from .mapscript import mapscript_exec
+from .parallel import iterate_segments_in_parallel
+from .memory_report import memory_checkpoint
 from .perfs import trace_time
 from .reducer import reduce_views
+from .serializer import register_callables
 
 # pylint: disable=unused-import
 from .combat import combat_logic
@@ -74,7 +78,65 @@ def visit_game_views(args):
 
     initial_view = GameView(initial_state, src_view=None)
     secret_ending_view = GameView(GameState(fixed_id=SECRET_ENDING_ID), renderer=render_secret_ending)
-    game_view_per_state = {initial_state: initial_view}
+
+    register_callables()  # required to serialize GameViews
+    explored = None if args.no_cache else load_explored_views(args)
+    if explored:
+        start_view, game_views = explored
+    else:
+        start_view, game_views = explore_game_views(args, start_at_checkpoint, initial_view, secret_ending_view)
+        check_no_duplicate(game_views)
+        if not args.no_cache:
+            with trace_time('save_explored_views'):
+                save_explored_views(args, start_view, game_views)
+    clear_interned_values()
+    memory_checkpoint('explore')
+
+    if args.detect_deadends:
+        with trace_time('detect_deadends'):
+            detect_deadends(game_views)
+            sys.exit(0)
+
+    if not args.no_reducer:
+        with trace_time('reduce'):
+            game_views = reduce_views(game_views, args.print_reduced_views)
+        memory_checkpoint('reduce')
+
+    with trace_time('assign'):
+        game_views = assign_page_ids(game_views, seed=args.seed)
+    memory_checkpoint('assign')
+    assert start_view.page_id
+
+    for game_view in game_views:
+        game_state = game_view.state
+        if game_state and game_state.milestone in (GameMilestone.CHECKPOINT, GameMilestone.VICTORY):
+            checkpoint = next(cp for i, cp in enumerate(CHECKPOINTS, start=1)
+                              if i == game_state.last_checkpoint)
+            print(f'Page ID for checkpoint {game_state.last_checkpoint}: {game_view.page_id} ({game_state.facing}/{"+".join(game_state.secrets_found)}): {checkpoint.description}')
+            if game_state.milestone == GameMilestone.VICTORY:
+                depth = 1
+                while game_view.src_view:
+                    depth += 1
+                    game_view = game_view.src_view
+                print(f'(depth / #states from start: {depth})')
+
+    scene_game_states = {}
+    for game_view in game_views:
+        game_state = game_view.state
+        # Excluding actual shops (ID <= 4):
+        if game_state and game_state.shop_id > 4 and game_view.src_view and game_view.src_view.state.shop_id == -1:
+            scene = CutScene.from_id(game_state.shop_id)
+            print(f'ID for scene {game_state.shop_id} first page: {game_view.page_id} ({game_state.facing}/{"+".join(game_state.secrets_found)}) {scene.name}')
+            existing_gs = scene_game_states.get((game_state.facing, game_state.secrets_found))
+            if existing_gs:
+                # print('Diff with other GameState leading to this scene:')
+                print(indent(existing_gs.differing(game_state), '  '), end='')
+            scene_game_states[(game_state.facing, game_state.secrets_found)] = game_state
+
+    return start_view, game_views
+
+
+def game_view_factory(game_view_per_state):
     def _GameView(state, src_view):  # get existing view for given state or build one
         new_gv = game_view_per_state.get(state)
         if not new_gv:
@@ -94,11 +156,18 @@ def visit_game_views(args):
                         new_gv = existing_gv_for_state
             game_view_per_state[new_gv.state] = new_gv
         return new_gv
+    return _GameView
+
 
-    with trace_time('visit:iterate_game_views'):
+def explore_game_views(args, start_at_checkpoint, initial_view, secret_ending_view):
+    game_view_per_state = {initial_view.state: initial_view}
+    with trace_time('explore'):
         start_view, initial_views, game_views = None, [initial_view], [initial_view, secret_ending_view]
-        for i, checkpoint in enumerate(CHECKPOINTS):
-            game_views_until_checkpoint, checkpoint_game_views = iterate_game_views(checkpoint, i + 1, initial_views, _GameView)
+        if args.jobs > 1:
+            segments = iterate_segments_in_parallel(len(CHECKPOINTS), initial_views, game_view_per_state, explore_segment, args.jobs)
+        else:
+            segments = iterate_segments(initial_views, game_view_per_state)
+        for i, (game_views_until_checkpoint, checkpoint_game_views) in enumerate(segments):
             if not start_at_checkpoint or i + 1 >= start_at_checkpoint:
                 game_views.extend(game_views_until_checkpoint)
                 if not start_view:
@@ -118,59 +187,30 @@ def visit_game_views(args):
                 if checkpoint_game_views[0].src_view.state.mode == GameMode.COMBAT:
                     print('Combat choices leading to victory:')
                     log_victorious_combats(checkpoint_game_views[0].src_view)
-                initial_views = checkpoint_game_views
             else:
                 break
         # pylint: disable=undefined-loop-variable
         assert start_view, f'No start view found: maybe due to an invalid --start-at-checkpoint ({start_at_checkpoint}) ? #checkpoints={len(CHECKPOINTS)} last-#GameViews={len(game_views_until_checkpoint)} last-i={i}'
         print(f'{len(game_views)} views have been iterated')
+    return start_view, game_views
 
-    check_no_duplicate(game_views)
-
-    if args.detect_deadends:
-        with trace_time('visit:detect_deadends'):
-            detect_deadends(game_views)
-            sys.exit(0)
-
-    if not args.no_reducer:
-        with trace_time('visit:reduce_views'):
-            game_views = reduce_views(game_views, args.print_reduced_views)
-
-    with trace_time('visit:assign_page_ids'):
-        game_views = assign_page_ids(game_views)
-    assert start_view.page_id
 
-    for game_view in game_views:
-        game_state = game_view.state
-        if game_state and game_state.milestone in (GameMilestone.CHECKPOINT, GameMilestone.VICTORY):
-            checkpoint = next(cp for i, cp in enumerate(CHECKPOINTS, start=1)
-                              if i == game_state.last_checkpoint)
-            print(f'Page ID for checkpoint {game_state.last_checkpoint}: {game_view.page_id} ({game_state.facing}/{"+".join(game_state.secrets_found)}): {checkpoint.description}')
-            if game_state.milestone == GameMilestone.VICTORY:
-                depth = 1
-                while game_view.src_view:
-                    depth += 1
-                    game_view = game_view.src_view
-                print(f'(depth / #states from start: {depth})')
+def iterate_segments(initial_views, game_view_per_state):
+    'Sequentially yield (game_views, checkpoint_game_views) for every segment inbetween checkpoints'
+    for i in range(len(CHECKPOINTS)):
+        game_views, checkpoint_game_views = explore_segment(i, initial_views, game_view_per_state)
+        yield game_views, checkpoint_game_views
+        initial_views = checkpoint_game_views
 
-    scene_game_states = {}
-    for game_view in game_views:
-        game_state = game_view.state
-        # Excluding actual shops (ID <= 4):
-        if game_state and game_state.shop_id > 4 and game_view.src_view and game_view.src_view.state.shop_id == -1:
-            scene = CutScene.from_id(game_state.shop_id)
-            print(f'ID for scene {game_state.shop_id} first page: {game_view.page_id} ({game_state.facing}/{"+".join(game_state.secrets_found)}) {scene.name}')
-            existing_gs = scene_game_states.get((game_state.facing, game_state.secrets_found))
-            if existing_gs:
-                # print('Diff with other GameState leading to this scene:')
-                print(indent(existing_gs.differing(game_state), '  '), end='')
-            scene_game_states[(game_state.facing, game_state.secrets_found)] = game_state
 
-    return start_view, game_views
+def explore_segment(i, start_views, game_view_per_state):
+    return iterate_game_views(CHECKPOINTS[i], i + 1, start_views, game_view_factory(game_view_per_state))
 
 
 def iterate_game_views(checkpoint, checkpoint_id, start_views, _GameView):
-    game_views, processed, processing = set(), set(), LifoQueue()
+    # game_views is a list, so that its order does not depend on the process hash seed:
+    # page IDs are assigned by shuffling it with a seeded random generator.
+    game_views, processed, processing = [], set(), LifoQueue()
     for start_view in start_views:
         processing.put(start_view)
         processed.add(hash(start_view))
@@ -203,7 +243,7 @@ def iterate_game_views(checkpoint, checkpoint_id, start_views, _GameView):
                     else:
                         checkpoint_game_views = [new_game_view]
             if hash(new_game_view) not in processed:
-                game_views.add(new_game_view)
+                game_views.append(new_game_view)
                 processed.add(hash(new_game_view))  # we need a separate set of GS hashes, as "new_game_view not in game_views" would uses "id(new_game_view)"
                 milestone = new_game_view.state.milestone
                 if milestone == GameMilestone.GAME_OVER:
@@ -219,7 +259,7 @@ def iterate_game_views(checkpoint, checkpoint_id, start_views, _GameView):
                             should_render_post_defeat = bool(post_defeat)
                         if should_render_post_defeat and not hasattr(post_defeat, 'game_view'):
                             post_defeat.game_view = GameView(src_view=new_game_view, renderer=post_defeat)
-                            game_views.add(post_defeat.game_view)
+                            game_views.append(post_defeat.game_view)
                             processed.add(hash(post_defeat.game_view))
                     if new_game_view.state.rolling_boulder:
                         log_msg += f' - crushed-by-boulder@{new_game_view.state.coords}/{new_game_view.state.facing}'
@@ -1,10 +1,12 @@
 from collections import defaultdict
 
 from .entities import TileEdge, WarpPortal
-from .mazemap import DX_DY_PER_FACING_AND_RENDER_POS
+from .js import atlas
+from .mazemap import mazemap_bounds_check, DX_DY_PER_FACING_AND_RENDER_POS
 
 
 WARP_PORTALS_PER_MAP = defaultdict(list)
+_VIEW_FRUSTUM_PER_POS = {}  # (map_id, x, y, facing) -> 13 source tile positions
 
 
 def warp_portal_teleport(prev_coords, new_pos):
@@ -37,6 +39,7 @@ def warp_portal_add(map_id, pos1, facing1, pos2, facing2):
     edge2 = TileEdge.new(pos2, facing2)
     assert edge1.facing == edge2.facing, 'Orthogonal warp portals are not supported!'
     WARP_PORTALS_PER_MAP[map_id].append(WarpPortal.new(edge1, edge2))
+    _VIEW_FRUSTUM_PER_POS.clear()
 
 
 def warp_portal_in_sight(map_id, pos, facing, render_pos=4):
@@ -48,6 +51,31 @@ def warp_portal_in_sight(map_id, pos, facing, render_pos=4):
     return None
 
 
+def warp_portal_view_frustum(map_id, x, y, facing):
+    '''
+    Return the (x, y) positions of the tiles to draw for the 13 render_pos in sight, in drawing order,
+    with warp portals translation applied, or None for the ones out of the map bounds.
+    This is memoized, as it only changes when warp portals are added.
+    '''
+    key = (map_id, x, y, facing)
+    view_frustum = _VIEW_FRUSTUM_PER_POS.get(key)
+    if view_frustum is None:
+        view_frustum = _VIEW_FRUSTUM_PER_POS[key] = tuple(_view_frustum(map_id, x, y, facing))
+    return view_frustum
+
+
+def _view_frustum(map_id, x, y, facing):
+    _map = atlas().maps[map_id]
+    for render_pos, (dx, dy) in enumerate(DX_DY_PER_FACING_AND_RENDER_POS[facing]):
+        src_x, src_y = x, y
+        portal_in_sight = warp_portal_in_sight(map_id, (x, y), facing, render_pos)
+        if portal_in_sight:
+            warp_portal, edge = portal_in_sight
+            src_x, src_y = warp_portal.translate(edge, x, y)
+        src_x, src_y = src_x + dx, src_y + dy
+        yield (src_x, src_y) if mazemap_bounds_check(_map, src_x, src_y) else None
+
+
 def _edges_in_sight(pos, facing, render_pos):
     x, y = pos
     dx_dy_per_render_pos = DX_DY_PER_FACING_AND_RENDER_POS[facing]
@@ -88,3 +116,4 @@ _RENDER_POS_EDGES_IN_SIGHT = (
 def warp_portal_remove_all():
     global WARP_PORTALS_PER_MAP
     WARP_PORTALS_PER_MAP = defaultdict(list)
+    _VIEW_FRUSTUM_PER_POS.clear()
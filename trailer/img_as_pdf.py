@@ -20,7 +20,7 @@ class ImageAsPdf:
     def set_link(self, link, page=-1): pass
     def link(self, x, y, w, h, link, alt_text=''): pass
 
-    # pylint: disable=unused-argument
+    # pylint: disable=unused-argument
     def image(self, image, *args, **kwargs):
         if isinstance(image, str):
             with Image.open(image) as img_added:
@@ -47,8 +47,9 @@ class ImageAsPdf:
             rc_width, rc_height = map(int, (rc_width, rc_height))  # .resize box arg must be an int tuple
             img_added = img_added.crop((crop_x, crop_y, crop_x + rc_width / scale, crop_y + rc_height / scale))\
                                  .resize((rc_width, rc_height), resample=Image.NEAREST)
-        else:
-            assert not (w or h), 'Not implemented yet'
+        elif w or h:  # e.g. pdf_game.render_utils.sprite_render
+            width, height = w or img_added.width * h / img_added.height, h or img_added.height * w / img_added.width
+            img_added = img_added.resize((round(width), round(height)), resample=Image.NEAREST)
         x, y = map(int, (x, y))  # .paste box arg must be an int tuple
         if img_added.mode == 'P':
             img_added = img_added.convert('RGBA')
@@ -23,7 +23,7 @@ def main():
     pdf = ImageAsPdf(FPDF(), img)
     for render_pos in range(13):
         tile_id = randrange(1, len(TILES))
-        # Replicating mazemap_render_tile:
+        # Replicating _mazemap_tile_layers:
         tile = TILES[tile_id]
         img_filepath = (REL_RELEASE_DIR + f'images/tiles/{tile}.png') if tile_id < 20 else f'assets/tiles/{tile}.png'
         if tile_id == 16: img_filepath = 'assets/tiles/skull_pile2.png'